@@ -3,24 +3,39 @@
 
 import streamlit as st
 from db import *
+import db_async
 from form_utils import *
+from form_fields import get_render_plan, process_submission, render_form
+from form_import import detect_format, import_stream
+from llm_jobs import FAILED, get_job, submit_enhancement
+import blob_store
+import submission_buffer
+from form_export import (
+    EXPORT_FORMATS, arrow_available, export_arrow_to_tempfile, export_to_tempfile,
+    get_export_columns, get_heavy_columns
+)
+import io
 import json
 import os
+import tempfile
+import time
 import pandas as pd
 import re
 import datetime
+import uuid
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 from typing import List, Dict
-import hashlib
 from dotenv import load_dotenv
 load_dotenv()
 # Initialize session state
 if 'user' not in st.session_state:
     st.session_state.user = None
 
-initialize_default_users()
-# Initialize database
-initialize_database()
+# Apply pending schema migrations (runs once per server process)
+run_migrations()
+# Replay journaled submissions left from a previous run (write-behind mode)
+if SUBMISSION_WRITE_BEHIND:
+    submission_buffer.start()
 # query_params = st.experimental_get_query_params()
 
 if 'token' in st.query_params:
@@ -55,6 +70,61 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
         }
     return None
 
+def queue_session_cookie(token: Optional[str]):
+    """Set (or, with None, clear) the login cookie on the next page render."""
+    st.session_state.pending_session_cookie = token or ""
+
+def flush_session_cookie():
+    """Write a queued login cookie into the browser (Streamlit cannot set cookies itself)."""
+    token = st.session_state.pop("pending_session_cookie", None)
+    if token is None:
+        return
+    max_age = SESSION_TTL if token else 0
+    secure = "; Secure" if SESSION_COOKIE_SECURE else ""
+    st.components.v1.html(
+        f"<script>window.parent.document.cookie = "
+        f"'{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Lax{secure}';</script>",
+        height=0
+    )
+
+def login_user(user: Dict):
+    """Keep the authenticated user in this session and start a server-side login session."""
+    st.session_state.user = user
+    token = create_user_session(user["id"])
+    if token:
+        st.session_state.session_token = token
+        queue_session_cookie(token)
+
+def restore_login_session():
+    """Log the browser back in from its session token (?session= or the cookie), without a password hash."""
+    if st.session_state.user:
+        return
+    from_url = st.query_params.get("session")
+    cookies = getattr(getattr(st, "context", None), "cookies", None) or {}
+    token = from_url or cookies.get(SESSION_COOKIE)
+    if not token:
+        return
+    user = resolve_user_session(token)
+    if from_url:
+        # Keep the token out of the address bar (and out of shared links)
+        del st.query_params["session"]
+    if not user:
+        if cookies.get(SESSION_COOKIE) == token:
+            queue_session_cookie(None)
+        return
+    user["permissions"] = ROLES.get(user["role"], [])
+    st.session_state.user = user
+    st.session_state.session_token = token
+    if from_url:
+        queue_session_cookie(token)
+
+def logout_user():
+    token = st.session_state.pop("session_token", None)
+    if token:
+        revoke_user_session(token)
+    queue_session_cookie(None)
+    st.session_state.user = None
+
 def check_access(required_permission: str):
     """Skip auth check for auth page"""
     if st.session_state.page == "Authentication":
@@ -95,7 +165,7 @@ def display_share_options(form_name: str):
             st.error("Failed to create share link.")
 
     if current_token:
-        base_url = os.getenv("BASE_URL", "http://localhost:8501")
+        base_url = get_share_base_url()
         share_url = f"{base_url}?token={current_token}"
         st.success("This form is shareable! Copy the link or embed code below.")
         
@@ -112,6 +182,214 @@ def display_share_options(form_name: str):
                 st.rerun()
             else:
                 st.error("Failed to revoke access.")
+
+ADMIN_PAGE_SIZES = [50, 100, 250, 500]
+
+def reset_admin_paging(tab: Dict):
+    """Forget the page cursors of an Admin View tab so the next load starts at page one."""
+    discard_admin_export(tab)
+    tab["page_cursors"] = [None]
+    tab["page_index"] = 0
+    tab["next_after_id"] = None
+    tab["data"] = None
+
+def load_admin_page(tab: Dict):
+    """
+    Load the current page of an Admin View tab into tab["data"].
+
+    tab["page_cursors"] holds the after_id that starts each page visited so far,
+    so Prev simply steps back through the stack and Next pushes the cursor
+    returned by the previous load.
+    """
+    if "page_cursors" not in tab:
+        reset_admin_paging(tab)
+    page = get_form_data_page(
+        tab["form_name"],
+        after_id=tab["page_cursors"][tab["page_index"]],
+        limit=tab.get("page_size", ADMIN_PAGE_SIZES[1]),
+        order=tab.get("page_order", "id"),
+        descending=tab.get("page_descending", False),
+        filters=tab.get("filters"),
+    )
+    tab["data"] = page["rows"]
+    tab["next_after_id"] = page["next_after_id"] if page["has_more"] else None
+
+def discard_admin_export(tab: Dict):
+    """Remove the temp file of a previous CSV export of an Admin View tab."""
+    export = tab.pop("export", None)
+    if export and os.path.exists(export["path"]):
+        os.remove(export["path"])
+
+def related_result(related: Dict, key: str, label: str) -> List:
+    """Rows fetched by db_async.call_many() for `key`, showing an error instead if that load failed."""
+    result = related.get(key)
+    if isinstance(result, Exception):
+        st.error(f"Error loading {label} records: {str(result)}")
+        return []
+    return result or []
+
+def render_admin_filters(tab: Dict, key_prefix: str) -> Dict:
+    """
+    Draw one filter widget per filterable field of the tab's form and return
+    the selections that actually narrow the data, keyed by column name.
+
+    Choices and bounds come from get_filter_domains(), computed once per load
+    and kept in tab["filter_domains"].
+    """
+    specs = tab.get("filter_specs") or []
+    domains = tab.get("filter_domains") or {}
+    selections = {}
+    if not specs:
+        return selections
+
+    filter_cols = st.columns(4)
+    for i, spec in enumerate(specs):
+        column, label, kind = spec["column"], spec["label"], spec["kind"]
+        domain = domains.get(column, {})
+        container = filter_cols[i % 4]
+        key = f"{key_prefix}_filter_{column}"
+
+        if kind in ("in", "overlap"):
+            values = domain.get("values") or []
+            if values:
+                chosen = container.multiselect(label, values, key=key)
+                if chosen:
+                    selections[column] = chosen
+        elif kind == "prefix":
+            prefix = container.text_input(f"{label} starts with", key=key)
+            if prefix:
+                selections[column] = prefix
+        elif kind == "range":
+            low, high = domain.get("min"), domain.get("max")
+            if low is None or high is None or low == high:
+                continue
+            if spec["type"] in ("DATE", "DATETIME"):
+                low_date = low.date() if isinstance(low, datetime.datetime) else low
+                high_date = high.date() if isinstance(high, datetime.datetime) else high
+                picked = container.date_input(label, value=(low_date, high_date),
+                                              min_value=low_date, max_value=high_date, key=key)
+                if isinstance(picked, (list, tuple)) and len(picked) == 2 and tuple(picked) != (low_date, high_date):
+                    start, end = picked
+                    if spec["type"] == "DATETIME":
+                        start = datetime.datetime.combine(start, datetime.time.min)
+                        end = datetime.datetime.combine(end, datetime.time.max)
+                    selections[column] = (start, end)
+            else:
+                picked = container.slider(label, min_value=low, max_value=high,
+                                          value=(low, high), key=key)
+                if tuple(picked) != (low, high):
+                    selections[column] = tuple(picked)
+    return selections
+
+def start_enhancement(form_name: str, fields: List[Dict]):
+    """Queue an AI enhancement of the form; show_enhancement_job() follows it."""
+    st.session_state.setdefault("enhance_jobs", {})[form_name] = submit_enhancement(form_name, list(fields))
+
+@st.fragment(run_every=1)
+def poll_enhancement_job(form_name: str, job_id: str):
+    """Re-runs on its own every second until the job finishes, then reruns the page once."""
+    job = get_job(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    waited = int(time.time() - job.submitted_at)
+    partial = renderable_prefix(job.partial)
+    if not partial:
+        st.info(f"AI enhancement of '{form_name}' is {job.status} ({waited}s). "
+                "You can keep working; the preview appears here as it is generated.")
+        return
+    st.info(f"Generating the enhanced form... ({waited}s)")
+    st.components.v1.html(sandboxed_html(partial), height=500)
+
+def show_enhancement_job(form_name: str):
+    """Status of the form's enhancement job, saving and previewing the result once done."""
+    job_id = st.session_state.get("enhance_jobs", {}).get(form_name)
+    if not job_id:
+        return
+    job = get_job(job_id)
+    if job is None:
+        st.warning("The AI enhancement result has expired. Start it again to regenerate it.")
+        st.session_state.enhance_jobs.pop(form_name, None)
+        return
+    if not job.finished:
+        poll_enhancement_job(form_name, job_id)
+        return
+    if job.status == FAILED:
+        st.error(f"AI enhancement failed: {job.error}")
+        return
+    saved = st.session_state.setdefault("enhance_saved", set())
+    if job_id not in saved:
+        save_form_html(form_name, job.result)
+        saved.add(job_id)
+    if job.fallback:
+        st.warning("The AI model did not respond in time, so the standard form was kept.")
+    else:
+        st.success("AI enhancement complete!" + (" (cached result)" if job.cached else ""))
+    st.subheader("Enhanced Form Preview")
+    st.components.v1.html(sandboxed_html(job.result), height=500)
+
+def format_file_ref(ref) -> str:
+    """Grid text for a stored file: its name and size."""
+    if not blob_store.is_blob_ref(ref):
+        return ""
+    size = float(ref["size"])
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    size_text = f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+    return f"{ref.get('filename', '')} ({size_text})"
+
+def show_file_columns(df: pd.DataFrame, form_name: str) -> tuple[Dict, Dict]:
+    """
+    Replace the form's FILE columns in the grid with file names. With a share
+    server and a shared SESSION_SECRET configured, each file also gets a
+    signed download link column; otherwise show_file_downloads() offers them.
+    Returns (column_config for the link columns, {column: {record id: file reference}}).
+    """
+    column_config, file_refs = {}, {}
+    share_server_url = os.getenv("SHARE_SERVER_URL") if session_secret_configured() else None
+    for column in get_render_plan(get_form_fields(form_name) or []).schema.file_columns:
+        if column not in df.columns:
+            continue
+        refs = df[column].tolist()
+        df[column] = [format_file_ref(ref) for ref in refs]
+        if share_server_url:
+            link_column = f"{column} (download)"
+            df[link_column] = [
+                file_download_url(ref, share_server_url) if blob_store.is_blob_ref(ref) else None
+                for ref in refs
+            ]
+            column_config[link_column] = st.column_config.LinkColumn(display_text="Download")
+        if "id" in df.columns:
+            file_refs[column] = {
+                record_id: ref for record_id, ref in zip(df["id"].tolist(), refs) if blob_store.is_blob_ref(ref)
+            }
+    return column_config, file_refs
+
+def show_file_downloads(file_refs: Dict, key: str):
+    """A download button per FILE column, reading only the file that was picked."""
+    for column, refs in file_refs.items():
+        if not refs:
+            continue
+        record_id = st.selectbox(
+            f"Download {column} from record",
+            [None] + list(refs),
+            format_func=lambda i: "Choose a record" if i is None else f"ID {i}: {format_file_ref(refs[i])}",
+            key=f"file_pick_{key}_{column}"
+        )
+        if record_id is None:
+            continue
+        ref = refs[record_id]
+        try:
+            st.download_button(
+                f"Download {ref.get('filename') or column}",
+                data=blob_store.read_blob(ref["sha256"]),
+                file_name=ref.get("filename") or ref["sha256"],
+                mime=ref.get("mime_type") or blob_store.DEFAULT_MIME_TYPE,
+                key=f"file_download_{key}_{column}"
+            )
+        except (OSError, ValueError):
+            st.error("This file is no longer available in the blob store.")
 # Page navigation
 pages = {
     "Authentication": "auth",
@@ -120,8 +398,12 @@ pages = {
     "Form Filling": "fill",
     "Update Forms": "update_form" ,
     "Admin View": "admin",
+    "Data Import": "import",
     "User Management": "users"
 }
+# Resume a login session from the cookie or ?session=, then write any pending cookie
+restore_login_session()
+flush_session_cookie()
 # Navigation sidebar
 st.sidebar.title("Navigation")
 
@@ -137,7 +419,7 @@ else:
     st.session_state.page = "Authentication"
 if st.session_state.user:
     if st.sidebar.button("Logout",key="logout_button"):
-        st.session_state.user = None
+        logout_user()
         st.rerun()
     st.sidebar.write(f"Logged in as: {st.session_state.user['username']} ({st.session_state.user['role']})")
 # Password protection
@@ -157,7 +439,7 @@ if st.session_state.page == "Authentication":
     if st.session_state.user:
         st.warning("You are already logged in")
         if st.button("Logout"):
-            st.session_state.user = None
+            logout_user()
             st.rerun()
         st.stop()
     
@@ -172,13 +454,14 @@ if st.session_state.page == "Authentication":
             if st.form_submit_button("Login"):
                 user = authenticate_user(username, password)
                 if user:
-                    st.session_state.user = user
+                    login_user(user)
                     # Redirect based on role
                 
                     if user["role"] == "viewer":
                         st.session_state.page = "fill"
                     st.success("Login successful! Redirecting...")
-                    # st.rerun()
+                    # Rerun so the login cookie is written now, not on the next click
+                    st.rerun()
                 else:
                     st.error("Invalid credentials")
     
@@ -245,7 +528,7 @@ elif st.session_state.page == "Form Creation":
     form_name = st.text_input("Form Name", 
         value=st.session_state.get('form_name', ''),
         key="form_name")
-    existing_forms = [f for f in get_all_forms() if f != form_name and form_name not in get_child_forms(f)]
+    existing_forms = [f for f in accessible_forms(st.session_state.user, FORM_VIEW) if f != form_name and form_name not in get_child_forms(f)]
     if existing_forms:
         parent_form = st.selectbox("Link to Parent Form (optional)", 
             [""] + existing_forms)
@@ -393,34 +676,22 @@ elif st.session_state.page == "Form Creation":
                     
                 st.success("Form generated successfully!")
                 st.subheader("Form Preview")
-                st.components.v1.html(html_content, height=500, scrolling=True)
+                st.components.v1.html(sandboxed_html(html_content), height=500)
                 st.session_state.form_submitted_successfully = True
-            
-                # Provide an OPTIONAL button to enhance with LLM
-                st.info("The form is ready to use. You can optionally use the LLM to try and improve the styling.")
-                if st.button("✨ Enhance with AI (may be slow)"):
-                    with st.spinner(f"Sending '{form_name}' to the AI for enhancement... This may take a moment."):
-                        
-                        # Ensure fields are hashable for caching if you use @lru_cache on generate_form_with_llama
-                        # This is a good practice to prevent potential errors.
-                        try:
-                            fields_tuple = tuple(tuple(d.items()) for d in st.session_state.fields)
-                            enhanced_html = generate_form_with_llama(form_name, fields_tuple)
-                        except Exception as e:
-                            st.error(f"AI enhancement failed: {e}")
-                            enhanced_html = None # Ensure a value is set
-                        if enhanced_html:
-                            save_form_html(form_name, enhanced_html)
-                            st.success("AI enhancement complete!")
-                            st.subheader("Enhanced Form Preview")
-                            st.components.v1.html(enhanced_html, height=500, scrolling=True)
-                
+                st.session_state.last_generated_form = form_name
                 
             except Exception as e:
                 st.error(f"Form generation failed: {str(e)}")
                 # ... (keep your existing error handling) ...
         else:
             st.warning("Please provide a form name and at least one field.")    
+    
+    # Provide an OPTIONAL button to enhance with LLM; it runs in the background
+    if form_name and st.session_state.get("last_generated_form") == form_name:
+        st.info("The form is ready to use. You can optionally use the LLM to try and improve the styling.")
+        if st.button("✨ Enhance with AI (may be slow)"):
+            start_enhancement(form_name, get_form_fields(form_name) or st.session_state.fields)
+        show_enhancement_job(form_name)
     st.divider()
     st.subheader("Share Form")
     
@@ -440,7 +711,7 @@ elif st.session_state.page == "Form Creation":
             st.error("Failed to create share token")
     
     if st.session_state.share_token:
-        base_url = os.getenv("BASE_URL", "http://localhost:8501")
+        base_url = get_share_base_url()
         share_url = f"{base_url}/?token={st.session_state.share_token}"
         st.success("Form is shareable! Copy the link below:")
         st.code(share_url, language="text")
@@ -514,7 +785,7 @@ elif st.session_state.page == "Form Filling":
         tab_data = st.session_state.form_tabs[st.session_state.active_tab]
         
         # Form selection for the active tab
-        forms = get_all_forms()
+        forms = accessible_forms(st.session_state.user, FORM_VIEW)
         form_name = st.selectbox(
             "Select Form", 
             forms,
@@ -566,146 +837,18 @@ elif st.session_state.page == "Form Filling":
                         st.warning(f"No {parent_form} records available. Please create one first.")
                         st.stop()
             
+            # Idempotency key for this rendering of the form; rotated after a successful save
+            if not tab_data.get("submission_key"):
+                tab_data["submission_key"] = uuid.uuid4().hex
+            
+            # Compiled once per form definition; a rerun only executes the plan
+            plan = get_render_plan(fields)
+            for error in plan.errors:
+                st.error(error)
+            
             # Use a form context to prevent partial submissions
             with st.form(key=f"form_{form_name}_{st.session_state.active_tab}"):
-                form_data = {}
-                validation_errors = []
-                
-                # Render form fields with enhanced validation
-                for i, field in enumerate(fields):
-                    try:
-                        # Validate field structure
-                        if not isinstance(field, dict):
-                            st.error(f"Invalid field at position {i}: Expected dict, got {type(field)}")
-                            continue
-                            
-                        # Validate field name
-                        if "name" not in field:
-                            st.error(f"Field at position {i} is missing 'name' property")
-                            continue
-                            
-                        field_name = field["name"]
-                        if not isinstance(field_name, str):
-                            st.error(f"Field name at position {i} must be string, got {type(field_name)}")
-                            continue
-                            
-                        field_name = field_name.strip()
-                        if not field_name:
-                            st.error(f"Field name at position {i} is empty")
-                            continue
-                            
-                        # Get field type with default
-                        field_type = field.get("type", "TEXT")
-                        if not isinstance(field_type, str):
-                            st.error(f"Field type at position {i} must be string, got {type(field_type)}")
-                            continue
-                            
-                        # Handle different field types
-                        if field_type == "TEXTAREA":
-                            form_data[field_name] = st.text_area(field_name)
-                        
-                        elif field_type == "PASSWORD":
-                            form_data[field_name] = st.text_input(field_name, type="password")
-                        
-                        elif field_type == "CHECKBOX":
-                            if "options" in field:
-                                selected = []
-                                for option in field["options"]:
-                                    if st.checkbox(f"{field_name} - {option}", key=f"checkbox_{field_name}_{option}_{i}"):
-                                        selected.append(option)
-                                form_data[field_name] = ", ".join(selected) if selected else None
-                        
-                        elif field_type == "RADIO":
-                            if "options" in field:
-                                form_data[field_name] = st.radio(field_name, field["options"], key=f"radio_{field_name}_{i}")
-                        
-                        elif field_type == "SELECT":
-                            if "options" in field:
-                                form_data[field_name] = st.selectbox(field_name, field["options"], key=f"select_{field_name}_{i}")
-                        
-                        elif field_type == "DATETIME":
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                date_value = st.date_input(f"{field_name} (date)", key=f"date_{field_name}_{i}")
-                            with col2:
-                                time_value = st.time_input(f"{field_name} (time)", key=f"time_{field_name}_{i}")
-                            
-                            # Combine date and time into a datetime string
-                            if date_value and time_value:
-                                form_data[field_name] = f"{date_value} {time_value}"
-                            else:
-                                form_data[field_name] = None
-                        elif field_type == "TIME":
-                            form_data[field_name] = st.time_input(field_name, key=f"time_{field_name}_{i}")
-                        
-                        elif field_type == "MULTISELECT":
-                            if "options" in field:
-                                form_data[field_name] = st.multiselect(field_name, field["options"], key=f"multiselect_{field_name}_{i}")
-                        
-                        elif field_type == "EMAIL":
-                            email = st.text_input(field_name, key=f"email_{field_name}_{i}")
-                            if email and not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-                                validation_errors.append(f"{field_name} must be a valid email address")
-                            form_data[field_name] = email
-                        
-                        elif field_type == "URL":
-                            url = st.text_input(field_name, key=f"url_{field_name}_{i}")
-                            if url and not re.match(r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+", url):
-                                validation_errors.append(f"{field_name} must be a valid URL")
-                            form_data[field_name] = url
-                        
-                        elif field_type == "COLOR":
-                            form_data[field_name] = st.color_picker(field_name, key=f"color_{field_name}_{i}")
-                        
-                        elif field_type == "FILE":
-                            form_data[field_name] = st.file_uploader(field_name, key=f"file_{field_name}_{i}")
-                        
-                        elif field_type == "RANGE":
-                            min_val, max_val = 0, 100  # Default range
-                            if "options" in field and len(field["options"]) >= 2:
-                                try:
-                                    min_val = float(field["options"][0])
-                                    max_val = float(field["options"][1])
-                                except ValueError:
-                                    pass
-                            form_data[field_name] = st.slider(field_name, min_val, max_val, key=f"slider_{field_name}_{i}")
-                        
-                        # Handle original field types
-                        elif field_name.lower() == "gender":
-                            options = ["Male", "Female", "Other", "Prefer not to say"]
-                            form_data[field_name] = st.selectbox(field_name, options, key=f"gender_{i}")
-                        
-                        elif field_type == "PHONE":
-                            phone = st.text_input(field_name, key=f"phone_{field_name}_{i}")
-                            if phone and (not phone.isdigit() or len(phone) != 10):
-                                validation_errors.append(f"{field_name} must be a 10-digit number")
-                            form_data[field_name] = phone
-                        
-                        elif "VARCHAR" in field_type or "TEXT" in field_type:
-                            form_data[field_name] = st.text_input(field_name, key=f"text_{field_name}_{i}")
-                        
-                        elif "INT" in field_type:
-                            form_data[field_name] = st.number_input(field_name, step=1, key=f"int_{field_name}_{i}")
-                        
-                        elif "FLOAT" in field_type:
-                            form_data[field_name] = st.number_input(field_name, step=0.1, key=f"float_{field_name}_{i}")
-                        
-                        elif "DATE" in field_type:
-                            min_date = datetime.date(1800, 1, 1)
-                            max_date = datetime.date.today()
-                            form_data[field_name] = st.date_input(
-                                field_name,
-                                min_value=min_date,
-                                max_value=max_date,
-                                key=f"date_{field_name}_{i}"
-                            )
-                        
-                        elif "BOOLEAN" in field_type:
-                            form_data[field_name] = st.checkbox(field_name, key=f"checkbox_{field_name}_{i}")
-                    
-                    except Exception as e:
-                        st.error(f"Error rendering field {i}: {str(e)}")
-                        logger.exception(f"Error rendering field {i}")
+                form_data, validation_errors = render_form(plan, f"fill_{st.session_state.active_tab}")
                 
                 # Display validation errors
                 for error in validation_errors:
@@ -734,80 +877,7 @@ elif st.session_state.page == "Form Filling":
                         st.error("Please fill in at least one field")
                         st.stop()
                     # Convert data types before submission
-                    processed_data = {}
-                    field_errors = []
-                        
-                    for i, field in enumerate(fields):
-                        try:
-                            # Skip if field is invalid
-                            if not isinstance(field, dict) or "name" not in field:
-                                continue
-                                    
-                            field_name = field["name"]
-                            if not isinstance(field_name, str) or not field_name.strip():
-                                continue
-                                    
-                            # Normalize field name
-                            normalized_name = field_name.strip().replace(" ", "_").lower()
-                                
-                            # Skip id field
-                            if normalized_name == "id":
-                                continue
-                                
-                            # Skip if field not in form data
-                            if field_name not in form_data:
-                                continue
-                                    
-                            value = form_data[field_name]
-                                
-                            # Skip empty values
-                            if value in (None, "", [], [""]):
-                                if field.get("required"):
-                                    field_errors.append(f"{field_name} is required")
-                                continue
-                                
-                            # Get field type with default
-                            field_type = field.get("type", "TEXT")
-                                
-                            # Type conversions
-                            if field_type == "BOOLEAN":
-                                processed_data[normalized_name] = bool(value) if not isinstance(value, str) else value.lower() in ('true', 't', 'yes', 'y', '1', 'on')
-                                
-                            elif field_type in ["CHECKBOX", "MULTISELECT"]:
-                                if isinstance(value, str):
-                                    processed_data[normalized_name] = [v.strip() for v in value.split(',') if v.strip()]
-                                elif isinstance(value, (list, tuple)):
-                                    processed_data[normalized_name] = list(value)
-                                else:
-                                    processed_data[normalized_name] = [str(value)]
-                                
-                            elif field_type in ["DATE", "DATETIME", "TIME"]:
-                                if hasattr(value, 'isoformat'):
-                                    if isinstance(value, datetime.time):
-                                        processed_data[normalized_name] = value.strftime("%H:%M:%S")
-                                    elif isinstance(value, datetime.datetime):
-                                        processed_data[normalized_name] = value.strftime("%Y-%m-%d %H:%M:%S")
-                                    else:  # date
-                                        processed_data[normalized_name] = value.isoformat()
-                                else:
-                                    processed_data[normalized_name] = value
-                            elif field_type == "INTEGER":
-                                try:
-                                    processed_data[normalized_name] = int(float(value)) if value else None
-                                except (ValueError, TypeError):
-                                    field_errors.append(f"Invalid integer value for {field_name}")
-                                
-                            elif field_type == "FLOAT":
-                                try:
-                                    processed_data[normalized_name] = float(value) if value else None
-                                except (ValueError, TypeError):
-                                    field_errors.append(f"Invalid number for {field_name}")
-                            else:
-                                processed_data[normalized_name] = value
-                            
-                        except Exception as e:
-                            logger.exception(f"Error processing field {i} ({field_name})")
-                            field_errors.append(f"Error processing {field_name}: {str(e)}")
+                    processed_data, field_errors = process_submission(plan, form_data)
                         
                     # Show field errors if any
                     if field_errors:
@@ -844,21 +914,12 @@ elif st.session_state.page == "Form Filling":
                     if not synchronize_form_table(form_name):
                         st.error("Database schema out of sync. Please try again.")
                         st.stop()
-                    # Get form data
-                    form_data = get_form_data(form_name)  # Your function to collect form data
-                        
-                    # Check if we already processed this submission
-                    current_hash = hashlib.md5(str(form_data).encode()).hexdigest()
-                        
-                    if 'last_submission_hash' in st.session_state:
-                        if st.session_state.last_submission_hash == current_hash:
-                            st.warning("This submission has already been processed")
-                            st.stop()
-                    # Save data
-                    if save_form_data(form_name, processed_data):
+                    # Save data; a re-sent submission key is ignored by the database
+                    if save_form_data(form_name, processed_data, submission_key=tab_data["submission_key"]):
                         st.success("✅ Form submitted successfully!")
                         # Reset form data but keep the tab open
                         tab_data["form_data"] = {}
+                        tab_data["submission_key"] = uuid.uuid4().hex
                         st.balloons()
                     else:
                         st.error("""
@@ -919,43 +980,17 @@ elif st.session_state.page == "Shared Form":
     st.subheader(f"You are filling out: {form_name}")
     st.markdown("---")
     
+    # Idempotency key for this rendering of the form; rotated after a successful save
+    submission_key_state = f"submission_key_{token}"
+    if not st.session_state.get(submission_key_state):
+        st.session_state[submission_key_state] = uuid.uuid4().hex
+    
+    plan = get_render_plan(fields)
+
     # Use a form context to handle submission
     with st.form(key=f"shared_form_{token}"):
-        form_data = {}
-        validation_errors = []
-
-        # --- This is the same robust field rendering logic from the "Form Filling" page ---
-        for i, field in enumerate(fields):
-            field_name = field.get("name", f"field_{i}")
-            field_type = field.get("type", "TEXT")
-            
-            if field_type == "TEXTAREA":
-                form_data[field_name] = st.text_area(field_name)
-            elif field_type == "PASSWORD":
-                form_data[field_name] = st.text_input(field_name, type="password")
-            elif field_type == "RADIO" and "options" in field:
-                form_data[field_name] = st.radio(field_name, field["options"], key=f"radio_{field_name}_{i}")
-            elif field_type == "SELECT" and "options" in field:
-                form_data[field_name] = st.selectbox(field_name, field["options"], key=f"select_{field_name}_{i}")
-            elif field_type == "MULTISELECT" and "options" in field:
-                form_data[field_name] = st.multiselect(field_name, field["options"], key=f"multiselect_{field_name}_{i}")
-            elif field_type == "DATETIME":
-                form_data[field_name] = st.date_input(field_name, value=None, key=f"datetime_{field_name}_{i}")
-            elif field_type == "EMAIL":
-                email = st.text_input(field_name, key=f"email_{field_name}_{i}")
-                if email and not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-                    validation_errors.append(f"{field_name} must be a valid email address")
-                form_data[field_name] = email
-            elif "INT" in field_type:
-                form_data[field_name] = st.number_input(field_name, step=1, value=None, key=f"int_{field_name}_{i}")
-            elif "FLOAT" in field_type:
-                form_data[field_name] = st.number_input(field_name, step=0.1, value=None, key=f"float_{field_name}_{i}")
-            elif "DATE" in field_type:
-                form_data[field_name] = st.date_input(field_name, value=None, key=f"date_{field_name}_{i}")
-            elif "BOOLEAN" in field_type:
-                form_data[field_name] = st.checkbox(field_name, key=f"checkbox_{field_name}_{i}")
-            else: # Default to text input
-                form_data[field_name] = st.text_input(field_name, key=f"text_{field_name}_{i}")
+        # Same compiled render plan as the "Form Filling" page
+        form_data, validation_errors = render_form(plan, f"shared_{token}")
         
         # Display validation errors
         for error in validation_errors:
@@ -964,21 +999,19 @@ elif st.session_state.page == "Shared Form":
         submitted = st.form_submit_button("Submit Form")
 
         if submitted and not validation_errors:
-            # --- This is the same robust data processing logic ---
-            processed_data = {}
-            for field in fields:
-                field_name = field["name"]
-                normalized_name = field_name.replace(" ", "_").lower()
-                value = form_data.get(field_name)
-
-                if value not in [None, "", [], {}]:
-                    processed_data[normalized_name] = value
+            # --- The same data processing as the "Form Filling" page ---
+            processed_data, field_errors = process_submission(plan, form_data)
             
-            if not processed_data:
+            if field_errors:
+                for error in field_errors:
+                    st.error(error)
+            elif not processed_data:
                 st.warning("Please fill in at least one field before submitting.")
             else:
-                if save_form_data(form_name, processed_data):
+                if save_form_data(form_name, processed_data, submission_key=st.session_state[submission_key_state],
+                                  write_behind=SUBMISSION_WRITE_BEHIND):
                     st.success("✅ Thank you! Your submission has been received.")
+                    st.session_state[submission_key_state] = uuid.uuid4().hex
                     st.balloons()
                 else:
                     st.error("❌ There was an error saving your submission. Please try again.")
@@ -1027,7 +1060,7 @@ elif st.session_state.page == "Admin View":
     if st.session_state.admin_tabs:
         if st.button("✕ Close", help="Close current tab"):
             if st.session_state.active_admin_tab is not None:
-                st.session_state.admin_tabs.pop(st.session_state.active_admin_tab)
+                discard_admin_export(st.session_state.admin_tabs.pop(st.session_state.active_admin_tab))
                 if st.session_state.admin_tabs:
                     st.session_state.active_admin_tab = min(st.session_state.active_admin_tab, len(st.session_state.admin_tabs)-1)
                 else:
@@ -1039,7 +1072,7 @@ elif st.session_state.page == "Admin View":
         tab = st.session_state.admin_tabs[st.session_state.active_admin_tab]
         
         # Form selection
-        forms = get_all_forms()
+        forms = accessible_forms(st.session_state.user, FORM_VIEW)
         form_name = st.selectbox(
             "Select Form", 
             forms,
@@ -1050,154 +1083,81 @@ elif st.session_state.page == "Admin View":
         # Update tab when form changes
         if form_name != tab["form_name"]:
             tab["form_name"] = form_name
-            tab["data"] = None
             tab["parent_record"] = None
+            tab["filters"] = {}
+            tab["filter_specs"] = None
+            tab["filter_domains"] = None
+            reset_admin_paging(tab)
             st.rerun()
-        
+
+        # Paging options
+        page_cols = st.columns(3)
+        with page_cols[0]:
+            page_size = st.selectbox(
+                "Rows per page",
+                ADMIN_PAGE_SIZES,
+                index=ADMIN_PAGE_SIZES.index(tab.get("page_size", ADMIN_PAGE_SIZES[1])),
+                key=f"page_size_{st.session_state.active_admin_tab}"
+            )
+        with page_cols[1]:
+            page_order = st.selectbox(
+                "Order by",
+                list(PAGE_ORDER_COLUMNS),
+                index=list(PAGE_ORDER_COLUMNS).index(tab.get("page_order", "id")),
+                key=f"page_order_{st.session_state.active_admin_tab}"
+            )
+        with page_cols[2]:
+            page_descending = st.checkbox(
+                "Newest first",
+                value=tab.get("page_descending", False),
+                key=f"page_desc_{st.session_state.active_admin_tab}"
+            )
+        if (page_size, page_order, page_descending) != (
+                tab.get("page_size", ADMIN_PAGE_SIZES[1]), tab.get("page_order", "id"),
+                tab.get("page_descending", False)):
+            tab["page_size"] = page_size
+            tab["page_order"] = page_order
+            tab["page_descending"] = page_descending
+            if tab["data"] is not None:
+                reset_admin_paging(tab)
+                load_admin_page(tab)
+
         # Load data button
         if st.button("Load Data", key=f"load_{st.session_state.active_admin_tab}"):
             try:
-                tab["data"] = get_form_data(form_name)
+                tab["filter_specs"] = get_filter_specs(form_name)
+                tab["filter_domains"] = get_filter_domains(form_name, tab["filter_specs"])
+                reset_admin_paging(tab)
+                load_admin_page(tab)
                 st.rerun()
             except Exception as e:
                 st.error(f"Error loading data: {str(e)}")
-        
+
         # Only proceed if form is selected and data is loaded
         if form_name and tab["data"] is not None:
-            data = tab["data"]
-            
-            if not data:
-                st.warning("No submissions found for this form")
-                st.stop()
-                
-            # Convert to DataFrame for filtering
-            df = pd.DataFrame(data).fillna('')
-            
-            # Create dynamic filters based on column names
+            # Filters are compiled into the page query, so only matching rows are fetched
             st.subheader("Filters")
-            
-            # Create columns for filters
-            filter_cols = st.columns(4)
-            filters = {}
-            filter_types = {}
-            
-            # Function to find matching columns
-            def find_matching_columns(pattern):
-                pattern = pattern.lower()
-                return [col for col in df.columns if pattern in col.lower()]
-            
-            # Gender filter
-            gender_cols = find_matching_columns("gender")
-            if gender_cols:
-                gender_col = gender_cols[0]  # Use first matching column
-                genders = ['All'] + sorted(df[gender_col].astype(str).unique().tolist())
-                selected_gender = filter_cols[0].selectbox("Gender", genders)
-                if selected_gender != 'All':
-                    filters[gender_col] = selected_gender
-                    filter_types[gender_col] = "select"
-            
-            # Age filter
-            age_cols = find_matching_columns("age")
-            if age_cols:
-                age_col = age_cols[0]  # Use first matching column
-                try:
-                    # Convert to numeric if possible
-                    df[age_col] = pd.to_numeric(df[age_col], errors='coerce')
-                    if not df[age_col].isnull().all():  # Check if conversion worked
-                        min_age = int(df[age_col].min())
-                        max_age = int(df[age_col].max())
-                        if min_age >= max_age:
-                            max_age = min_age + 1
-                        
-                        age_range = filter_cols[1].slider(
-                            "Age Range", 
-                            min_value=min_age, 
-                            max_value=max_age, 
-                            value=(min_age, max_age)
-                        )
-                        filters[age_col] = age_range
-                        filter_types[age_col] = "range"
-                    else:
-                        # Handle as categorical if conversion failed
-                        ages = ['All'] + sorted(df[age_col].astype(str).unique().tolist())
-                        selected_age = filter_cols[1].selectbox("Age", ages)
-                        if selected_age != 'All':
-                            filters[age_col] = selected_age
-                            filter_types[age_col] = "select"
-                except:
-                    # Handle as categorical if any error occurs
-                    ages = ['All'] + sorted(df[age_col].astype(str).unique().tolist())
-                    selected_age = filter_cols[1].selectbox("Age", ages)
-                    if selected_age != 'All':
-                        filters[age_col] = selected_age
-                        filter_types[age_col] = "select"
-            
-            # Standard/Class filter
-            std_cols = find_matching_columns("standard") or find_matching_columns("class")
-            if std_cols:
-                std_col = std_cols[0]  # Use first matching column
-                standards = ['All'] + sorted(df[std_col].astype(str).unique().tolist())
-                selected_standard = filter_cols[2].selectbox("Standard/Class", standards)
-                if selected_standard != 'All':
-                    filters[std_col] = selected_standard
-                    filter_types[std_col] = "select"
-            
-            # Division filter
-            div_cols = find_matching_columns("division") or find_matching_columns("div")
-            if div_cols:
-                div_col = div_cols[0]  # Use first matching column
-                divisions = ['All'] + sorted(df[div_col].astype(str).unique().tolist())
-                selected_division = filter_cols[3].selectbox("Division", divisions)
-                if selected_division != 'All':
-                    filters[div_col] = selected_division
-                    filter_types[div_col] = "select"
-            
-            # Apply filters
-            filtered_df = df.copy()
-            for column, value in filters.items():
-                if column in filtered_df.columns:
-                    filter_type = filter_types.get(column, "select")
-                    
-                    if filter_type == "range":
-                        # Apply range filter
-                        filtered_df = filtered_df[
-                            (filtered_df[column] >= value[0]) & 
-                            (filtered_df[column] <= value[1])
-                        ]
-                    else:
-                        # Apply equality filter
-                        filtered_df = filtered_df[filtered_df[column].astype(str) == str(value)]
-            
+            filter_key = f"{st.session_state.active_admin_tab}_{form_name}"
+            selections = render_admin_filters(tab, filter_key)
+
             # Parent Name Filter (only for child forms)
             parent_forms_list = get_parent_forms(form_name)
-            if parent_forms_list and 'parent_id' in filtered_df.columns:
+            if parent_forms_list and 'parent_id' in get_table_column_names(form_name.replace(" ", "_").lower()):
                 parent_form_name = parent_forms_list[0]
-                parent_records = get_form_data(parent_form_name) if parent_form_name else []
-                
-                if parent_records:
-                    # Create a mapping of display names to IDs
-                    parent_options = {}
-                    for record in parent_records:
-                        # Try to find a suitable display name
-                        display_name = None
-                        for field in ['name', 'title', 'full_name', 'first_name']:
-                            if field in record and record[field]:
-                                display_name = str(record[field])
-                                break
-                        if not display_name:
-                            display_name = f"ID: {record['id']}"
-                        
-                        parent_options[f"{display_name} (ID: {record['id']})"] = record['id']
-                    
+                parent_options = {
+                    f"{record['display']} (ID: {record['id']})": record['id']
+                    for record in get_parent_options(form_name, parent_form_name)
+                }
+                if parent_options:
                     selected_parent = st.selectbox(
                         f"Filter by {parent_form_name}",
                         ["All"] + list(parent_options.keys()),
-                        key=f"parent_select_{st.session_state.active_admin_tab}"
+                        key=f"parent_select_{filter_key}"
                     )
-                    
+
                     if selected_parent != "All":
                         parent_id = parent_options[selected_parent]
-                        filtered_df = filtered_df[filtered_df['parent_id'] == parent_id]
+                        selections['parent_id'] = parent_id
                         # Store parent context for relationship management
                         tab['parent_id'] = parent_id
                         tab['parent_form'] = parent_form_name
@@ -1205,7 +1165,69 @@ elif st.session_state.page == "Admin View":
                         # Clear parent context if "All" is selected
                         tab.pop('parent_id', None)
                         tab.pop('parent_form', None)
+
+            if selections != tab.get("filters", {}):
+                tab["filters"] = selections
+                reset_admin_paging(tab)
+                try:
+                    load_admin_page(tab)
+                except Exception as e:
+                    st.error(f"Error applying filters: {str(e)}")
+                    tab["data"] = []
+
+            data = tab["data"]
+
+            # Page navigation
+            nav_cols = st.columns([1, 2, 1])
+            with nav_cols[0]:
+                if st.button("◀ Prev", disabled=tab["page_index"] == 0,
+                             key=f"page_prev_{st.session_state.active_admin_tab}"):
+                    tab["page_index"] -= 1
+                    load_admin_page(tab)
+                    st.rerun()
+            with nav_cols[1]:
+                st.caption(f"Page {tab['page_index'] + 1} · {len(data)} rows")
+            with nav_cols[2]:
+                if st.button("Next ▶", disabled=tab["next_after_id"] is None,
+                             key=f"page_next_{st.session_state.active_admin_tab}"):
+                    del tab["page_cursors"][tab["page_index"] + 1:]
+                    tab["page_cursors"].append(tab["next_after_id"])
+                    tab["page_index"] += 1
+                    load_admin_page(tab)
+                    st.rerun()
+
+            if not data:
+                if tab.get("filters"):
+                    st.warning("No submissions match the current filters")
+                else:
+                    st.warning("No submissions found for this form")
+                st.stop()
+                
+            # Convert to DataFrame for display
+            df = pd.DataFrame(data).drop(columns=[SUBMISSION_KEY_COLUMN], errors='ignore').fillna('')
             
+            filtered_df = df
+
+            # The related-record panels below are independent reads; run them
+            # together so the page waits for the slowest one, not their sum.
+            record_ids = [int(i) for i in df['id'].tolist() if i != ''] if 'id' in df.columns else []
+            linked_parent_ids = sorted(
+                {int(i) for i in df['parent_id'].tolist() if i != ''}
+            ) if 'parent_id' in df.columns else []
+            child_forms = get_child_forms(form_name)
+            parent_forms = get_parent_forms(form_name)
+            related_reads = {}
+            for child_form in child_forms:
+                related_reads[f"child:{child_form}"] = ("get_child_records_for_parents", child_form, record_ids)
+            for parent_form in parent_forms:
+                related_reads[f"parent:{parent_form}"] = ("get_records_by_ids", parent_form, linked_parent_ids)
+            if tab.get('parent_id') and tab.get('parent_form'):
+                selected_parent_id = tab['parent_id']
+                related_reads["relationships"] = ("get_child_relationships", selected_parent_id)
+                for sibling_form in get_child_forms(tab['parent_form']):
+                    related_reads[f"sibling:{sibling_form}"] = ("get_child_records", sibling_form, selected_parent_id)
+            related = db_async.call_many(related_reads)
+
             # ========================================================= #
             # <<< --- START: NEW CHILD-TO-CHILD RELATIONSHIP CODE --- >>> #
             # ========================================================= #
@@ -1240,8 +1262,8 @@ elif st.session_state.page == "Admin View":
                         
                         if source_form and target_form:
                             # Get records for both forms that belong to the selected parent.
-                            source_records = get_child_records(source_form, parent_id)
-                            target_records = get_child_records(target_form, parent_id)
+                            source_records = related_result(related, f"sibling:{source_form}", source_form)
+                            target_records = related_result(related, f"sibling:{target_form}", target_form)
                             
                             if source_records and target_records:
                                 # Helper to create a user-friendly display name for a record.
@@ -1282,7 +1304,7 @@ elif st.session_state.page == "Admin View":
                         # --- Relationship Management UI ---
                         st.markdown("---")
                         st.subheader("Manage Existing Relationships")
-                        relationships = get_child_relationships(parent_id)
+                        relationships = related_result(related, "relationships", "relationships")
                         
                         if relationships:
                             # Format for display in a DataFrame
@@ -1363,18 +1385,24 @@ elif st.session_state.page == "Admin View":
             # Display data
             st.subheader(f"Submission Data for {form_name}")
             
+            # Stored files show as names (and download links); the bytes are not loaded
+            file_link_config, file_refs = show_file_columns(filtered_df, form_name)
+
             # Add selection checkboxes for deletion
             filtered_df['Select'] = False
             edited_df = st.data_editor(
                 filtered_df,
                 column_config={
-                    "Select": st.column_config.CheckboxColumn(required=True)
+                    "Select": st.column_config.CheckboxColumn(required=True),
+                    **file_link_config
                 },
                 disabled=filtered_df.columns.drop('Select').tolist(),
                 hide_index=True,
                 use_container_width=True,
                 key=f"data_editor_{st.session_state.active_admin_tab}"
             )
+            if file_refs and not file_link_config:
+                show_file_downloads(file_refs, st.session_state.active_admin_tab)
             
             # Get selected rows for deletion
             selected_rows = edited_df[edited_df.Select]
@@ -1382,14 +1410,17 @@ elif st.session_state.page == "Admin View":
             # Data deletion section
             st.subheader("Data Management")
             
-            if not selected_rows.empty:
+            can_delete = bool(get_form_access(st.session_state.user, form_name) & FORM_DELETE)
+            if not selected_rows.empty and not can_delete:
+                st.info("You do not have permission to delete records of this form")
+            elif not selected_rows.empty:
                 st.warning(f"Selected {len(selected_rows)} records for deletion")
                 if st.button("Delete Selected Records", key=f"delete_selected_{st.session_state.active_admin_tab}"):
                     record_ids = selected_rows['id'].tolist()
                     if delete_records(form_name, record_ids):
                         st.success(f"Deleted {len(record_ids)} records successfully!")
-                        # Refresh data
-                        tab["data"] = get_form_data(form_name)
+                        # Refresh the current page
+                        load_admin_page(tab)
                         st.rerun()
                     else:
                         st.error("Failed to delete records")
@@ -1397,72 +1428,134 @@ elif st.session_state.page == "Admin View":
                 st.info("Select records using the checkboxes to enable deletion")
             
             # Show child records if this is a parent form
-            child_forms = get_child_forms(form_name)
             if child_forms:
                 with st.expander("Child Records"):
-                    for child_form in child_forms:
-                        # Get valid parent IDs from the filtered data
-                        parent_ids = [int(row['id']) for row in filtered_df.to_dict('records') 
-                                    if 'id' in row and pd.notna(row['id'])]
-                        
-                        if parent_ids:
-                            try:
-                                child_data = []
-                                with get_connection() as conn:
-                                    with conn.cursor() as cur:
-                                        # Use parameterized query with ANY for array of parent IDs
-                                        cur.execute(
-                                            f"""
-                                            SELECT * FROM "{child_form.replace(' ', '_').lower()}" 
-                                            WHERE parent_id = ANY(%s)
-                                            """,
-                                            (parent_ids,)
-                                        )
-                                        columns = [desc[0] for desc in cur.description]
-                                        child_data = [dict(zip(columns, row)) for row in cur.fetchall()]
-                                
-                                if child_data:
-                                    child_df = pd.DataFrame(child_data)
-                                    st.write(f"### {child_form}")
-                                    st.dataframe(child_df)
-                                else:
-                                    st.info(f"No {child_form} records found for selected parents")
-                            except Exception as e:
-                                st.error(f"Error loading {child_form} records: {str(e)}")
+                    if not record_ids:
+                        st.warning("No valid parent IDs found in current selection")
+                    for child_form in child_forms if record_ids else []:
+                        child_data = related_result(related, f"child:{child_form}", child_form)
+                        if child_data:
+                            st.write(f"### {child_form}")
+                            st.dataframe(pd.DataFrame(child_data))
                         else:
-                            st.warning("No valid parent IDs found in current selection")
-            
+                            st.info(f"No {child_form} records found for selected parents")
+
             # Show related records
             st.subheader("Related Records")
-            parent_forms = get_parent_forms(form_name)
             if parent_forms:
                 with st.expander("Parent Records"):
                     for parent_form in parent_forms:
-                        parent_ids = [str(row.get('parent_id', '')) for row in filtered_df.to_dict('records') if row.get('parent_id')]
-                        if parent_ids:
-                            with get_connection() as conn:
-                                with conn.cursor() as cur:
-                                    cur.execute(
-                                        f"SELECT * FROM {parent_form.replace(' ', '_').lower()} WHERE id IN ({','.join(parent_ids)})"
-                                    )
-                                    parent_records = cur.fetchall()
-                                    if parent_records:
-                                        parent_df = pd.DataFrame(parent_records)
-                                        st.write(f"### {parent_form}")
-                                        st.dataframe(parent_df)
-                            
-            # Add download button
-            csv = filtered_df.drop(columns=['Select']).to_csv(index=False).encode('utf-8')
-            st.download_button(
-                "Download CSV",
-                csv,
-                f"{form_name.replace(' ', '_')}_data.csv",
-                "text/csv",
-                key=f'download-csv-{st.session_state.active_admin_tab}'
+                        parent_records = related_result(related, f"parent:{parent_form}", parent_form)
+                        if parent_records:
+                            st.write(f"### {parent_form}")
+                            st.dataframe(pd.DataFrame(parent_records))
+
+            # Export every row matching the current filters, streamed from Postgres
+            st.subheader("Export")
+            export_columns = get_export_columns(form_name)
+            exclude_columns = st.multiselect(
+                "Leave out columns",
+                export_columns,
+                default=[c for c in get_heavy_columns(form_name) if c in export_columns],
+                key=f"export_exclude_{st.session_state.active_admin_tab}"
             )
+            export_formats = list(EXPORT_FORMATS) if arrow_available() else ["csv"]
+            export_format = st.radio(
+                "Format",
+                export_formats,
+                format_func=lambda f: {"csv": "CSV", "parquet": "Parquet", "arrow": "Arrow"}[f],
+                horizontal=True,
+                key=f"export_format_{st.session_state.active_admin_tab}"
+            )
+            if not arrow_available():
+                st.caption("Install pyarrow to export typed Parquet/Arrow files.")
+            if st.button("Prepare export", key=f"export_csv_{st.session_state.active_admin_tab}"):
+                discard_admin_export(tab)
+                try:
+                    with st.spinner("Exporting..."):
+                        if export_format == "csv":
+                            tab["export"] = export_to_tempfile(
+                                form_name, filters=tab.get("filters"), exclude_columns=exclude_columns
+                            )
+                        else:
+                            tab["export"] = export_arrow_to_tempfile(
+                                form_name, export_format, filters=tab.get("filters"),
+                                exclude_columns=exclude_columns
+                            )
+                        tab["export"]["format"] = export_format
+                except Exception as e:
+                    st.error(f"Export failed: {str(e)}")
+            export = tab.get("export")
+            if export and os.path.exists(export["path"]):
+                st.caption(f"{export['rows']:,} rows, {export['bytes'] / 1024 / 1024:.1f} MB")
+                export_mime = {
+                    "csv": "text/csv",
+                    "parquet": "application/vnd.apache.parquet",
+                    "arrow": "application/vnd.apache.arrow.file",
+                }[export["format"]]
+                with open(export["path"], "rb") as export_file:
+                    st.download_button(
+                        f"Download {export['format'].upper()}",
+                        export_file,
+                        f"{form_name.replace(' ', '_')}_data.{export['format']}",
+                        export_mime,
+                        key=f'download-csv-{st.session_state.active_admin_tab}'
+                    )
     else:
         st.info("No analysis tabs open. Click '+ New' to start.")
 
+elif st.session_state.page == "Data Import":
+    st.title("Data Import")
+    check_access("admin")
+    st.info("Load existing CSV or JSONL data into a form. Columns are matched to the form's fields by name; rows that cannot be converted are collected in a reject file.")
+
+    forms = accessible_forms(st.session_state.user, FORM_EDIT)
+    if not forms:
+        st.warning("No forms available. Please create a form first.")
+        st.stop()
+
+    import_form = st.selectbox("Target Form", forms, key="import_form_select")
+    uploaded = st.file_uploader("Data file", type=["csv", "jsonl", "ndjson", "json"], key="import_file")
+    batch_size = st.number_input("Rows per batch", min_value=100, max_value=100000, value=5000, step=500)
+
+    if uploaded and st.button("📥 Import Data", type="primary"):
+        fmt = detect_format(uploaded.name)
+        progress_bar = st.progress(0.0)
+        status = st.empty()
+        total_bytes = uploaded.size or 1
+
+        def show_progress(stats):
+            progress_bar.progress(min(uploaded.tell() / total_bytes, 1.0))
+            status.write(
+                f"{stats['rows_read']:,} rows read · {stats['inserted']:,} inserted · "
+                f"{stats['rejected']:,} rejected · {stats['rows_per_second']:,.0f} rows/s"
+            )
+
+        reject_file = tempfile.NamedTemporaryFile(mode="w", suffix=".rejects.jsonl", delete=False, encoding="utf-8")
+        try:
+            text_stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+            with reject_file:
+                stats = import_stream(import_form, text_stream, fmt, int(batch_size), reject_file, show_progress)
+            progress_bar.progress(1.0)
+            show_progress(stats)
+            st.success(f"Imported {stats['inserted']:,} rows into '{import_form}' in {stats['seconds']:.1f}s.")
+            if stats["unmapped_headers"]:
+                st.warning(f"Ignored columns that are not fields of this form: {', '.join(map(str, stats['unmapped_headers']))}")
+            if stats["rejected"]:
+                st.error(f"{stats['rejected']:,} rows were rejected.")
+                with open(reject_file.name, "rb") as rejects:
+                    st.download_button(
+                        "Download rejected rows",
+                        rejects,
+                        f"{import_form.replace(' ', '_')}_rejects.jsonl",
+                        "application/jsonl"
+                    )
+        except Exception as e:
+            st.error(f"Import failed: {str(e)}")
+            logger.exception("Data import failed")
+        finally:
+            os.remove(reject_file.name)
+
 elif st.session_state.page == "User Management":
     st.title("User Management")
     
@@ -1472,7 +1565,7 @@ elif st.session_state.page == "User Management":
         st.stop()
     
     # Create tabs for different functions
-    tab1, tab2, tab3, tab4 = st.tabs(["Create Users", "Manage Users", "Password Reset","🩺 System Health"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Create Users", "Manage Users", "Password Reset","🩺 System Health", "🗂️ Indexes"])
     
     with tab1:
         with st.form("create_user_form"):
@@ -1629,6 +1722,32 @@ elif st.session_state.page == "User Management":
 
                     elif status == 'Parent':
                         st.info(f"ℹ️ **{form_name}**: Parent Form (or has no parent link)")
+        st.subheader("Database Connection Pool")
+        pool_stats = get_pool_stats()
+        pool_cols = st.columns(4)
+        pool_cols[0].metric("In use", pool_stats["in_use"])
+        pool_cols[1].metric("Idle", pool_stats["idle"])
+        pool_cols[2].metric("Avg wait (ms)", f"{pool_stats['avg_wait_seconds'] * 1000:.1f}")
+        pool_cols[3].metric("Max wait (ms)", f"{pool_stats['max_wait_seconds'] * 1000:.1f}")
+        with st.expander("Pool details"):
+            st.json(pool_stats)
+        if SUBMISSION_WRITE_BEHIND:
+            st.subheader("Submission Buffer")
+            buffer_stats = submission_buffer.get_buffer_stats()
+            buffer_cols = st.columns(4)
+            buffer_cols[0].metric("Pending (KB)", f"{buffer_stats['pending_bytes'] / 1024:.1f}")
+            buffer_cols[1].metric("Flushed", buffer_stats["flushed"])
+            buffer_cols[2].metric("Dead-lettered", buffer_stats["dead_lettered"])
+            buffer_cols[3].metric("Failed flushes", buffer_stats["failed_flushes"])
+            if buffer_stats["last_error"]:
+                st.warning(f"Last flush error: {buffer_stats['last_error']}")
+        st.subheader("Share Link Cache")
+        token_stats = get_token_cache_stats()
+        token_cols = st.columns(4)
+        token_cols[0].metric("Hit rate", f"{token_stats['hit_rate'] * 100:.1f}%")
+        token_cols[1].metric("Lookups served", token_stats["hits"] + token_stats["negative_hits"])
+        token_cols[2].metric("Database reads", token_stats["misses"])
+        token_cols[3].metric("Avg read (ms)", f"{token_stats['avg_miss_seconds'] * 1000:.1f}")
         st.subheader("System Health and Cleanup")
         st.info("This tool helps find and fix inconsistencies in your form data, such as 'orphan' form records where the metadata exists but the data table is missing.")
 
@@ -1672,13 +1791,52 @@ elif st.session_state.page == "User Management":
                     # Clear the cache and rerun to reflect changes
                     del st.session_state.orphan_records
                     st.rerun()
+
+    with tab5:
+        st.subheader("Index Health")
+        st.info("Form tables get indexes on parent_id and created_at automatically; fields marked 'Index for filtering' in Update Forms get their own. Scan counts are cumulative since the database statistics were last reset.")
+
+        if st.button("🛠️ Create Missing Indexes"):
+            with st.spinner("Creating indexes..."):
+                failed = ensure_all_indexes()
+            if failed:
+                st.error(f"Could not create indexes for: {', '.join(failed)}")
+            else:
+                st.success("All standard and declared indexes are in place.")
+
+        try:
+            index_report = get_index_report()
+        except Exception as e:
+            st.error(f"Could not read index statistics: {str(e)}")
+            index_report = None
+
+        if index_report:
+            if index_report["missing"]:
+                st.warning(f"{len(index_report['missing'])} column(s) are missing an index.")
+                st.dataframe(pd.DataFrame(index_report["missing"]), hide_index=True, use_container_width=True)
+            else:
+                st.success("✅ No missing indexes.")
+
+            unused = [ix for ix in index_report["indexes"] if ix["unused"]]
+            if unused:
+                st.markdown("##### Unused indexes")
+                st.caption("Never scanned; they still cost space and slow down writes.")
+                st.dataframe(pd.DataFrame(unused).drop(columns=["unused", "unique"]), hide_index=True, use_container_width=True)
+
+            st.markdown("##### Table scans")
+            if index_report["tables"]:
+                st.dataframe(pd.DataFrame(index_report["tables"]), hide_index=True, use_container_width=True)
+
+            with st.expander("All indexes"):
+                if index_report["indexes"]:
+                    st.dataframe(pd.DataFrame(index_report["indexes"]), hide_index=True, use_container_width=True)
                     
 elif st.session_state.page == "Update Forms":
     st.title("Form Management")
     check_access("update_forms")
     
     # Get all forms
-    forms = get_all_forms()
+    forms = accessible_forms(st.session_state.user, FORM_EDIT)
     
     if not forms:
         st.warning("No forms available. Please create a form first.")
@@ -1808,6 +1966,18 @@ elif st.session_state.page == "Update Forms":
                         else:
                             if 'options' in st.session_state.edit_fields[i]:
                                 del st.session_state.edit_fields[i]['options']
+                    # Filterable fields can get a database index for the Admin View filters
+                    if field['type'] in FILTER_KINDS:
+                        indexed = st.checkbox(
+                            "Index for filtering",
+                            value=field.get('indexed', False),
+                            key=f"indexed_{i}",
+                            help="Create a database index so Admin View filters on this field stay fast on large forms"
+                        )
+                        if indexed:
+                            st.session_state.edit_fields[i]['indexed'] = True
+                        else:
+                            st.session_state.edit_fields[i].pop('indexed', None)
                 
                 with col4:
                     if st.button("❌", key=f"remove_{i}"):
@@ -2030,6 +2200,9 @@ elif st.session_state.page == "Update Forms":
             
             with col3:
                 if st.button("💾 Save Changes", type="primary"):
+                    if not get_form_access(st.session_state.user, selected_form) & FORM_EDIT:
+                        st.error("You do not have permission to edit this form")
+                        st.stop()
                     try:
                         # Get final field list (excluding removed fields)
                         final_fields = [
@@ -2060,7 +2233,7 @@ elif st.session_state.page == "Update Forms":
                         
                         # Show preview
                         st.subheader("Updated Form Preview")
-                        st.components.v1.html(html_content, height=500, scrolling=True)
+                        st.components.v1.html(sandboxed_html(html_content), height=500)
                     except Exception as e:
                         st.error(f"Error updating form: {str(e)}")
             # --- ADDED THIS NEW COLUMN AND LOGIC ---
@@ -2068,25 +2241,9 @@ elif st.session_state.page == "Update Forms":
                 # This button enhances the *currently saved* state of the form
                 if st.button("✨ Enhance with AI"):
                     st.info("Note: This will enhance the last saved version of the form's fields.")
-                    with st.spinner(f"Sending '{selected_form}' to the AI for enhancement..."):
-                        try:
-                            # Use the 'original_fields' which represents the last saved state
-                            fields_to_enhance = st.session_state.original_fields
-                            fields_tuple = tuple(tuple(d.items()) for d in fields_to_enhance)
-                            
-                            # Call the LLM function
-                            enhanced_html = generate_form_with_llama(selected_form, fields_tuple)
-                            
-                            if enhanced_html:
-                                save_form_html(selected_form, enhanced_html)
-                                st.success("AI enhancement complete!")
-                                st.subheader("Enhanced Form Preview")
-                                st.components.v1.html(enhanced_html, height=500, scrolling=True, key="enhanced_preview")
-                            else:
-                                st.error("AI enhancement failed to produce a result.")
-
-                        except Exception as e:
-                            st.error(f"AI enhancement failed: {e}")
+                    # Use the 'original_fields' which represents the last saved state
+                    start_enhancement(selected_form, st.session_state.original_fields)
+            show_enhancement_job(selected_form)
 
             # Rest of the update form code remains the same...
             # [Previous update form implementation goes here]
@@ -2094,7 +2251,7 @@ elif st.session_state.page == "Update Forms":
     with tab_delete:
         st.subheader("Delete Existing Form")
         
-        forms_to_delete = get_all_forms()
+        forms_to_delete = accessible_forms(st.session_state.user, FORM_DELETE)
         if not forms_to_delete:
             st.info("There are no forms to delete.")
         else:
@@ -2133,6 +2290,9 @@ elif st.session_state.page == "Update Forms":
                     
                     # The delete button is only enabled if both checkboxes are checked.
                     if st.button("🗑️ Delete Form Permanently", type="primary", disabled=not (delete_confirm and export_confirm)):
+                        if not get_form_access(st.session_state.user, form_to_delete) & FORM_DELETE:
+                            st.error("You do not have permission to delete this form")
+                            st.stop()
                         # The delete_form function now returns a tuple (success, message)
                         success, message = delete_form(form_to_delete)
                         
@@ -2176,7 +2336,7 @@ elif st.session_state.page == "Update Forms":
         st.subheader("Establish Parent-Child Form Links")
         st.info("Here you can define which forms are children of other forms. For example, a 'Students' form can be a child of a 'Schools' form.")
 
-        all_forms = get_all_forms()
+        all_forms = accessible_forms(st.session_state.user, FORM_EDIT)
         if len(all_forms) < 2:
             st.warning("You need at least two forms to create a relationship.")
         else:
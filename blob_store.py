@@ -0,0 +1,141 @@
+# blob_store.py
+# Content-addressed storage for FILE field uploads.
+#
+# File bytes live on disk under BLOB_DIR, named by their SHA-256 and fanned
+# out over two directory levels (ab/cd/abcd...). The form row keeps only a
+# small JSON reference:
+#
+#     {"sha256": "...", "size": 1234, "mime_type": "application/pdf", "filename": "cv.pdf"}
+#
+# so loading a grid of submissions never reads attachment bytes. The same
+# file uploaded twice is stored once. Uploads are hashed while they are
+# copied to a temporary file in chunks and then renamed into place, so a
+# blob path either holds the complete file or does not exist; downloads are
+# read back in chunks as well.
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+from typing import Dict, Iterable, Iterator, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = os.getenv("BLOB_DIR", "blob_store")
+CHUNK_SIZE = 1024 * 1024  # bytes read or written at a time
+DEFAULT_MIME_TYPE = "application/octet-stream"
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_blob_ref(value) -> bool:
+    """True for a stored file reference (the dict kept in the form row)."""
+    return isinstance(value, dict) and isinstance(value.get("sha256"), str) and "size" in value
+
+
+def blob_path(sha256: str) -> str:
+    """Where the blob with this hash lives. Raises ValueError for anything but a SHA-256 hex digest."""
+    if not isinstance(sha256, str) or not SHA256_PATTERN.match(sha256):
+        raise ValueError("invalid blob hash")
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def blob_exists(sha256: str) -> bool:
+    try:
+        return os.path.isfile(blob_path(sha256))
+    except ValueError:
+        return False
+
+
+def put_stream(stream) -> Dict:
+    """
+    Copy a binary stream into the store. Returns {"sha256", "size"}; if a
+    blob with the same contents is already stored, the copy is discarded.
+    """
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        sha256 = digest.hexdigest()
+        path = blob_path(sha256)
+        if os.path.isfile(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {"sha256": sha256, "size": size}
+
+
+def put_bytes(data: bytes) -> Dict:
+    """put_stream() for bytes already in memory."""
+    return put_stream(io.BytesIO(bytes(data)))
+
+
+def put_upload(upload, filename: Optional[str] = None, mime_type: Optional[str] = None) -> Dict:
+    """
+    Store an uploaded file and return its reference. Accepts raw bytes, a
+    Streamlit UploadedFile or a werkzeug FileStorage.
+    """
+    if isinstance(upload, (bytes, bytearray, memoryview)):
+        ref = put_bytes(upload)
+    else:
+        filename = filename or getattr(upload, "filename", None) or getattr(upload, "name", None)
+        mime_type = mime_type or getattr(upload, "mimetype", None) or getattr(upload, "type", None)
+        stream = getattr(upload, "stream", upload)
+        if hasattr(stream, "seek"):
+            stream.seek(0)
+        ref = put_stream(stream)
+    if filename:
+        filename = os.path.basename(str(filename))
+    if not mime_type and filename:
+        mime_type = mimetypes.guess_type(filename)[0]
+    ref["mime_type"] = mime_type or DEFAULT_MIME_TYPE
+    ref["filename"] = filename or ref["sha256"][:12]
+    return ref
+
+
+def store_uploads(row: Dict, file_columns: Iterable[str]) -> Dict:
+    """Replace the uploads in a row's file columns with blob references (in place)."""
+    for column in file_columns:
+        value = row.get(column)
+        if value is None or is_blob_ref(value):
+            continue
+        row[column] = put_upload(value)
+    return row
+
+
+def iter_blob(sha256: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a blob's contents in chunks."""
+    with open(blob_path(sha256), "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def open_blob(sha256: str):
+    """Open a blob for reading (binary). Raises FileNotFoundError if it is not stored."""
+    return open(blob_path(sha256), "rb")
+
+
+def read_blob(sha256: str) -> bytes:
+    """A blob's whole contents, for callers that need them in memory."""
+    return b"".join(iter_blob(sha256))
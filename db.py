@@ -5,109 +5,722 @@ import streamlit as st
 from dotenv import load_dotenv
 import logging
 import json
-from typing import Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 import re
 import datetime
-from urllib.parse import urlparse
+import hashlib
+import hmac
+import importlib.util
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+from urllib.parse import urlencode, urlparse
 from streamlit.runtime.uploaded_file_manager import UploadedFile
+import blob_store
 # Set up logging
-logging.basicConfig(level=logging.INFO) 
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def get_connection():
-    return psycopg2.connect(
-        # dbname=os.getenv("DB_NAME", "form_generator"),
-        # user=os.getenv("DB_USER", "postgres"),
-        # password=os.getenv("DB_PASSWORD"),
-        # host=os.getenv("DB_HOST", "localhost"),
-        # port=os.getenv("DB_PORT", "5432")
-        dbname=st.secrets["database"]["DB_NAME"],
-        user=st.secrets["database"]["DB_USER"],
-        password=st.secrets["database"]["DB_PASSWORD"],
-        host=st.secrets["database"]["DB_HOST"],
-        port=st.secrets["database"]["DB_PORT"]
+# --- Connection pool ---
+# One pool per server process, shared by every Streamlit session and every
+# function in this module. Sizes and timeouts can be tuned in the [database]
+# section of secrets.toml (POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT,
+# POOL_HEALTH_CHECK_INTERVAL). POOL_MAX_SIZE caps the connections of the whole
+# process: when psycopg 3 is installed, ASYNC_POOL_MAX_SIZE of them (default
+# min(4, POOL_MAX_SIZE // 2)) go to db_async's pool and the rest to this one.
+
+class PoolTimeout(PoolError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe psycopg2 connection pool with a bounded size, checkout
+    timeouts, health checks on checkout and basic usage statistics.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float,
+                 health_check_interval: float = 30.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size must be <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at)
+        self._in_use = set()
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "failed_health_checks": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+        self._stats["connections_discarded"] += 1
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Check out a healthy connection, waiting up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn = None
+            idle_since = None
+            must_open = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("Connection pool is closed")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if len(self._in_use) + self._opening < self.max_size:
+                        self._opening += 1
+                        must_open = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"(pool max size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            if must_open:
+                try:
+                    conn = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is None:
+                            self._cond.notify()
+            elif not self._is_healthy(conn, idle_since):
+                with self._cond:
+                    self._stats["failed_health_checks"] += 1
+                    self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use.add(conn)
+                self._stats["checkouts"] += 1
+                self._stats["total_wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, discarding it if it is broken."""
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            elif len(self._idle) >= self.max_size:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self) -> Dict:
+        """Return a snapshot of pool usage."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+            })
+        checkouts = snapshot["checkouts"]
+        snapshot["avg_wait_seconds"] = snapshot["total_wait_seconds"] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+class PooledConnection:
+    """
+    Wraps a checked-out psycopg2 connection so that `with get_connection() as conn:`
+    keeps its usual commit/rollback behaviour and then hands the connection back
+    to the pool. Calls made on the wrapper after it has been released (e.g. a
+    rollback in an outer `except` block) are ignored.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn
+        if conn is None:
+            return False
+        discard = False
+        try:
+            conn.__exit__(exc_type, exc, tb)
+        except psycopg2.Error:
+            discard = True
+            raise
+        finally:
+            self._conn = None
+            self._pool.putconn(conn, discard=discard or conn.closed)
+        return False
+
+    def commit(self):
+        if self._conn is not None:
+            self._conn.commit()
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        """Release the connection back to the pool."""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_db_settings() -> Dict:
+    """Connection keyword arguments (dbname, user, ...) from the app secrets."""
+    db_secrets = st.secrets["database"]
+    return {
+        "dbname": db_secrets["DB_NAME"],
+        "user": db_secrets["DB_USER"],
+        "password": db_secrets["DB_PASSWORD"],
+        "host": db_secrets["DB_HOST"],
+        "port": db_secrets["DB_PORT"],
+    }
+
+def get_pool_sizes() -> Dict[str, int]:
+    """
+    Split the POOL_MAX_SIZE connection budget between the psycopg2 pool
+    ("max_size") and db_async's pool ("async_max_size", 0 without psycopg 3).
+    """
+    db_secrets = st.secrets["database"]
+    total = max(int(db_secrets.get("POOL_MAX_SIZE", 10)), 1)
+    async_max = 0
+    if importlib.util.find_spec("psycopg_pool") is not None:
+        # By default as many as run_concurrently would use, so fanned-out
+        # reads (call_many) still run side by side
+        default = min(FANOUT_MAX_WORKERS, total // 2)
+        async_max = min(max(int(db_secrets.get("ASYNC_POOL_MAX_SIZE", default)), 1), total - 1)
+    min_size = int(db_secrets.get("POOL_MIN_SIZE", 1))
+    return {
+        "min_size": min(min_size, total - async_max),
+        "max_size": total - async_max,
+        "async_min_size": min(min_size, async_max),
+        "async_max_size": async_max,
+    }
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db_secrets = st.secrets["database"]
+                sizes = get_pool_sizes()
+                _pool = ConnectionPool(
+                    min_size=sizes["min_size"],
+                    max_size=sizes["max_size"],
+                    timeout=float(db_secrets.get("POOL_TIMEOUT", 10)),
+                    health_check_interval=float(db_secrets.get("POOL_HEALTH_CHECK_INTERVAL", 30)),
+                    **get_db_settings()
+                )
+                logger.info(f"Created database connection pool (min={_pool.min_size}, max={_pool.max_size})")
+    return _pool
+
+def get_connection() -> PooledConnection:
+    """Check out a connection from the shared pool. Use it as a context manager."""
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+def get_pool_stats() -> Dict:
+    """Return in-use/idle counts and wait-time statistics for the shared pool."""
+    return get_pool().stats()
+
+# Independent reads (e.g. the Admin View's related-record panels) are fanned
+# out on a small shared thread pool. It is capped at half the connection pool
+# so a burst of panel loads cannot starve ordinary requests of connections.
+FANOUT_MAX_WORKERS = 4
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_lock:
+            if _fanout_executor is None:
+                workers = max(1, min(FANOUT_MAX_WORKERS, get_pool().max_size // 2))
+                _fanout_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-fanout")
+    return _fanout_executor
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """
+    Run independent zero-argument callables concurrently, each on its own
+    pooled connection, and return their results keyed like `tasks` once all
+    have finished. A task that raises has its exception as its result, so
+    one failing panel does not hide the others.
+    """
+    if not tasks:
+        return {}
+    executor = _get_fanout_executor()
+    futures = {key: executor.submit(task) for key, task in tasks.items()}
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            logger.error(f"Concurrent load '{key}' failed: {e}")
+            results[key] = e
+    return results
+
+# Base tables. 'users' comes first because 'forms' references it.
+BASE_SCHEMA_COMMANDS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        role VARCHAR(50) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS forms (
+        id SERIAL PRIMARY KEY,
+        form_name VARCHAR(255) UNIQUE NOT NULL,
+        fields JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_by INTEGER,
+        FOREIGN KEY (created_by) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS form_permissions (
+        id SERIAL PRIMARY KEY,
+        form_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        can_view BOOLEAN DEFAULT FALSE,
+        can_edit BOOLEAN DEFAULT FALSE,
+        can_delete BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (form_id) REFERENCES forms(id),
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        UNIQUE(form_id, user_id)
     )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS roles (
+        name VARCHAR(50) PRIMARY KEY,
+        permissions TEXT[] NOT NULL
+    )
+    """,
+    # Insert default roles
+    """
+    INSERT INTO roles (name, permissions) 
+    VALUES 
+        ('admin', ARRAY['create', 'edit', 'delete', 'view_all', 'admin']),
+        ('editor', ARRAY['create', 'edit', 'view']),
+        ('viewer', ARRAY['view'])
+    ON CONFLICT (name) DO NOTHING
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS child_relationships (
+        id SERIAL PRIMARY KEY,
+        parent_id INTEGER NOT NULL,
+        child_form1 VARCHAR(255) NOT NULL,
+        record_id1 INTEGER NOT NULL,
+        child_form2 VARCHAR(255) NOT NULL,
+        record_id2 INTEGER NOT NULL,
+        relationship_type VARCHAR(50) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    ALTER TABLE forms ADD COLUMN IF NOT EXISTS share_token VARCHAR(255) UNIQUE;
+    """
+]
 
 def initialize_database():
     """Initialize database with required tables"""
-    commands = [
-        """
-        CREATE TABLE IF NOT EXISTS forms (
-            id SERIAL PRIMARY KEY,
-            form_name VARCHAR(255) UNIQUE NOT NULL,
-            fields JSONB NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY (created_by) REFERENCES users(id)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(255) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            role VARCHAR(50) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS form_permissions (
-            id SERIAL PRIMARY KEY,
-            form_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            can_view BOOLEAN DEFAULT FALSE,
-            can_edit BOOLEAN DEFAULT FALSE,
-            can_delete BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (form_id) REFERENCES forms(id),
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(form_id, user_id)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS roles (
-            name VARCHAR(50) PRIMARY KEY,
-            permissions TEXT[] NOT NULL
-        )
-        """,
-        # Insert default roles
-        """
-        INSERT INTO roles (name, permissions) 
-        VALUES 
-            ('admin', ARRAY['create', 'edit', 'delete', 'view_all', 'admin']),
-            ('editor', ARRAY['create', 'edit', 'view']),
-            ('viewer', ARRAY['view'])
-        ON CONFLICT (name) DO NOTHING
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS child_relationships (
-            id SERIAL PRIMARY KEY,
-            parent_id INTEGER NOT NULL,
-            child_form1 VARCHAR(255) NOT NULL,
-            record_id1 INTEGER NOT NULL,
-            child_form2 VARCHAR(255) NOT NULL,
-            record_id2 INTEGER NOT NULL,
-            relationship_type VARCHAR(50) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        ALTER TABLE forms ADD COLUMN IF NOT EXISTS share_token VARCHAR(255) UNIQUE;
-        """
-    ]
-    
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                for command in commands:
+                for command in BASE_SCHEMA_COMMANDS:
                     cur.execute(command)
                 conn.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
+
+# --- Versioned schema migrations ---
+# Each step runs once per database and is recorded in schema_version. The runner
+# itself runs once per server process: the first caller applies any pending
+# steps under a Postgres advisory lock, every later call returns immediately.
+# To change the schema, append a new step with the next version number.
+
+SCHEMA_LOCK_KEY = 7240501  # Arbitrary application-wide advisory lock id
+SCHEMA_MIGRATIONS = []  # (version, description, function(cursor))
+
+def schema_migration(version: int, description: str):
+    """Register a migration step. Versions must be unique and never reused."""
+    def decorator(func):
+        if any(v == version for v, _, _ in SCHEMA_MIGRATIONS):
+            raise ValueError(f"Duplicate schema migration version: {version}")
+        SCHEMA_MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+@schema_migration(1, "Base tables")
+def _migration_base_tables(cur):
+    for command in BASE_SCHEMA_COMMANDS:
+        cur.execute(command)
+
+@schema_migration(2, "Default users")
+def _migration_default_users(cur):
+    _insert_default_users(cur)
+
+@schema_migration(3, "Submission keys on existing form tables")
+def _migration_submission_keys(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM forms f
+        JOIN pg_class c ON c.relname = lower(replace(f.form_name, ' ', '_')) AND c.relkind = 'r'
+        JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = 'public'
+    """)
+    for (table_name,) in cur.fetchall():
+        _ensure_submission_key(cur, table_name)
+
+@schema_migration(4, "Indexes on child_relationships and form tables")
+def _migration_indexes(cur):
+    cur.execute(CHILD_RELATIONSHIPS_INDEX_SQL)
+    cur.execute("""
+        SELECT c.relname, f.fields
+        FROM forms f
+        JOIN pg_class c ON c.relname = lower(replace(f.form_name, ' ', '_')) AND c.relkind = 'r'
+        JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = 'public'
+    """)
+    for table_name, fields in cur.fetchall():
+        _ensure_standard_indexes(cur, table_name)
+        _sync_field_indexes(cur, table_name, fields)
+
+USER_SESSIONS_SCHEMA_COMMANDS = [
+    """
+    CREATE TABLE IF NOT EXISTS user_sessions (
+        session_hash CHAR(64) PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS user_sessions_user_id_idx ON user_sessions (user_id)",
+    "CREATE INDEX IF NOT EXISTS user_sessions_expires_at_idx ON user_sessions (expires_at)",
+]
+
+@schema_migration(5, "Login sessions")
+def _migration_user_sessions(cur):
+    for command in USER_SESSIONS_SCHEMA_COMMANDS:
+        cur.execute(command)
+
+@schema_migration(6, "Index form_permissions by user")
+def _migration_form_permissions_user_index(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS form_permissions_user_id_idx ON form_permissions (user_id, form_id)")
+
+@schema_migration(7, "Move FILE columns into the blob store")
+def _migration_file_blobs(cur):
+    # Existing BYTEA file columns are copied out to blob_store and replaced by
+    # JSONB references. Rows are read through a server-side cursor so a large
+    # table is never held in memory at once.
+    cur.execute("""
+        SELECT c.table_name, c.column_name
+        FROM forms f
+        JOIN information_schema.columns c
+          ON c.table_name = lower(replace(f.form_name, ' ', '_'))
+         AND c.table_schema = 'public'
+         AND c.data_type = 'bytea'
+        ORDER BY c.table_name, c.ordinal_position
+    """)
+    for table_name, column in cur.fetchall():
+        new_column = f"{column}__blob"
+        cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS "{new_column}" JSONB')
+        with cur.connection.cursor(name=f"file_blobs_{table_name}_{column}"[:63]) as rows:
+            rows.itersize = 100
+            rows.execute(f'SELECT id, "{column}" FROM "{table_name}" WHERE "{column}" IS NOT NULL')
+            for record_id, data in rows:
+                ref = blob_store.put_upload(bytes(data))
+                cur.execute(
+                    f'UPDATE "{table_name}" SET "{new_column}" = %s WHERE id = %s',
+                    (json.dumps(ref), record_id)
+                )
+        cur.execute(f'ALTER TABLE "{table_name}" DROP COLUMN "{column}"')
+        cur.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{new_column}" TO "{column}"')
+        logger.info(f"Moved {table_name}.{column} into the blob store")
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def run_migrations() -> List[int]:
+    """
+    Bring the database schema up to date. Safe to call on every rerun: after the
+    first successful call in this process it does nothing.
+    Returns the versions applied by this call.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return []
+    with _schema_lock:
+        if _schema_ready:
+            return []
+        applied_now = []
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_KEY,))
+                try:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cur.execute("SELECT version FROM schema_version")
+                    applied = {row[0] for row in cur.fetchall()}
+                    conn.commit()
+
+                    for version, description, step in sorted(SCHEMA_MIGRATIONS, key=lambda m: m[0]):
+                        if version in applied:
+                            continue
+                        try:
+                            step(cur)
+                            cur.execute(
+                                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                                (version, description)
+                            )
+                            conn.commit()
+                        except Exception as e:
+                            conn.rollback()
+                            logger.error(f"Schema migration {version} ({description}) failed: {e}")
+                            raise
+                        applied_now.append(version)
+                        logger.info(f"Applied schema migration {version}: {description}")
+                finally:
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_KEY,))
+                    conn.commit()
+        _schema_ready = True
+        if not applied_now:
+            logger.info("Database schema is up to date")
+        return applied_now
+
+# --- Schema catalog cache ---
+# Column definitions of form tables and the forms.fields JSON are cached per
+# process. Every function that changes them publishes an invalidation: it is
+# applied locally right away and broadcast with NOTIFY on CATALOG_CHANNEL so
+# that other server processes drop their copies too. Payloads look like
+# "<kind>:<value>", e.g. "table:students" or "form:Students".
+
+CATALOG_CHANNEL = "form_catalog"
+_catalog_lock = threading.RLock()
+_table_columns_cache: Dict[str, tuple] = {}  # table -> ((name, data_type, is_nullable), ...)
+_form_fields_cache: Dict[str, Optional[str]] = {}  # form name -> fields JSON text (None if missing)
+_invalidation_handlers: Dict[str, List] = {}
+_catalog_listener_started = False
+_NOT_CACHED = object()
+_catalog_generation = 0  # Bumped on every invalidation; guards against caching stale reads
+
+def register_invalidation_handler(kind: str, handler) -> None:
+    """Call handler(value) whenever a '<kind>:<value>' invalidation is published."""
+    with _catalog_lock:
+        _invalidation_handlers.setdefault(kind, []).append(handler)
+
+def _apply_invalidation(kind: str, value: str = "") -> None:
+    if kind == "all":
+        handlers = [h for hs in _invalidation_handlers.values() for h in hs]
+        value = ""
+    else:
+        handlers = list(_invalidation_handlers.get(kind, []))
+    for handler in handlers:
+        try:
+            handler(value)
+        except Exception as e:
+            logger.error(f"Invalidation handler for '{kind}' failed: {e}")
+
+def publish_invalidation(conn, kind: str, value: str = "") -> None:
+    """
+    Invalidate cached metadata in this process and notify other processes.
+    Call after the change has been committed on `conn`.
+    """
+    _apply_invalidation(kind, value)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s)", (CATALOG_CHANNEL, f"{kind}:{value}"))
+        conn.commit()
+    except psycopg2.Error as e:
+        logger.warning(f"Could not broadcast '{kind}' invalidation: {e}")
+        conn.rollback()
+
+def _invalidate_table_columns(table_name: str) -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        if table_name:
+            _table_columns_cache.pop(table_name, None)
+        else:
+            _table_columns_cache.clear()
+
+def _invalidate_form_fields(form_name: str) -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        if form_name:
+            _form_fields_cache.pop(form_name, None)
+        else:
+            _form_fields_cache.clear()
+
+register_invalidation_handler("table", _invalidate_table_columns)
+register_invalidation_handler("form", _invalidate_form_fields)
+
+def _catalog_listener_loop(connect_kwargs: Dict) -> None:
+    """LISTEN for invalidations from other processes; reconnects on failure."""
+    import select
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**connect_kwargs)
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+            # Anything may have changed while we were not listening
+            _apply_invalidation("all")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    kind, _, value = notify.payload.partition(":")
+                    _apply_invalidation(kind, value)
+        except Exception as e:
+            logger.warning(f"Catalog listener disconnected: {e}")
+            _apply_invalidation("all")
+            time.sleep(5)
+        finally:
+            if conn is not None and not conn.closed:
+                conn.close()
+
+def _ensure_catalog_listener() -> None:
+    global _catalog_listener_started
+    if _catalog_listener_started:
+        return
+    with _catalog_lock:
+        if _catalog_listener_started:
+            return
+        _catalog_listener_started = True
+    threading.Thread(
+        target=_catalog_listener_loop,
+        args=(get_db_settings(),),
+        name="catalog-listener",
+        daemon=True
+    ).start()
+
+def get_table_columns(table_name: str) -> List[tuple]:
+    """
+    Return (column_name, data_type, is_nullable) for every column of a table,
+    in ordinal order, from the catalog cache. An empty list means the table
+    does not exist.
+    """
+    _ensure_catalog_listener()
+    columns = _table_columns_cache.get(table_name)
+    if columns is None:
+        generation = _catalog_generation
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT column_name, data_type, is_nullable
+                    FROM information_schema.columns
+                    WHERE table_name = %s
+                    ORDER BY ordinal_position
+                """, (table_name,))
+                columns = tuple(
+                    (name, data_type, is_nullable == 'YES')
+                    for name, data_type, is_nullable in cur.fetchall()
+                )
+        with _catalog_lock:
+            if generation == _catalog_generation:
+                _table_columns_cache[table_name] = columns
+    return list(columns)
+
+def get_table_column_names(table_name: str) -> set:
+    """Return the set of column names of a table from the catalog cache."""
+    return {name for name, _, _ in get_table_columns(table_name)}
 # In db.py
 
 # <<< --- ADD THIS NEW HELPER FUNCTION --- >>>
@@ -182,53 +795,112 @@ def delete_child_relationships(relationship_ids: List[int]) -> bool:
 
 # <<< --- ADD THESE TWO NEW FUNCTIONS TO db.py --- >>>
 
+# --- Form relationship index ---
+# Parent/child links between form tables are read from pg_catalog in a single
+# query and kept in memory, keyed by both form name and table name. The index
+# is dropped whenever a "table" or "form" invalidation is published (see the
+# catalog cache above) and rebuilt on the next read.
+
+_relationship_index = None
+_relationship_lock = threading.Lock()
+
+def _build_relationship_index() -> Dict:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH tables AS (
+                    SELECT c.oid, c.relname
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+                )
+                SELECT
+                    f.form_name,
+                    COALESCE(t.relname, lower(replace(f.form_name, ' ', '_'))) AS table_name,
+                    t.oid IS NOT NULL AS table_exists,
+                    pa.attnum IS NOT NULL AS has_parent_id,
+                    parent.relname AS parent_table
+                FROM forms f
+                FULL OUTER JOIN tables t ON t.relname = lower(replace(f.form_name, ' ', '_'))
+                LEFT JOIN pg_attribute pa
+                    ON pa.attrelid = t.oid AND pa.attname = 'parent_id' AND NOT pa.attisdropped
+                LEFT JOIN pg_constraint con
+                    ON con.conrelid = t.oid AND con.contype = 'f' AND con.conkey = ARRAY[pa.attnum]
+                LEFT JOIN pg_class parent ON parent.oid = con.confrelid
+                ORDER BY table_name, con.conname
+            """)
+            rows = cur.fetchall()
+
+    index = {
+        "form_to_table": {},   # form name -> table name
+        "table_to_form": {},   # table name -> form name
+        "tables": set(),       # tables that exist
+        "has_parent_id": set(),
+        "parents": {},         # child table -> [parent tables]
+        "children": {},        # parent table -> [child tables]
+    }
+    for form_name, table_name, table_exists, has_parent_id, parent_table in rows:
+        if form_name:
+            index["form_to_table"][form_name] = table_name
+            index["table_to_form"].setdefault(table_name, form_name)
+        if table_exists:
+            index["tables"].add(table_name)
+        if has_parent_id:
+            index["has_parent_id"].add(table_name)
+        if parent_table:
+            parents = index["parents"].setdefault(table_name, [])
+            if parent_table not in parents:
+                parents.append(parent_table)
+            children = index["children"].setdefault(parent_table, [])
+            if table_name not in children:
+                children.append(table_name)
+    return index
+
+def _get_relationship_index() -> Dict:
+    global _relationship_index
+    _ensure_catalog_listener()
+    index = _relationship_index
+    if index is None:
+        with _relationship_lock:
+            index = _relationship_index
+            if index is None:
+                generation = _catalog_generation
+                index = _build_relationship_index()
+                if generation == _catalog_generation:
+                    _relationship_index = index
+    return index
+
+def _invalidate_relationship_index(_value: str = "") -> None:
+    global _relationship_index
+    _relationship_index = None
+
+register_invalidation_handler("table", _invalidate_relationship_index)
+register_invalidation_handler("form", _invalidate_relationship_index)
+
+def _resolve_table_name(index: Dict, name: str) -> str:
+    """Accept either a form name or a table name and return the table name."""
+    return index["form_to_table"].get(name) or name.replace(" ", "_").lower()
+
 def get_foreign_key_info() -> List[Dict]:
     """
     A diagnostic function to check the parent-child link status for all forms.
     """
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Get all forms and their sanitized table names
-                cur.execute("SELECT form_name, lower(replace(form_name, ' ', '_')) FROM forms")
-                forms = {row[1]: row[0] for row in cur.fetchall()} # {sanitized_name: original_name}
-                
-                # Get all foreign key constraints in the public schema
-                cur.execute("""
-                    SELECT
-                        tc.table_name,
-                        ccu.table_name AS foreign_table_name
-                    FROM
-                        information_schema.table_constraints AS tc
-                    JOIN information_schema.constraint_column_usage AS ccu
-                        ON ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
-                    WHERE tc.constraint_type = 'FOREIGN KEY'
-                """)
-                # {child_table: parent_table}
-                links = {row[0]: row[1] for row in cur.fetchall()}
-
-                # Check if each table has a parent_id column
-                cur.execute("""
-                    SELECT table_name
-                    FROM information_schema.columns
-                    WHERE column_name = 'parent_id'
-                """)
-                tables_with_parent_id = {row[0] for row in cur.fetchall()}
-
-                # Now, build the health report
-                report = []
-                for sanitized_name, original_name in forms.items():
-                    info = {'form_name': original_name, 'sanitized_name': sanitized_name, 'status': 'Parent'}
-                    if sanitized_name in tables_with_parent_id:
-                        if sanitized_name in links:
-                            parent_sanitized = links[sanitized_name]
-                            info['status'] = 'OK'
-                            info['linked_to'] = forms.get(parent_sanitized, parent_sanitized)
-                        else:
-                            info['status'] = 'Broken Link'
-                            info['linked_to'] = 'None'
-                    report.append(info)
-                return report
+        index = _get_relationship_index()
+        # Now, build the health report
+        report = []
+        for original_name, sanitized_name in index["form_to_table"].items():
+            info = {'form_name': original_name, 'sanitized_name': sanitized_name, 'status': 'Parent'}
+            if sanitized_name in index["has_parent_id"]:
+                if sanitized_name in index["parents"]:
+                    parent_sanitized = index["parents"][sanitized_name][0]
+                    info['status'] = 'OK'
+                    info['linked_to'] = index["table_to_form"].get(parent_sanitized, parent_sanitized)
+                else:
+                    info['status'] = 'Broken Link'
+                    info['linked_to'] = 'None'
+            report.append(info)
+        return report
     except Exception as e:
         logger.error(f"Error getting foreign key info: {e}")
         return []
@@ -256,6 +928,7 @@ def repair_foreign_key(child_form_name: str, parent_form_name: str) -> bool:
                     ON DELETE CASCADE
                 """)
                 conn.commit()
+                publish_invalidation(conn, "table", child_table)
                 logger.info(f"Successfully repaired foreign key for '{child_table}' to '{parent_table}'")
                 return True
     except Exception as e:
@@ -280,6 +953,34 @@ def get_child_records(child_form: str, parent_id: int) -> List[Dict]:
         logger.error(f"Error getting child records: {str(e)}")
         return []
 
+def get_child_records_for_parents(child_form: str, parent_ids: List[int]) -> List[Dict]:
+    """Get the records of a child form that belong to any of `parent_ids`."""
+    if not parent_ids:
+        return []
+    table_name = child_form.replace(" ", "_").lower()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f'SELECT * FROM "{table_name}" WHERE parent_id = ANY(%s) ORDER BY id',
+                (list(parent_ids),)
+            )
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def get_records_by_ids(form_name: str, record_ids: List[int]) -> List[Dict]:
+    """Get the records of a form whose id is in `record_ids`."""
+    if not record_ids:
+        return []
+    table_name = form_name.replace(" ", "_").lower()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f'SELECT * FROM "{table_name}" WHERE id = ANY(%s) ORDER BY id',
+                (list(record_ids),)
+            )
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
 # ... (keep all your other existing functions in db.py)
 def save_form_metadata(form_name, fields) -> int:
     """Save form metadata and return the form ID"""
@@ -296,6 +997,7 @@ def save_form_metadata(form_name, fields) -> int:
                 if result:
                     form_id = result[0]
                     conn.commit()
+                    publish_invalidation(conn, "form", form_name)
                     return form_id
                 else:
                     logger.error("No ID returned after INSERT")
@@ -372,10 +1074,221 @@ def is_empty_submission(data: dict) -> bool:
         elif v is not None and not isinstance(v, (str, list, dict)):
             return False
     return True
-def save_form_data(form_name: str, form_data: dict) -> bool:
+# Every form table carries a unique submission_key column. The UI generates a
+# key when it renders a form, so a re-sent submission hits ON CONFLICT DO
+# NOTHING instead of creating a duplicate row.
+SUBMISSION_KEY_COLUMN = "submission_key"
+
+def _ensure_submission_key(cur, table_name: str) -> None:
+    cur.execute(f'''
+        ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS "{SUBMISSION_KEY_COLUMN}" VARCHAR(64)
+    ''')
+    cur.execute(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_{SUBMISSION_KEY_COLUMN}_key"
+        ON "{table_name}" ("{SUBMISSION_KEY_COLUMN}")
+    ''')
+
+def ensure_submission_key_column(table_name: str) -> bool:
+    """Add the submission_key column and its unique index to an existing form table."""
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                _ensure_submission_key(cur, table_name)
+                conn.commit()
+                publish_invalidation(conn, "table", table_name)
+                return True
+    except Exception as e:
+        logger.error(f"Error adding submission key to {table_name}: {e}")
+        return False
+
+# --- Index management ---
+# Form tables get btree indexes on parent_id (child lookups and the ON DELETE
+# actions of parent foreign keys) and on (created_at, id) (keyset pages
+# ordered by created_at). Fields flagged "indexed" in the form definition get
+# an index suited to their filter kind; those are named <table>_<column>_field_idx
+# so they can be told apart from the standard ones and dropped when undeclared.
+
+STANDARD_INDEXES = {
+    "parent_id": ("parent_id",),
+    "created_at": ("created_at", "id"),
+}
+FIELD_INDEX_SUFFIX = "_field_idx"
+CHILD_RELATIONSHIPS_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS child_relationships_parent_id_idx
+    ON child_relationships (parent_id)
+"""
+
+def _index_name(table_name: str, column: str, suffix: str = "_idx") -> str:
+    """Index name for a column, shortened with a hash to fit Postgres' 63-byte limit."""
+    name = f"{table_name}_{column}{suffix}"
+    if len(name) > 63:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f"{name[:63 - len(suffix) - 9]}_{digest}{suffix}"
+    return name
+
+def _column_types(cur, table_name: str) -> Dict[str, str]:
+    cur.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+    """, (table_name,))
+    return dict(cur.fetchall())
+
+def _ensure_standard_indexes(cur, table_name: str) -> List[str]:
+    """Create the parent_id and created_at indexes a form table is missing."""
+    columns = _column_types(cur, table_name)
+    names = []
+    for column, key in STANDARD_INDEXES.items():
+        if all(c in columns for c in key):
+            name = _index_name(table_name, column)
+            key_sql = ", ".join(f'"{c}"' for c in key)
+            cur.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({key_sql})')
+            names.append(name)
+    return names
+
+def _field_index_sql(table_name: str, column: str, kind: str, data_type: str) -> str:
+    name = _index_name(table_name, column, FIELD_INDEX_SUFFIX)
+    if kind == "overlap":
+        # Array containment/overlap (&&) needs GIN
+        return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" USING GIN ("{column}")'
+    if kind == "prefix":
+        # LIKE 'abc%' can only use a btree built with the pattern operator class
+        opclass = "varchar_pattern_ops" if data_type == "character varying" else "text_pattern_ops"
+        return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ("{column}" {opclass})'
+    return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ("{column}")'
+
+def _drop_field_index(cur, table_name: str, column: str) -> None:
+    cur.execute(f'DROP INDEX IF EXISTS "{_index_name(table_name, column, FIELD_INDEX_SUFFIX)}"')
+
+def _sync_field_indexes(cur, table_name: str, fields: Optional[List[Dict]]) -> List[str]:
+    """
+    Make the table's field indexes match the fields flagged "indexed":
+    create the missing ones and drop the ones no longer declared.
+    """
+    columns = _column_types(cur, table_name)
+    wanted = {}
+    for field in fields or []:
+        if not field.get("indexed"):
+            continue
+        column = field["name"].replace(" ", "_").lower()
+        if column in columns:
+            kind = FILTER_KINDS.get(str(field.get("type", "")).upper(), "in")
+            wanted[_index_name(table_name, column, FIELD_INDEX_SUFFIX)] = (column, kind)
+
+    cur.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = 'public' AND tablename = %s AND indexname LIKE %s
+    """, (table_name, f"%{FIELD_INDEX_SUFFIX}"))
+    existing = {row[0] for row in cur.fetchall()}
+
+    for name in existing - wanted.keys():
+        cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+    for name, (column, kind) in wanted.items():
+        if name not in existing:
+            cur.execute(_field_index_sql(table_name, column, kind, columns[column]))
+    return sorted(wanted)
+
+def ensure_form_indexes(form_name: str, fields: Optional[List[Dict]] = None) -> bool:
+    """Create the standard indexes of a form table and sync its declared field indexes."""
     table_name = form_name.replace(" ", "_").lower()
-    
-    # Enhanced data processing
+    try:
+        if fields is None:
+            fields = get_form_fields(form_name)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                _ensure_standard_indexes(cur, table_name)
+                _sync_field_indexes(cur, table_name, fields)
+                conn.commit()
+                return True
+    except Exception as e:
+        logger.error(f"Error ensuring indexes for {table_name}: {e}")
+        return False
+
+def ensure_all_indexes() -> List[str]:
+    """Run ensure_form_indexes for every form; returns the forms that failed."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CHILD_RELATIONSHIPS_INDEX_SQL)
+            conn.commit()
+    return [form_name for form_name in get_all_forms() if not ensure_form_indexes(form_name)]
+
+def get_index_report() -> Dict[str, List[Dict]]:
+    """
+    Index health for form tables and child_relationships:
+
+      indexes  every index with its scan count and size; "unused" marks
+               non-unique indexes never scanned since statistics were reset
+      tables   sequential vs index scans per table
+      missing  parent_id/created_at columns and "indexed" fields that have
+               no index starting with them
+    """
+    report = {"indexes": [], "tables": [], "missing": []}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT form_name, fields FROM forms")
+            forms = cur.fetchall()
+            form_tables = [form_name.replace(" ", "_").lower() for form_name, _ in forms]
+            tables = form_tables + ["child_relationships"]
+
+            cur.execute("""
+                SELECT s.relname, s.indexrelname, s.idx_scan,
+                       pg_relation_size(s.indexrelid), i.indisunique, i.indisprimary
+                FROM pg_stat_user_indexes s
+                JOIN pg_index i ON i.indexrelid = s.indexrelid
+                WHERE s.schemaname = 'public' AND s.relname = ANY(%s)
+                ORDER BY s.relname, s.indexrelname
+            """, (tables,))
+            for table, index, scans, size, unique, primary in cur.fetchall():
+                report["indexes"].append({
+                    "table": table,
+                    "index": index,
+                    "scans": scans,
+                    "size_bytes": size,
+                    "unique": unique or primary,
+                    "unused": scans == 0 and not (unique or primary),
+                })
+
+            cur.execute("""
+                SELECT relname, seq_scan, seq_tup_read, idx_scan, n_live_tup
+                FROM pg_stat_user_tables
+                WHERE schemaname = 'public' AND relname = ANY(%s)
+                ORDER BY seq_tup_read DESC
+            """, (tables,))
+            for table, seq_scan, seq_tup_read, idx_scan, live_rows in cur.fetchall():
+                report["tables"].append({
+                    "table": table,
+                    "seq_scans": seq_scan,
+                    "rows_seq_read": seq_tup_read,
+                    "index_scans": idx_scan or 0,
+                    "live_rows": live_rows,
+                })
+
+            wanted = [(table, column, "standard") for table in form_tables for column in STANDARD_INDEXES]
+            wanted.append(("child_relationships", "parent_id", "standard"))
+            for (form_name, fields), table in zip(forms, form_tables):
+                for field in fields or []:
+                    if field.get("indexed"):
+                        wanted.append((table, field["name"].replace(" ", "_").lower(), "declared on field"))
+
+            cur.execute("""
+                SELECT t.relname, a.attname,
+                       EXISTS (
+                           SELECT 1 FROM pg_index i
+                           WHERE i.indrelid = t.oid AND i.indkey[0] = a.attnum
+                       )
+                FROM pg_class t
+                JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = 'public'
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum > 0 AND NOT a.attisdropped
+                WHERE t.relkind = 'r' AND t.relname = ANY(%s)
+            """, (tables,))
+            indexed = {(table, column): has_index for table, column, has_index in cur.fetchall()}
+
+    for table, column, reason in wanted:
+        if indexed.get((table, column)) is False:
+            report["missing"].append({"table": table, "column": column, "reason": reason})
+    return report
+
+def _clean_form_row(form_data: dict) -> dict:
+    """Normalize column names and convert values to formats Postgres accepts."""
     clean_data = {}
     for k, v in form_data.items():
         # Skip empty values
@@ -392,8 +1305,32 @@ def save_form_data(form_name: str, form_data: dict) -> bool:
         elif isinstance(v, bool):
             # Convert boolean to PostgreSQL compatible format
             clean_data[k.replace(" ", "_").lower()] = 'true' if v else 'false'
+        elif isinstance(v, dict):
+            # JSONB values, e.g. blob_store file references
+            clean_data[k.replace(" ", "_").lower()] = json.dumps(v)
         else:
             clean_data[k.replace(" ", "_").lower()] = v
+    return clean_data
+
+# Public submission paths hand submissions to the write-behind journal
+# (submission_buffer) instead of inserting them while the respondent waits.
+SUBMISSION_WRITE_BEHIND = os.getenv("SUBMISSION_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+
+def save_form_data(form_name: str, form_data: dict, submission_key: Optional[str] = None,
+                   write_behind: bool = False) -> bool:
+    """
+    Insert one submission. When a submission_key is given, re-sending the same
+    key is a no-op that still returns True. With write_behind=True the
+    submission is journaled locally and inserted by a background flusher;
+    True then means it is safely on disk.
+    """
+    if write_behind:
+        import submission_buffer
+        return submission_buffer.enqueue(form_name, form_data, submission_key)
+    table_name = form_name.replace(" ", "_").lower()
+    
+    # Enhanced data processing
+    clean_data = _clean_form_row(form_data)
     
     if not clean_data:
         logger.warning("No valid data to save - skipping")
@@ -402,6 +1339,12 @@ def save_form_data(form_name: str, form_data: dict) -> bool:
     # Remove 'id' field if present
     if 'id' in clean_data:
         del clean_data['id']
+
+    if submission_key:
+        clean_data[SUBMISSION_KEY_COLUMN] = submission_key
+        # Tables created before submission keys existed get the column on first use
+        if SUBMISSION_KEY_COLUMN not in get_table_column_names(table_name):
+            ensure_submission_key_column(table_name)
     
     try:
         with get_connection() as conn:
@@ -415,11 +1358,15 @@ def save_form_data(form_name: str, form_data: dict) -> bool:
                     ({", ".join(columns)})
                     VALUES ({placeholders})
                 """
+                if submission_key:
+                    query += f' ON CONFLICT ("{SUBMISSION_KEY_COLUMN}") DO NOTHING'
                 
                 # Convert values to tuple for execution
                 values = tuple(clean_data.values())
                 cur.execute(query, values)
                 conn.commit()
+                if submission_key and cur.rowcount == 0:
+                    logger.info(f"Duplicate submission {submission_key} for {table_name} ignored")
                 return True
                 
     except Exception as e:
@@ -428,6 +1375,128 @@ def save_form_data(form_name: str, form_data: dict) -> bool:
             conn.rollback()
         return False
 
+BULK_INSERT_CHUNK_SIZE = 1000
+
+def insert_rows(cur, table_name: str, rows: List[dict], on_conflict_key: bool) -> int:
+    """
+    Insert cleaned rows with multi-row VALUES statements, one per distinct
+    column set. Returns the number of rows actually inserted.
+    """
+    groups: Dict[tuple, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+
+    inserted = 0
+    for columns, values in groups.items():
+        column_sql = ", ".join(f'"{col}"' for col in columns)
+        query = f'INSERT INTO "{table_name}" ({column_sql}) VALUES %s'
+        if on_conflict_key and SUBMISSION_KEY_COLUMN in columns:
+            query += f' ON CONFLICT ("{SUBMISSION_KEY_COLUMN}") DO NOTHING'
+        query += " RETURNING 1"
+        inserted += len(execute_values(cur, query, values, page_size=len(values), fetch=True))
+    return inserted
+
+def save_form_data_bulk(form_name: str, rows: List[dict], chunk_size: int = BULK_INSERT_CHUNK_SIZE) -> Dict:
+    """
+    Insert many submissions in one transaction using multi-row INSERTs.
+
+    Values are cleaned exactly like save_form_data. Each chunk runs under a
+    savepoint; if a chunk fails it is retried row by row so only the bad rows
+    are rejected. Rows carrying a submission_key that already exists are
+    skipped as duplicates.
+
+    Returns a report: inserted, duplicates, rejected (row index, error, row),
+    per-chunk timings and overall rows per second.
+    """
+    table_name = form_name.replace(" ", "_").lower()
+    started = time.perf_counter()
+    report = {
+        "inserted": 0,
+        "duplicates": 0,
+        "rejected": [],
+        "chunks": [],
+        "seconds": 0.0,
+        "rows_per_second": 0.0,
+    }
+
+    table_columns = get_table_column_names(table_name)
+    if not table_columns:
+        report["error"] = f"Table {table_name} does not exist"
+        return report
+
+    prepared = []
+    for index, row in enumerate(rows):
+        clean = _clean_form_row(row)
+        clean.pop('id', None)
+        if not clean:
+            report["rejected"].append({"index": index, "error": "No valid data", "row": row})
+            continue
+        if clean.get(SUBMISSION_KEY_COLUMN) and SUBMISSION_KEY_COLUMN not in table_columns:
+            ensure_submission_key_column(table_name)
+            table_columns = get_table_column_names(table_name)
+        unknown = set(clean) - table_columns
+        if unknown:
+            report["rejected"].append({
+                "index": index,
+                "error": f"Unknown columns: {', '.join(sorted(unknown))}",
+                "row": row
+            })
+            continue
+        prepared.append((index, clean))
+
+    on_conflict_key = SUBMISSION_KEY_COLUMN in table_columns
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for start in range(0, len(prepared), chunk_size):
+                    chunk = prepared[start:start + chunk_size]
+                    chunk_started = time.perf_counter()
+                    chunk_rejected = 0
+                    cur.execute("SAVEPOINT bulk_chunk")
+                    try:
+                        inserted = insert_rows(cur, table_name, [clean for _, clean in chunk], on_conflict_key)
+                        cur.execute("RELEASE SAVEPOINT bulk_chunk")
+                    except psycopg2.Error:
+                        cur.execute("ROLLBACK TO SAVEPOINT bulk_chunk")
+                        # Retry row by row to isolate the rows Postgres rejects
+                        inserted = 0
+                        for index, clean in chunk:
+                            cur.execute("SAVEPOINT bulk_row")
+                            try:
+                                inserted += insert_rows(cur, table_name, [clean], on_conflict_key)
+                                cur.execute("RELEASE SAVEPOINT bulk_row")
+                            except psycopg2.Error as e:
+                                cur.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                                chunk_rejected += 1
+                                report["rejected"].append({
+                                    "index": index,
+                                    "error": str(e).strip(),
+                                    "row": rows[index]
+                                })
+                    report["inserted"] += inserted
+                    report["duplicates"] += len(chunk) - chunk_rejected - inserted
+                    report["chunks"].append({
+                        "rows": len(chunk),
+                        "inserted": inserted,
+                        "rejected": chunk_rejected,
+                        "seconds": time.perf_counter() - chunk_started
+                    })
+                conn.commit()
+    except Exception as e:
+        logger.error(f"Bulk save failed for {table_name}: {str(e)}")
+        report["error"] = str(e)
+        report["inserted"] = 0
+        report["duplicates"] = 0
+
+    report["seconds"] = time.perf_counter() - started
+    if report["seconds"] > 0:
+        report["rows_per_second"] = report["inserted"] / report["seconds"]
+    logger.info(
+        f"Bulk insert into {table_name}: {report['inserted']} inserted, "
+        f"{len(report['rejected'])} rejected in {report['seconds']:.2f}s"
+    )
+    return report
+
 def delete_records(form_name: str, record_ids: List[int]) -> bool:
     """Delete multiple records from a form table"""
     table_name = form_name.replace(" ", "_").lower()
@@ -474,77 +1543,89 @@ def get_all_forms():
 def validate_against_schema(form_name: str, data: dict) -> bool:
     """Validate data against database schema"""
     table_name = form_name.replace(" ", "_").lower()
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            # Get required columns
-            cur.execute("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_name = %s AND is_nullable = 'NO'
-            """, (table_name,))
-            required_columns = {row[0]: row[1] for row in cur.fetchall() if row[0] != 'id'}
-            
-            # Check required fields
-            errors = []
-            for col, col_type in required_columns.items():
-                if col not in data or data[col] is None:
-                    errors.append(f"Missing required field: {col}")
-            
-            if errors:
-                st.error("\n".join(errors))
-                return False
-            return True
+    # Get required columns
+    required_columns = {
+        name: data_type for name, data_type, nullable in get_table_columns(table_name)
+        if not nullable and name != 'id'
+    }
+
+    # Check required fields
+    errors = []
+    for col, col_type in required_columns.items():
+        if col not in data or data[col] is None:
+            errors.append(f"Missing required field: {col}")
+
+    if errors:
+        st.error("\n".join(errors))
+        return False
+    return True
 
 def inspect_table(form_name: str):
     """Inspect table schema"""
     table_name = form_name.replace(" ", "_").lower()
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT column_name, data_type, is_nullable 
-                FROM information_schema.columns 
-                WHERE table_name = %s
-                ORDER BY ordinal_position
-            """, (table_name,))
-            return cur.fetchall()
+    return [
+        (name, data_type, 'YES' if nullable else 'NO')
+        for name, data_type, nullable in get_table_columns(table_name)
+    ]
+def lookup_form_fields(form_name: str) -> tuple[bool, Optional[List[Dict]], int]:
+    """
+    Look a form's fields up in the catalog cache without touching the database.
+
+    Returns (found, fields, generation). On a miss, pass `generation` back to
+    remember_form_fields() together with the fields read from the database so
+    a concurrent invalidation is not overwritten by the stale read.
+    """
+    _ensure_catalog_listener()
+    generation = _catalog_generation
+    fields_json = _form_fields_cache.get(form_name, _NOT_CACHED)
+    if fields_json is _NOT_CACHED:
+        return False, None, generation
+    # Hand out a fresh copy so callers can edit it without touching the cache
+    return True, (json.loads(fields_json) if fields_json is not None else None), generation
+
+def remember_form_fields(form_name: str, fields: Optional[List[Dict]], generation: int):
+    """Cache fields read from the database after a lookup_form_fields() miss."""
+    fields_json = json.dumps(fields) if fields is not None else None
+    with _catalog_lock:
+        if generation == _catalog_generation:
+            _form_fields_cache[form_name] = fields_json
+
 def get_form_fields(form_name):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT fields FROM forms WHERE form_name = %s",
-                (form_name,)
-            )
-            result = cur.fetchone()
-            return result[0] if result else None
+    """Return the form's field definitions (served from the catalog cache)."""
+    found, fields, generation = lookup_form_fields(form_name)
+    if not found:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT fields FROM forms WHERE form_name = %s",
+                    (form_name,)
+                )
+                result = cur.fetchone()
+        fields = result[0] if result else None
+        remember_form_fields(form_name, fields, generation)
+    return fields
 
 def verify_table_columns(form_name: str, fields: List[Dict]) -> bool:
     """Verify that all required columns exist in the table"""
     table_name = form_name.replace(" ", "_").lower()
     
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Get existing columns
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = %s
-                """, (table_name,))
-                existing_columns = {row[0] for row in cur.fetchall()}
-                
-                # Check required columns
-                required_columns = {'id', 'created_at'}
-                for field in fields:
-                    field_name = field["name"].replace(" ", "_").lower()
-                    required_columns.add(field_name)
-                
-                # Check for missing columns
-                missing_columns = required_columns - existing_columns
-                if missing_columns:
-                    logger.warning(f"Missing columns in {table_name}: {missing_columns}")
-                    return False
-                
-                return True
+        # Get existing columns
+        existing_columns = get_table_column_names(table_name)
+
+        # Check required columns
+        required_columns = {'id', 'created_at'}
+        for field in fields:
+            field_name = field["name"].replace(" ", "_").lower()
+            required_columns.add(field_name)
+
+        # Check for missing columns
+        missing_columns = required_columns - existing_columns
+        if missing_columns:
+            logger.warning(f"Missing columns in {table_name}: {missing_columns}")
+            return False
+
+        return True
     except Exception as e:
         logger.error(f"Error verifying table columns: {e}")
         return False
@@ -554,16 +1635,10 @@ def repair_table_columns(form_name: str, fields: List[Dict]) -> bool:
     table_name = form_name.replace(" ", "_").lower()
     
     try:
+        # Get existing columns
+        existing_columns = get_table_column_names(table_name)
         with get_connection() as conn:
             with conn.cursor() as cur:
-                # Get existing columns
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = %s
-                """, (table_name,))
-                existing_columns = {row[0] for row in cur.fetchall()}
-                
                 # Add missing columns
                 for field in fields:
                     field_name = field["name"].replace(" ", "_").lower()
@@ -582,10 +1657,11 @@ def repair_table_columns(form_name: str, fields: List[Dict]) -> bool:
                             continue
                 
                 conn.commit()
+                publish_invalidation(conn, "table", table_name)
                 return True
     except Exception as e:
         logger.error(f"Error repairing table columns: {e}")
-        if conn:
+        if 'conn' in locals():
             conn.rollback()
         return False
 def get_form_data(form_name):
@@ -605,6 +1681,268 @@ def get_form_data(form_name):
                         row_dict[col] = row[i]
                 results.append(row_dict)
             return results
+PAGE_ORDER_COLUMNS = ("id", "created_at")
+
+def build_form_page_query(form_name: str, after_id: Optional[Union[int, tuple]] = None, limit: int = 100,
+                          order: str = "id", filters: Optional[Dict] = None,
+                          descending: bool = False) -> tuple[str, List]:
+    """Build the (query, params) for one keyset page; see get_form_data_page()."""
+    table_name = form_name.replace(" ", "_").lower()
+    if order not in PAGE_ORDER_COLUMNS:
+        raise ValueError(f"Unsupported page order: {order}")
+    comparison = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+
+    conditions, params = compile_filters(form_name, filters)
+
+    if after_id is not None:
+        if order == "id":
+            conditions.append(f"id {comparison} %s")
+            params.append(after_id)
+        else:
+            # The cursor carries the last row's (created_at, id), so it still
+            # works after that row is deleted. NULL created_at values sort
+            # last ascending and first descending, as Postgres orders them.
+            after_created_at, after_row_id = after_id
+            if after_created_at is None:
+                conditions.append(
+                    f"((created_at IS NULL AND id {comparison} %s)"
+                    + (" OR created_at IS NOT NULL)" if descending else ")")
+                )
+                params.append(after_row_id)
+            else:
+                conditions.append(
+                    f"((created_at, id) {comparison} (%s, %s)"
+                    + (")" if descending else " OR created_at IS NULL)")
+                )
+                params += [after_created_at, after_row_id]
+
+    order_sql = f"id {direction}" if order == "id" else f"created_at {direction}, id {direction}"
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f'SELECT * FROM "{table_name}" {where_sql} ORDER BY {order_sql} LIMIT %s'
+    params.append(limit + 1)
+    return query, params
+
+def paginate_rows(rows: List[Dict], limit: int, order: str = "id") -> Dict:
+    """Trim the limit+1 rows fetched by a page query into a page dict."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_after_id = None
+    if has_more and rows:
+        last = rows[-1]
+        next_after_id = last["id"] if order == "id" else (last.get("created_at"), last["id"])
+    return {
+        "rows": rows,
+        "next_after_id": next_after_id,
+        "has_more": has_more,
+    }
+
+def get_form_data_page(form_name: str, after_id: Optional[Union[int, tuple]] = None, limit: int = 100,
+                       order: str = "id", filters: Optional[Dict] = None,
+                       descending: bool = False) -> Dict:
+    """
+    Fetch one page of submissions using keyset pagination.
+
+    Pages are ordered by `order` ("id" or "created_at", ties broken by id) and
+    continue after the cursor `after_id`, so every page costs the same
+    regardless of how far into the table it is. The cursor is the last row's
+    id for "id" order and its (created_at, id) pair for "created_at" order;
+    pass back the "next_after_id" of the previous page. `filters` is a
+    selection dict as understood by compile_filters().
+
+    Returns {"rows": [...], "next_after_id": cursor or None, "has_more": bool}.
+    """
+    query, params = build_form_page_query(form_name, after_id, limit, order, filters, descending)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            column_names = [desc[0] for desc in cur.description]
+            rows = [dict(zip(column_names, row)) for row in cur.fetchall()]
+    return paginate_rows(rows, limit, order)
+FILTER_KINDS = {
+    "SELECT": "in",
+    "RADIO": "in",
+    "BOOLEAN": "in",
+    "INTEGER": "range",
+    "FLOAT": "range",
+    "RANGE": "range",
+    "DATE": "range",
+    "DATETIME": "range",
+    "TEXT": "prefix",
+    "TEXTAREA": "prefix",
+    "VARCHAR(255)": "prefix",
+    "EMAIL": "prefix",
+    "PHONE": "prefix",
+    "URL": "prefix",
+    "MULTISELECT": "overlap",
+}
+FILTER_DISTINCT_LIMIT = 200
+
+def get_filter_specs(form_name: str) -> List[Dict]:
+    """
+    Describe the filters a form supports, derived from its field metadata.
+
+    Each spec is {"column", "label", "type", "kind"} where kind is one of
+    "in" (pick values), "range" (min/max bounds), "prefix" (starts with) or
+    "overlap" (array shares any value). Fields whose column is missing from
+    the table, or whose type cannot be filtered, are left out.
+    """
+    table_name = form_name.replace(" ", "_").lower()
+    columns = get_table_column_names(table_name)
+    specs = []
+    for field in get_form_fields(form_name) or []:
+        field_type = str(field.get("type", "")).upper()
+        kind = FILTER_KINDS.get(field_type)
+        column = field["name"].replace(" ", "_").lower()
+        if kind and column in columns:
+            specs.append({"column": column, "label": field["name"], "type": field_type, "kind": kind})
+    return specs
+
+def get_filter_domains(form_name: str, specs: List[Dict],
+                       max_values: int = FILTER_DISTINCT_LIMIT) -> Dict[str, Dict]:
+    """
+    Compute the choices for each filter in a single aggregate query.
+
+    "in" and "overlap" specs get {"values": [...]} (at most max_values distinct
+    non-null values), "range" specs get {"min": ..., "max": ...}. "prefix"
+    specs need no domain and are omitted.
+    """
+    table_name = form_name.replace(" ", "_").lower()
+    selects = []
+    keys = []
+    for spec in specs:
+        column = spec["column"]
+        if spec["kind"] == "range":
+            selects += [f'MIN("{column}")', f'MAX("{column}")']
+            keys += [(column, "min"), (column, "max")]
+        elif spec["kind"] == "in":
+            selects.append(
+                f'ARRAY(SELECT DISTINCT "{column}" FROM "{table_name}" '
+                f'WHERE "{column}" IS NOT NULL ORDER BY 1 LIMIT {int(max_values)})'
+            )
+            keys.append((column, "values"))
+        elif spec["kind"] == "overlap":
+            selects.append(
+                f'ARRAY(SELECT DISTINCT v FROM "{table_name}", unnest("{column}") AS v '
+                f'WHERE v IS NOT NULL ORDER BY 1 LIMIT {int(max_values)})'
+            )
+            keys.append((column, "values"))
+    if not selects:
+        return {}
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                # MIN/MAX make the query aggregate over the table; without them
+                # the ARRAY subqueries read it themselves and one row is enough
+                has_range = any(spec["kind"] == "range" for spec in specs)
+                cur.execute(f'SELECT {", ".join(selects)}' + (f' FROM "{table_name}"' if has_range else ''))
+                row = cur.fetchone()
+    except Exception as e:
+        logger.error(f"Error computing filter domains for {form_name}: {e}")
+        return {}
+    if row is None:
+        return {}
+
+    domains = {}
+    for (column, key), value in zip(keys, row):
+        domains.setdefault(column, {})[key] = list(value) if key == "values" else value
+    return domains
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def compile_filters(form_name: str, selections: Optional[Dict]) -> tuple[List[str], List]:
+    """
+    Turn filter selections into parameterised WHERE conditions.
+
+    `selections` maps column names to the chosen value; how the value is read
+    depends on the column's filter kind (see get_filter_specs):
+
+      in       list of allowed values (a scalar means equality)
+      range    (low, high) tuple, either end may be None (a scalar means equality)
+      prefix   string the column must start with
+      overlap  list of values, any of which the array column must contain
+               (a scalar means that one value)
+
+    Columns without a field spec (id, parent_id, created_at, ...) accept a
+    scalar for equality or a (low, high) tuple. Empty selections are ignored.
+    Returns (conditions, params) ready to be joined with AND.
+    """
+    if not selections:
+        return [], []
+    table_name = form_name.replace(" ", "_").lower()
+    columns = get_table_column_names(table_name)
+    kinds = {spec["column"]: spec["kind"] for spec in get_filter_specs(form_name)}
+
+    conditions = []
+    params = []
+    for column, value in selections.items():
+        if column not in columns:
+            raise ValueError(f"Unknown column for filter: {column}")
+        if value is None or value == "" or value == [] or value == ():
+            continue
+        kind = kinds.get(column)
+        if kind is None:
+            kind = "range" if isinstance(value, tuple) else "in"
+
+        if kind == "range":
+            if isinstance(value, (list, tuple)):
+                if len(value) != 2:
+                    raise ValueError(f"Range filter for {column} needs (low, high), got {value!r}")
+                low, high = value
+            elif isinstance(value, (set, dict)):
+                raise ValueError(f"Range filter for {column} needs (low, high) or a single value, got {value!r}")
+            else:
+                low = high = value
+            if low is not None:
+                conditions.append(f'"{column}" >= %s')
+                params.append(low)
+            if high is not None:
+                conditions.append(f'"{column}" <= %s')
+                params.append(high)
+        elif kind == "prefix":
+            conditions.append(f'"{column}" LIKE %s')
+            params.append(_escape_like(str(value)) + "%")
+        elif kind == "overlap":
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+            conditions.append(f'"{column}" && %s::text[]')
+            params.append([str(v) for v in value])
+        elif isinstance(value, (list, tuple, set)):
+            conditions.append(f'"{column}" = ANY(%s)')
+            params.append(list(value))
+        else:
+            conditions.append(f'"{column}" = %s')
+            params.append(value)
+    return conditions, params
+
+def get_parent_options(child_form: str, parent_form: str,
+                       limit: int = FILTER_DISTINCT_LIMIT) -> List[Dict]:
+    """
+    List the parent records actually referenced by a child form's rows as
+    {'id', 'display'} dicts, for use as parent_id filter choices.
+    """
+    child_table = child_form.replace(" ", "_").lower()
+    parent_table = parent_form.replace(" ", "_").lower()
+    try:
+        columns = get_table_column_names(parent_table)
+        display_col = next(
+            (col for col in ('name', 'title', 'full_name', 'first_name') if col in columns),
+            'id'
+        )
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT p.id, p."{display_col}" FROM "{parent_table}" p
+                    WHERE p.id IN (SELECT DISTINCT parent_id FROM "{child_table}")
+                    ORDER BY p.id
+                    LIMIT %s
+                """, (limit,))
+                return [{'id': row[0], 'display': str(row[1])} for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Error getting parent options: {str(e)}")
+        return []
 # def get_form_data(form_name):
 #     sanitized_name = form_name.replace(" ", "_").lower()
 #     with get_connection() as conn:
@@ -624,6 +1962,7 @@ def add_parent_child_relationship(parent_form, child_form):
             cur.execute(
                 f"ALTER TABLE {sanitized_child} ADD COLUMN IF NOT EXISTS parent_id INTEGER"
             )
+            _ensure_standard_indexes(cur, sanitized_child)
             # Add foreign key constraint if not exists
             try:
                 cur.execute(
@@ -633,67 +1972,33 @@ def add_parent_child_relationship(parent_form, child_form):
             except Exception as e:
                 logger.warning(f"Constraint may already exist: {str(e)}")
             conn.commit()
+            publish_invalidation(conn, "table", sanitized_child)
 
 def get_child_forms(parent_form_name: str) -> List[str]:
     """
-    Correctly finds all child forms for a given parent form by looking up
-    the foreign key constraints that point to the parent's table.
+    Returns the names of all forms whose table has a parent_id foreign key
+    pointing to the given form's table. Accepts a form name or a table name.
     """
-    # Sanitize the parent form name to match the table name in the database.
-    parent_table_name = parent_form_name.replace(" ", "_").lower()
-    child_forms = []
-
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # This query inspects the database's internal schema to find
-                # tables (children) that have a foreign key referencing the parent table.
-                # ccu.table_name is the table being referenced (the parent).
-                # tc.table_name is the table that has the foreign key (the child).
-                cur.execute("""
-                    SELECT
-                        tc.table_name AS child_table_name
-                    FROM
-                        information_schema.table_constraints AS tc
-                    JOIN information_schema.constraint_column_usage AS ccu
-                        ON ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
-                    WHERE
-                        tc.constraint_type = 'FOREIGN KEY' AND ccu.table_name = %s
-                """, (parent_table_name,))
-
-                # This gives us a list of sanitized child table names (e.g., 'teachers_form').
-                child_table_names = [row[0] for row in cur.fetchall()]
-
-                if not child_table_names:
-                    return []
-
-                # Now, we must convert these database-friendly table names back into the
-                # "pretty" form names that the UI uses (e.g., 'Teachers Form').
-                # We use the provided helper function for this conversion.
-                for table_name in child_table_names:
-                    pretty_name = get_form_name_from_table_name(table_name, cur)
-                    if pretty_name:
-                        child_forms.append(pretty_name)
-
-                return child_forms
+        index = _get_relationship_index()
+        parent_table_name = _resolve_table_name(index, parent_form_name)
+        # Convert the child table names back into the "pretty" form names the UI uses
+        return [
+            index["table_to_form"][table_name]
+            for table_name in index["children"].get(parent_table_name, [])
+            if table_name in index["table_to_form"]
+        ]
     except Exception as e:
         logger.error(f"Error getting child forms for '{parent_form_name}': {str(e)}")
         return []
 def get_parent_forms(child_form):
     """Get all parent forms for a given child form"""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            sanitized_child = child_form.replace(" ", "_").lower()
-            cur.execute("""
-                SELECT ccu.table_name 
-                FROM information_schema.table_constraints tc
-                JOIN information_schema.constraint_column_usage ccu
-                ON tc.constraint_name = ccu.constraint_name
-                WHERE tc.table_name = %s
-                AND tc.constraint_type = 'FOREIGN KEY'
-                AND tc.constraint_name LIKE 'fk_parent_%%'
-            """, (sanitized_child,))
-            return [row[0].replace('_', ' ') for row in cur.fetchall()]
+    index = _get_relationship_index()
+    child_table = _resolve_table_name(index, child_form)
+    return [
+        index["table_to_form"].get(parent_table, parent_table.replace('_', ' '))
+        for parent_table in index["parents"].get(child_table, [])
+    ]
 # In db.py, find and replace the existing delete_form function
 
 def delete_form(form_name: str) -> tuple[bool, str]:
@@ -727,6 +2032,8 @@ def delete_form(form_name: str) -> tuple[bool, str]:
                     # If metadata is gone but table might exist (orphan table)
                     cur.execute(f"DROP TABLE IF EXISTS \"{sanitized_name}\"")
                     conn.commit()
+                    publish_invalidation(conn, "table", sanitized_name)
+                    publish_invalidation(conn, "form", form_name)
                     return (True, f"Form metadata for '{form_name}' was not found, but its data table (if it existed) was dropped.")
                 
                 form_id = result[0]
@@ -746,6 +2053,8 @@ def delete_form(form_name: str) -> tuple[bool, str]:
                 cur.execute(f"DROP TABLE IF EXISTS \"{sanitized_name}\"")
 
                 conn.commit()
+                publish_invalidation(conn, "table", sanitized_name)
+                publish_invalidation(conn, "form", form_name)
                 logger.info(f"Successfully deleted form '{form_name}', its table, and all related metadata.")
                 return (True, f"Form '{form_name}' was deleted successfully!")
 
@@ -782,7 +2091,7 @@ def get_sql_type(field_type: str) -> str:
         "EMAIL": "VARCHAR(255)",
         "URL": "VARCHAR(255)",
         "COLOR": "VARCHAR(7)",
-        "FILE": "BYTEA",
+        "FILE": "JSONB",  # blob_store reference; the bytes live outside the table
         "RANGE": "INTEGER"
     }
     return type_mapping.get(field_type.upper(), "VARCHAR(255)")
@@ -836,11 +2145,140 @@ def set_form_permission(form_id: int, user_id: int, can_view: bool, can_edit: bo
                     (form_id, user_id, can_view, can_edit, can_delete)
                 )
                 conn.commit()
+                publish_invalidation(conn, "permissions", str(user_id))
                 return True
     except Exception as e:
         logger.error(f"Error setting form permissions: {str(e)}")
         return False
 
+# --- Form permissions ---
+# Access to a form is a bitset of FORM_VIEW | FORM_EDIT | FORM_DELETE. A
+# form_permissions row for (form, user) decides it; without one the user's
+# role decides (see role_form_access), and roles with "view_all" see
+# everything. Form pickers use accessible_forms(), which resolves the list
+# with one join; single-form checks (get_form_access, before deleting records
+# or forms and saving form changes) load the user's rows in one query into
+# {form name: bits} on first use. Both
+# are kept per process; set_form_permission publishes "permissions:<user id>"
+# and form changes publish "form:...", which drop the affected entries in
+# every process.
+FORM_VIEW, FORM_EDIT, FORM_DELETE = 1, 2, 4
+FORM_ALL_ACCESS = FORM_VIEW | FORM_EDIT | FORM_DELETE
+# "update_forms" opens the Update Forms page, whose Delete tab has always let
+# its holders delete forms, so it carries the delete bit.
+_ROLE_ACCESS_BITS = {
+    "view": FORM_VIEW,
+    "edit": FORM_EDIT,
+    "delete": FORM_DELETE,
+    "update_forms": FORM_EDIT | FORM_DELETE,
+}
+_permission_matrix_cache: Dict[int, Dict[str, int]] = {}  # user id -> {form name: bits}
+_accessible_forms_cache: Dict[tuple, List[str]] = {}  # (user id, default bits, needed bits) -> form names
+
+_ACCESS_BITS_SQL = """
+    (CASE WHEN p.can_view THEN 1 ELSE 0 END
+     | CASE WHEN p.can_edit THEN 2 ELSE 0 END
+     | CASE WHEN p.can_delete THEN 4 ELSE 0 END)
+"""
+
+def role_form_access(permissions: List[str]) -> int:
+    """Access bits a role grants on forms without a form_permissions row."""
+    if "view_all" in permissions:
+        return FORM_ALL_ACCESS
+    bits = 0
+    for permission in permissions:
+        bits |= _ROLE_ACCESS_BITS.get(permission, 0)
+    return bits
+
+def _invalidate_permissions(value: str) -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        if not value:
+            _permission_matrix_cache.clear()
+            _accessible_forms_cache.clear()
+            return
+        user_id = int(value)
+        _permission_matrix_cache.pop(user_id, None)
+        for key in [key for key in _accessible_forms_cache if key[0] == user_id]:
+            del _accessible_forms_cache[key]
+
+def _invalidate_form_lists(_value: str = "") -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        _accessible_forms_cache.clear()
+        _permission_matrix_cache.clear()  # keyed by form name
+
+register_invalidation_handler("permissions", _invalidate_permissions)
+register_invalidation_handler("form", _invalidate_form_lists)
+
+def load_permission_matrix(user_id: int) -> Dict[str, int]:
+    """Return {form name: access bits} for every form_permissions row of the user (cached)."""
+    _ensure_catalog_listener()
+    with _catalog_lock:
+        generation = _catalog_generation
+        matrix = _permission_matrix_cache.get(user_id)
+    if matrix is None:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT f.form_name, {_ACCESS_BITS_SQL}
+                    FROM form_permissions p
+                    JOIN forms f ON f.id = p.form_id
+                    WHERE p.user_id = %s
+                """, (user_id,))
+                matrix = dict(cur.fetchall())
+        with _catalog_lock:
+            if generation == _catalog_generation:
+                _permission_matrix_cache[user_id] = matrix
+    return matrix
+
+def get_form_access(user: Optional[Dict], form_name: str) -> int:
+    """Access bits the user has on one form."""
+    if not user:
+        return 0
+    permissions = user.get("permissions", [])
+    if "view_all" in permissions:
+        return FORM_ALL_ACCESS
+    return load_permission_matrix(user["id"]).get(form_name, role_form_access(permissions))
+
+def accessible_forms(user: Optional[Dict], needed: int = FORM_VIEW) -> List[str]:
+    """
+    Names of the forms the user holds all `needed` bits on, sorted, resolved
+    with one query joining forms and form_permissions (cached per user).
+    """
+    if not user:
+        return []
+    permissions = user.get("permissions", [])
+    if "view_all" in permissions:
+        default, user_id = FORM_ALL_ACCESS, None
+    else:
+        default, user_id = role_form_access(permissions), user["id"]
+    key = (user_id, default, needed)
+    _ensure_catalog_listener()
+    with _catalog_lock:
+        generation = _catalog_generation
+        names = _accessible_forms_cache.get(key)
+    if names is None:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                if user_id is None:
+                    cur.execute("SELECT form_name FROM forms ORDER BY form_name")
+                else:
+                    cur.execute(f"""
+                        SELECT f.form_name
+                        FROM forms f
+                        LEFT JOIN form_permissions p ON p.form_id = f.id AND p.user_id = %s
+                        WHERE (CASE WHEN p.id IS NULL THEN %s ELSE {_ACCESS_BITS_SQL} END) & %s = %s
+                        ORDER BY f.form_name
+                    """, (user_id, default, needed, needed))
+                names = [row[0] for row in cur.fetchall()]
+        with _catalog_lock:
+            if generation == _catalog_generation:
+                _accessible_forms_cache[key] = names
+    return list(names)
+
 def get_form_permissions(form_id: int, user_id: int) -> Dict:
     """Get permissions for a user on a specific form"""
     with get_connection() as conn:
@@ -872,25 +2310,28 @@ def get_all_users() -> List[Dict[str, any]]:
             columns = [desc[0] for desc in cur.description]
             return [dict(zip(columns, row)) for row in cur.fetchall()]
         
+_DEFAULT_USER_ROWS = [
+    ("admin", "admin123", "admin"),
+    ("editor", "editor123", "editor"),
+    ("viewer", "viewer123", "viewer")
+]
+
+def _insert_default_users(cur):
+    for username, password, role in _DEFAULT_USER_ROWS:
+        # Check if user exists
+        cur.execute("SELECT 1 FROM users WHERE username = %s", (username,))
+        if not cur.fetchone():
+            # Insert new user
+            cur.execute(
+                "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
+                (username, password, role)
+            )
+
 def initialize_default_users():
     """Create default users if they don't exist"""
-    default_users = [
-        ("admin", "admin123", "admin"),
-        ("editor", "editor123", "editor"),
-        ("viewer", "viewer123", "viewer")
-    ]
-    
     with get_connection() as conn:
         with conn.cursor() as cur:
-            for username, password, role in default_users:
-                # Check if user exists
-                cur.execute("SELECT 1 FROM users WHERE username = %s", (username,))
-                if not cur.fetchone():
-                    # Insert new user
-                    cur.execute(
-                        "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
-                        (username, password, role)
-                    )
+            _insert_default_users(cur)
             conn.commit()
 
 
@@ -1012,7 +2453,10 @@ def update_user_role(username: str, new_role: str) -> bool:
                     (new_role, username)
                 )
                 conn.commit()
-                return cur.rowcount > 0
+                updated = cur.rowcount > 0
+                if updated:
+                    publish_invalidation(conn, "session", username)
+                return updated
     except Exception as e:
         logger.error(f"Role update failed: {str(e)}")
         return False
@@ -1022,12 +2466,16 @@ def delete_user(username: str) -> bool:
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
+                # Sessions go with the user (ON DELETE CASCADE)
                 cur.execute(
                     "DELETE FROM users WHERE username = %s",
                     (username,)
                 )
                 conn.commit()
-                return cur.rowcount > 0
+                deleted = cur.rowcount > 0
+                if deleted:
+                    publish_invalidation(conn, "session", username)
+                return deleted
     except Exception as e:
         logger.error(f"Delete failed: {str(e)}")
         return False
@@ -1040,12 +2488,197 @@ def reset_user_password(username: str, new_password: str) -> bool:
                 cur.execute(
                     "UPDATE users SET password_hash = %s WHERE username = %s",
                     (password_hash, username))
+                updated = cur.rowcount > 0
+                # A new password signs the user out everywhere
+                cur.execute("""
+                    DELETE FROM user_sessions
+                    WHERE user_id = (SELECT id FROM users WHERE username = %s)
+                """, (username,))
                 conn.commit()
-                return cur.rowcount > 0
+                if updated:
+                    publish_invalidation(conn, "session", username)
+                return updated
     except Exception as e:
         logger.error(f"Password reset error: {str(e)}")
         return False
 
+# --- Login sessions ---
+# A successful login creates a row in user_sessions and hands the browser a
+# signed token "<session id>.<HMAC>". Only the SHA-256 of the session id is
+# stored. Tokens with a bad signature are rejected without a query, and
+# resolved sessions are cached per process for SESSION_CACHE_TTL seconds, so
+# a page load costs neither a password hash nor, usually, a database read.
+# Logout, password resets, role changes and user deletion publish a
+# "session" invalidation so every process drops its cached copy.
+SESSION_COOKIE = "form_generator_session"
+SESSION_TTL = int(os.getenv("SESSION_TTL", 12 * 3600))  # seconds
+# The cookie is written from the page (Streamlit cannot send Set-Cookie), so it
+# cannot be HttpOnly; mark it Secure unless the app is served over plain HTTP.
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "true").lower() in ("1", "true", "yes")
+SESSION_CACHE_TTL = 60  # seconds
+SESSION_CACHE_SIZE = 1024
+_session_cache: "OrderedDict[str, tuple]" = OrderedDict()  # session hash -> (expires_at, user or None)
+_session_secret_value: Optional[bytes] = None
+
+def _configured_session_secret() -> Optional[str]:
+    secret = os.getenv("SESSION_SECRET")
+    try:
+        secret = st.secrets.get("auth", {}).get("SESSION_SECRET", secret)
+    except Exception:
+        pass
+    return secret or None
+
+def session_secret_configured() -> bool:
+    """True when SESSION_SECRET is set, so every process signs with the same key."""
+    return _configured_session_secret() is not None
+
+def _session_secret() -> bytes:
+    global _session_secret_value
+    if _session_secret_value is None:
+        secret = _configured_session_secret()
+        if not secret:
+            logger.warning("SESSION_SECRET is not set; login sessions will not survive a restart "
+                           "and signed file download links are disabled")
+            secret = secrets.token_hex(32)
+        _session_secret_value = secret.encode("utf-8")
+    return _session_secret_value
+
+def _sign_session_id(session_id: str) -> str:
+    return hmac.new(_session_secret(), session_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+FILE_LINK_TTL = 3600  # seconds a signed file download link stays valid
+
+def sign_file_download(sha256: str, expires_at: int, filename: str = "", mime_type: str = "") -> str:
+    """Signature for a time-limited file download link (see share_server)."""
+    message = f"file\0{sha256}\0{int(expires_at)}\0{filename}\0{mime_type}"
+    return hmac.new(_session_secret(), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def file_download_url(ref: Dict, base_url: str, expires_in: int = FILE_LINK_TTL) -> str:
+    """
+    A signed, expiring link to a stored file (a blob_store reference) on the
+    share server. The expiry is rounded up to a multiple of expires_in so the
+    link stays the same across reruns; it is valid for at least expires_in
+    seconds. The share server only accepts it if both processes share
+    SESSION_SECRET (see session_secret_configured).
+    """
+    expires_at = (int(time.time()) // expires_in + 2) * expires_in
+    filename = ref.get("filename") or ""
+    mime_type = ref.get("mime_type") or blob_store.DEFAULT_MIME_TYPE
+    query = urlencode({
+        "name": filename,
+        "type": mime_type,
+        "expires": expires_at,
+        "sig": sign_file_download(ref["sha256"], expires_at, filename, mime_type),
+    })
+    return f"{base_url.rstrip('/')}/files/{ref['sha256']}?{query}"
+
+def verify_file_download(sha256: str, expires_at, filename: str, mime_type: str, signature: str) -> bool:
+    """True if the link was signed by sign_file_download() and has not expired."""
+    try:
+        expires_at = int(expires_at)
+    except (TypeError, ValueError):
+        return False
+    if expires_at < time.time():
+        return False
+    expected = sign_file_download(sha256, expires_at, filename, mime_type)
+    return hmac.compare_digest(str(signature or ""), expected)
+
+def _session_hash(token: str) -> Optional[str]:
+    """SHA-256 of the token's session id, or None if the signature does not match."""
+    session_id, _, signature = (token or "").partition(".")
+    if not session_id or not hmac.compare_digest(signature, _sign_session_id(session_id)):
+        return None
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+def _invalidate_sessions(value: str) -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        if not value:
+            _session_cache.clear()
+            return
+        # value is a session hash (logout) or a username (account changes)
+        stale = [
+            session_hash for session_hash, (_, user) in _session_cache.items()
+            if session_hash == value or (user is not None and user["username"] == value)
+        ]
+        for session_hash in stale:
+            del _session_cache[session_hash]
+
+register_invalidation_handler("session", _invalidate_sessions)
+
+def create_user_session(user_id: int) -> Optional[str]:
+    """Start a login session for the user and return its signed token."""
+    session_id = secrets.token_urlsafe(32)
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM user_sessions WHERE user_id = %s AND expires_at <= CURRENT_TIMESTAMP",
+                    (user_id,)
+                )
+                cur.execute("""
+                    INSERT INTO user_sessions (session_hash, user_id, expires_at)
+                    VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                """, (hashlib.sha256(session_id.encode("utf-8")).hexdigest(), user_id, SESSION_TTL))
+                conn.commit()
+        return f"{session_id}.{_sign_session_id(session_id)}"
+    except Exception as e:
+        logger.error(f"Error creating login session: {str(e)}")
+        return None
+
+def resolve_user_session(token: str) -> Optional[Dict]:
+    """Return {"id", "username", "role"} for a valid, unexpired session token, else None."""
+    session_hash = _session_hash(token)
+    if session_hash is None:
+        return None
+    _ensure_catalog_listener()
+    now = time.monotonic()
+    with _catalog_lock:
+        generation = _catalog_generation
+        entry = _session_cache.get(session_hash)
+        if entry is not None and entry[0] > now:
+            _session_cache.move_to_end(session_hash)
+            return dict(entry[1]) if entry[1] is not None else None
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT u.id, u.username, u.role,
+                           EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP)
+                    FROM user_sessions s
+                    JOIN users u ON u.id = s.user_id
+                    WHERE s.session_hash = %s AND s.expires_at > CURRENT_TIMESTAMP
+                """, (session_hash,))
+                result = cur.fetchone()
+    except Exception as e:
+        logger.error(f"Error resolving login session: {str(e)}")
+        return None
+    user = {"id": result[0], "username": result[1], "role": result[2]} if result else None
+    lifetime = min(SESSION_CACHE_TTL, float(result[3])) if result else SESSION_CACHE_TTL
+    with _catalog_lock:
+        if generation == _catalog_generation:
+            _session_cache[session_hash] = (now + lifetime, user)
+            while len(_session_cache) > SESSION_CACHE_SIZE:
+                _session_cache.popitem(last=False)
+    return dict(user) if user is not None else None
+
+def revoke_user_session(token: str) -> bool:
+    """End a login session (logout)."""
+    session_hash = _session_hash(token)
+    if session_hash is None:
+        return False
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM user_sessions WHERE session_hash = %s", (session_hash,))
+                conn.commit()
+                publish_invalidation(conn, "session", session_hash)
+                return True
+    except Exception as e:
+        logger.error(f"Error revoking login session: {str(e)}")
+        return False
+
 def create_dynamic_table(form_name: str, fields: List[Dict]) -> bool:
     """Create a new table for form data with dynamic schema"""
     try:
@@ -1056,7 +2689,8 @@ def create_dynamic_table(form_name: str, fields: List[Dict]) -> bool:
                 # Start with basic columns
                 columns = [
                     "id SERIAL PRIMARY KEY",
-                    "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+                    "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+                    f"{SUBMISSION_KEY_COLUMN} VARCHAR(64) UNIQUE"
                 ]
                 
                 # Add form fields with appropriate data types
@@ -1094,8 +2728,12 @@ def create_dynamic_table(form_name: str, fields: List[Dict]) -> bool:
                         except Exception as e:
                             logger.warning(f"Could not set NOT NULL on {field_name}: {e}")
                             continue
+
+                _ensure_standard_indexes(cur, table_name)
+                _sync_field_indexes(cur, table_name, fields)
                 
                 conn.commit()
+                publish_invalidation(conn, "table", table_name)
                 return True
                 
     except Exception as e:
@@ -1114,6 +2752,7 @@ def update_form_metadata(form_name: str, fields: List[Dict]) -> bool:
                     WHERE form_name = %s
                 """, (json.dumps(fields), form_name))
                 conn.commit()
+                publish_invalidation(conn, "form", form_name)
                 return True
     except Exception as e:
         print(f"Error updating form metadata: {e}")
@@ -1125,16 +2764,11 @@ def update_dynamic_table(form_name: str, new_fields: List[Dict], old_fields: Lis
     try:
         table_name = form_name.replace(" ", "_").lower()
         
+        # Get current columns
+        existing_columns = get_table_column_names(table_name)
+
         with get_connection() as conn:
             with conn.cursor() as cur:
-                # Get current columns
-                cur.execute(f"""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = %s
-                """, (table_name,))
-                existing_columns = {row[0] for row in cur.fetchall()}
-                
                 # --- Normalize all field names to lowercase for comparison ---
                 old_field_names = {f['name'].replace(" ", "_").lower() for f in old_fields}
                 new_field_map = {f['name'].replace(" ", "_").lower(): f for f in new_fields}
@@ -1177,17 +2811,23 @@ def update_dynamic_table(form_name: str, new_fields: List[Dict], old_fields: Lis
                     # --- ALWAYS use lowercase for the column name ---
                     col_name = field['name'].replace(" ", "_").lower()
                     sql_type = get_sql_type(field['type'])
+                    # The field index's operator class may not fit the new type
+                    _drop_field_index(cur, table_name, col_name)
                     cur.execute(f"""
                         ALTER TABLE "{table_name}" 
                         ALTER COLUMN "{col_name}" TYPE {sql_type}
                         USING "{col_name}"::text::{sql_type}
                     """)
+
+                _sync_field_indexes(cur, table_name, new_fields)
                 
                 conn.commit()
+                publish_invalidation(conn, "table", table_name)
                 return True
     except Exception as e:
         print(f"Error updating table structure: {e}")
-        conn.rollback() # Add rollback on error
+        if 'conn' in locals():
+            conn.rollback() # Add rollback on error
         return False    
 def check_table_exists(table_name: str) -> bool:
     """Check if a table exists in the database"""
@@ -1243,30 +2883,30 @@ def synchronize_form_table(form_name: str) -> bool:
     if not fields:
         return False
 
+    # Get existing columns
+    existing_columns = {name.lower() for name in get_table_column_names(table_name)}
+    missing_fields = [
+        field for field in fields
+        if field['name'].replace(" ", "_").lower() not in existing_columns
+    ]
+    if not missing_fields:
+        return True
+
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
-                # Get existing columns
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = %s
-                """, (table_name,))
-                existing_columns = {row[0].lower() for row in cur.fetchall()}
-                
                 # Add missing columns
-                for field in fields:
+                for field in missing_fields:
                     col_name = field['name'].replace(" ", "_").lower()
                     sql_type = get_sql_type(field['type'])
-                    
-                    if col_name not in existing_columns:
-                        cur.execute(f"""
-                            ALTER TABLE "{table_name}" 
-                            ADD COLUMN "{col_name}" {sql_type}
-                        """)
-                        logger.info(f"Added column {col_name} to {table_name}")
+                    cur.execute(f"""
+                        ALTER TABLE "{table_name}" 
+                        ADD COLUMN "{col_name}" {sql_type}
+                    """)
+                    logger.info(f"Added column {col_name} to {table_name}")
                 
                 conn.commit()
+                publish_invalidation(conn, "table", table_name)
                 return True
                 
             except Exception as e:
@@ -1293,6 +2933,7 @@ def ensure_parent_columns(form_name: str):
                     ALTER TABLE "{table_name}" 
                     ADD COLUMN IF NOT EXISTS parent_id INTEGER
                 """)
+                _ensure_standard_indexes(cur, table_name)
                 
                 # Add foreign key constraint if missing
                 cur.execute(f"""
@@ -1302,6 +2943,7 @@ def ensure_parent_columns(form_name: str):
                     ON DELETE CASCADE
                 """)
                 conn.commit()
+                publish_invalidation(conn, "table", table_name)
                 return True
             except Exception as e:
                 logger.warning(f"Parent column setup: {str(e)}")
@@ -1350,18 +2992,14 @@ def get_parent_records(parent_form: str) -> List[Dict]:
     """Get all parent records with their display names"""
     table_name = parent_form.replace(" ", "_").lower()
     try:
+        # First try to find a name column
+        columns = get_table_column_names(table_name)
+        display_col = next(
+            (col for col in ('name', 'title', 'full_name', 'first_name') if col in columns),
+            'id'
+        )
         with get_connection() as conn:
             with conn.cursor() as cur:
-                # First try to find a name column
-                cur.execute(f"""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = %s 
-                    AND column_name IN ('name', 'title', 'full_name', 'first_name')
-                    LIMIT 1
-                """, (table_name,))
-                name_column = cur.fetchone()
-                display_col = name_column[0] if name_column else 'id'
-                
                 # Get all parent records
                 cur.execute(f"""
                     SELECT id, {display_col} FROM "{table_name}"
@@ -1480,6 +3118,8 @@ def fix_form_name_discrepancies() -> List[str]:
                         else:
                             corrections_log.append(f"WARNING: No matching table found for form '{form_name}'.")
                 conn.commit()
+                if any(not entry.startswith("WARNING") for entry in corrections_log):
+                    publish_invalidation(conn, "form")
         return corrections_log
     except Exception as e:
         logger.error(f"Error during name discrepancy fix: {e}")
@@ -1565,6 +3205,7 @@ def link_child_to_parent(child_form_name: str, parent_form_name: str) -> tuple[b
                     ADD COLUMN IF NOT EXISTS parent_id INTEGER;
                 """)
                 logger.info(f"Ensured 'parent_id' column exists in '{child_table}'.")
+                _ensure_standard_indexes(cur, child_table)
 
                 # --- Step 2: Add the foreign key constraint ---
                 # This will fail if the constraint already exists, which is caught by the exception.
@@ -1578,6 +3219,7 @@ def link_child_to_parent(child_form_name: str, parent_form_name: str) -> tuple[b
                 # It means if a parent is deleted, the child's parent_id becomes NULL instead of deleting the child record.
                 
                 conn.commit()
+                publish_invalidation(conn, "table", child_table)
                 message = f"Successfully linked '{child_form_name}' as a child to '{parent_form_name}'."
                 logger.info(message)
                 return (True, message)
@@ -1610,13 +3252,96 @@ def set_form_share_token(form_name: str, token: str) -> bool:
                     (token, form_name)
                 )
                 conn.commit()
+                publish_invalidation(conn, "token", form_name)
                 return True
     except Exception as e:
         logger.error(f"Error setting share token: {str(e)}")
         return False
 
+# --- Share token cache ---
+# The Shared Form page resolves its token on every rerun of every respondent's
+# session, so resolved tokens (and unknown ones, briefly) are kept in a
+# per-process LRU with a TTL. set_form_share_token() publishes
+# "token:<form name>" and form changes publish "form:<form name>", so a
+# revoked or edited form drops out of every process's cache at once; the TTL
+# only bounds staleness if a notification is missed.
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 300  # seconds
+TOKEN_NEGATIVE_TTL = 30  # seconds an unknown token is remembered
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (expires_at, form_name or None, fields JSON)
+_token_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "miss_seconds": 0.0, "invalidations": 0}
+
+def _invalidate_share_tokens(form_name: str) -> None:
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        _token_stats["invalidations"] += 1
+        if not form_name:
+            _token_cache.clear()
+            return
+        # Unknown tokens go too: one of them may just have been assigned
+        stale = [
+            token for token, (_, name, _) in _token_cache.items()
+            if name is None or name == form_name
+        ]
+        for token in stale:
+            del _token_cache[token]
+
+register_invalidation_handler("token", _invalidate_share_tokens)
+register_invalidation_handler("form", _invalidate_share_tokens)
+
+def lookup_share_token(token: str) -> tuple[bool, Optional[Dict], int]:
+    """
+    Resolve a share token from the cache without touching the database.
+    Returns (found, form, generation) like lookup_form_fields().
+    """
+    _ensure_catalog_listener()
+    now = time.monotonic()
+    with _catalog_lock:
+        generation = _catalog_generation
+        entry = _token_cache.get(token)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                del _token_cache[token]
+            return False, None, generation
+        _token_cache.move_to_end(token)
+        _, form_name, fields_json = entry
+        _token_stats["hits" if form_name is not None else "negative_hits"] += 1
+    if form_name is None:
+        return True, None, generation
+    return True, {"form_name": form_name, "fields": json.loads(fields_json)}, generation
+
+def remember_share_token(token: str, form: Optional[Dict], generation: int, miss_seconds: float = 0.0):
+    """Cache a token resolved from the database after a lookup_share_token() miss."""
+    if form is not None:
+        entry = (time.monotonic() + TOKEN_CACHE_TTL, form["form_name"], json.dumps(form["fields"]))
+    else:
+        entry = (time.monotonic() + TOKEN_NEGATIVE_TTL, None, None)
+    with _catalog_lock:
+        _token_stats["misses"] += 1
+        _token_stats["miss_seconds"] += miss_seconds
+        if generation == _catalog_generation:
+            _token_cache[token] = entry
+            _token_cache.move_to_end(token)
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+
+def get_token_cache_stats() -> Dict:
+    """Hit rate, database latency of misses and size of the share token cache."""
+    with _catalog_lock:
+        stats = dict(_token_stats)
+        stats["entries"] = len(_token_cache)
+    lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+    stats["avg_miss_seconds"] = stats["miss_seconds"] / stats["misses"] if stats["misses"] else 0.0
+    return stats
+
 def get_form_by_token(token: str) -> Optional[Dict]:
-    """Get form metadata by share token"""
+    """Get form metadata by share token (served from the share token cache)"""
+    found, form, generation = lookup_share_token(token)
+    if found:
+        return form
+    started = time.perf_counter()
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -1624,12 +3349,9 @@ def get_form_by_token(token: str) -> Optional[Dict]:
                 (token,)
             )
             result = cur.fetchone()
-            if result:
-                return {
-                    "form_name": result[0],
-                    "fields": result[1]
-                }
-            return None
+    form = {"form_name": result[0], "fields": result[1]} if result else None
+    remember_share_token(token, form, generation, time.perf_counter() - started)
+    return form
 
 def get_share_token(form_name: str) -> Optional[str]:
     """Get existing share token for a form"""
@@ -0,0 +1,239 @@
+# db_async.py
+# Async counterparts of the read-heavy functions in db.py.
+#
+# The coroutines run on one shared event loop in a background thread and use
+# a psycopg 3 AsyncConnectionPool, so a page can issue several queries at
+# once and wait only for the slowest:
+#
+#     results = call_many({
+#         "forms": ("get_all_forms",),
+#         "fields": ("get_form_fields", "Students"),
+#     })
+#
+# call() and call_many() are the sync facade used by Streamlit code. When
+# psycopg 3 is not installed they fall back to the db.py functions (fanned
+# out with db.run_concurrently), so callers never need to care.
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Coroutine, Dict, List, Optional, Union
+
+import streamlit as st
+
+import db
+
+try:
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+    AsyncConnectionPool = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_loop = None
+_loop_lock = threading.Lock()
+_pool = None
+_pool_lock = None
+
+
+def available() -> bool:
+    """True when psycopg 3 and psycopg_pool are installed and the async pool has a connection budget."""
+    return AsyncConnectionPool is not None and db.get_pool_sizes()["async_max_size"] > 0
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="db-async-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def get_async_pool() -> "AsyncConnectionPool":
+    """Return the shared async pool, opening it on first use (loop thread only)."""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                db_secrets = st.secrets["database"]
+                sizes = db.get_pool_sizes()  # this pool's share of POOL_MAX_SIZE
+                pool = AsyncConnectionPool(
+                    make_conninfo(**{k: str(v) for k, v in db.get_db_settings().items()}),
+                    min_size=sizes["async_min_size"],
+                    max_size=sizes["async_max_size"],
+                    timeout=float(db_secrets.get("POOL_TIMEOUT", 10)),
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+                logger.info(f"Opened async connection pool (min={pool.min_size}, max={pool.max_size})")
+    return _pool
+
+
+async def _fetch_dicts(query: str, params=None) -> List[Dict]:
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            columns = [desc.name for desc in cur.description]
+            return [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+
+async def _fetch_one(query: str, params=None) -> Optional[tuple]:
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            return await cur.fetchone()
+
+
+async def get_all_forms() -> List[str]:
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT form_name FROM forms")
+            return [row[0] for row in await cur.fetchall()]
+
+
+async def get_form_fields(form_name: str):
+    """Return the form's field definitions, sharing db.py's catalog cache."""
+    found, fields, generation = db.lookup_form_fields(form_name)
+    if not found:
+        result = await _fetch_one("SELECT fields FROM forms WHERE form_name = %s", (form_name,))
+        fields = result[0] if result else None
+        db.remember_form_fields(form_name, fields, generation)
+    return fields
+
+
+async def get_form_data(form_name: str) -> List[Dict]:
+    sanitized_name = form_name.replace(" ", "_").lower()
+    return await _fetch_dicts(f'SELECT * FROM "{sanitized_name}"')
+
+
+async def get_form_data_page(form_name: str, after_id: Optional[Union[int, tuple]] = None, limit: int = 100,
+                             order: str = "id", filters: Optional[Dict] = None,
+                             descending: bool = False) -> Dict:
+    """Async db.get_form_data_page()."""
+    query, params = db.build_form_page_query(form_name, after_id, limit, order, filters, descending)
+    return db.paginate_rows(await _fetch_dicts(query, params), limit, order)
+
+
+async def get_child_records(child_form: str, parent_id: int) -> List[Dict]:
+    table_name = child_form.replace(" ", "_").lower()
+    try:
+        return await _fetch_dicts(f'SELECT * FROM "{table_name}" WHERE parent_id = %s', (parent_id,))
+    except Exception as e:
+        logger.error(f"Error getting child records: {str(e)}")
+        return []
+
+
+async def get_child_records_for_parents(child_form: str, parent_ids: List[int]) -> List[Dict]:
+    if not parent_ids:
+        return []
+    table_name = child_form.replace(" ", "_").lower()
+    return await _fetch_dicts(
+        f'SELECT * FROM "{table_name}" WHERE parent_id = ANY(%s) ORDER BY id', (list(parent_ids),)
+    )
+
+
+async def get_records_by_ids(form_name: str, record_ids: List[int]) -> List[Dict]:
+    if not record_ids:
+        return []
+    table_name = form_name.replace(" ", "_").lower()
+    return await _fetch_dicts(
+        f'SELECT * FROM "{table_name}" WHERE id = ANY(%s) ORDER BY id', (list(record_ids),)
+    )
+
+
+async def get_child_relationships(parent_id: int) -> List[Dict]:
+    try:
+        return await _fetch_dicts("""
+            SELECT * FROM child_relationships
+            WHERE parent_id = %s
+            ORDER BY created_at DESC
+        """, (parent_id,))
+    except Exception as e:
+        logger.error(f"Error getting child relationships: {str(e)}")
+        return []
+
+
+async def get_form_by_token(token: str) -> Optional[Dict]:
+    """Resolve a share token, sharing db.py's share token cache."""
+    found, form, generation = db.lookup_share_token(token)
+    if not found:
+        started = time.perf_counter()
+        result = await _fetch_one("SELECT form_name, fields FROM forms WHERE share_token = %s", (token,))
+        form = {"form_name": result[0], "fields": result[1]} if result else None
+        db.remember_share_token(token, form, generation, time.perf_counter() - started)
+    return form
+
+
+async def get_share_token(form_name: str) -> Optional[str]:
+    result = await _fetch_one("SELECT share_token FROM forms WHERE form_name = %s", (form_name,))
+    return result[0] if result else None
+
+
+# Functions callable by name through the sync facade
+ASYNC_READS = {
+    "get_all_forms": get_all_forms,
+    "get_form_fields": get_form_fields,
+    "get_form_data": get_form_data,
+    "get_form_data_page": get_form_data_page,
+    "get_child_records": get_child_records,
+    "get_child_records_for_parents": get_child_records_for_parents,
+    "get_records_by_ids": get_records_by_ids,
+    "get_child_relationships": get_child_relationships,
+    "get_form_by_token": get_form_by_token,
+    "get_share_token": get_share_token,
+}
+
+
+def run(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result(timeout)
+
+
+async def _gather_dict(coros: Dict[str, Coroutine]) -> Dict[str, Any]:
+    results = await asyncio.gather(*coros.values(), return_exceptions=True)
+    return dict(zip(coros.keys(), results))
+
+
+def call(name: str, *args, **kwargs) -> Any:
+    """Call one read by name, e.g. call("get_form_fields", "Students")."""
+    if available():
+        return run(ASYNC_READS[name](*args, **kwargs))
+    return getattr(db, name)(*args, **kwargs)
+
+
+def call_many(calls: Dict[str, tuple]) -> Dict[str, Any]:
+    """
+    Run several reads at once. `calls` maps a result key to a tuple of the
+    read's name followed by its positional arguments. Returns the results
+    under the same keys once all have finished; a read that raised has its
+    exception as its result, as with db.run_concurrently().
+    """
+    for name, *_ in calls.values():
+        if name not in ASYNC_READS:
+            raise ValueError(f"Unknown read: {name}")
+    if not available():
+        return db.run_concurrently({
+            key: (lambda name=name, args=args: getattr(db, name)(*args))
+            for key, (name, *args) in calls.items()
+        })
+    results = run(_gather_dict({
+        key: ASYNC_READS[name](*args) for key, (name, *args) in calls.items()
+    }))
+    for key, result in results.items():
+        if isinstance(result, Exception):
+            logger.error(f"Concurrent load '{key}' failed: {result}")
+    return results
@@ -0,0 +1,412 @@
+# form_export.py
+# Streams a form's submissions out of Postgres as CSV, Parquet or Arrow.
+#
+# Usage from the command line:
+#     python form_export.py "Students" students.csv --where gender=Female --where age=10..14
+#     python form_export.py "Students" students.csv --where age=12 --where hobbies=chess,music
+#     python form_export.py "Students" students.parquet
+#
+# The CSV export runs COPY (SELECT ... WHERE <filters>) TO STDOUT, so Postgres
+# formats the CSV and psycopg2 hands it over one row at a time; rows are
+# written straight to the output file and never collected in Python.
+#
+# Parquet/Arrow exports keep the column types: the Arrow schema is derived
+# from the table's columns and the form's fields, and rows are read
+# from a server-side cursor in record batches. They need pyarrow, which is
+# optional.
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from db import (
+    SUBMISSION_KEY_COLUMN,
+    compile_filters,
+    get_connection,
+    get_filter_specs,
+    get_form_fields,
+    get_table_columns,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Column types that are large per row and rarely useful in a spreadsheet
+HEAVY_DATA_TYPES = {"bytea", "json", "jsonb"}
+PROGRESS_EVERY_BYTES = 1024 * 1024
+ARROW_BATCH_SIZE = 10000
+PARQUET_COMPRESSION = "zstd"
+EXPORT_FORMATS = ("csv", "parquet", "arrow")
+
+
+def get_export_columns(form_name: str) -> List[str]:
+    """All columns of the form's table, in table order."""
+    table_name = form_name.replace(" ", "_").lower()
+    return [name for name, _, _ in get_table_columns(table_name)]
+
+
+def get_heavy_columns(form_name: str) -> List[str]:
+    """Columns worth leaving out of an export by default."""
+    table_name = form_name.replace(" ", "_").lower()
+    heavy = [name for name, data_type, _ in get_table_columns(table_name) if data_type in HEAVY_DATA_TYPES]
+    if SUBMISSION_KEY_COLUMN not in heavy:
+        heavy.append(SUBMISSION_KEY_COLUMN)
+    return heavy
+
+
+class _CountingWriter:
+    """File wrapper that counts bytes written and reports progress now and then."""
+
+    def __init__(self, out, progress: Optional[Callable[[int], None]] = None):
+        self.out = out
+        self.progress = progress
+        self.bytes_written = 0
+        self._next_report = PROGRESS_EVERY_BYTES
+
+    def write(self, data):
+        self.out.write(data)
+        self.bytes_written += len(data)
+        if self.progress and self.bytes_written >= self._next_report:
+            self.progress(self.bytes_written)
+            self._next_report = self.bytes_written + PROGRESS_EVERY_BYTES
+
+
+def _select_export_rows(form_name: str, filters: Optional[Dict] = None,
+                        exclude_columns: Optional[List[str]] = None):
+    """Return (columns, query, params) selecting the rows and columns to export."""
+    table_name = form_name.replace(" ", "_").lower()
+    excluded = set(exclude_columns or [])
+    columns = [c for c in get_export_columns(form_name) if c not in excluded]
+    if not columns:
+        raise ValueError(f"Nothing to export for form '{form_name}'")
+
+    conditions, params = compile_filters(form_name, filters)
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    column_sql = ", ".join(f'"{c}"' for c in columns)
+    query = f'SELECT {column_sql} FROM "{table_name}" {where_sql} ORDER BY id'
+    return columns, query, params
+
+
+def build_export_query(cur, form_name: str, filters: Optional[Dict] = None,
+                       exclude_columns: Optional[List[str]] = None) -> str:
+    """
+    Build the SELECT fed to COPY. COPY cannot take bind parameters, so the
+    compiled filter values are inlined with cursor.mogrify.
+    """
+    _, query, params = _select_export_rows(form_name, filters, exclude_columns)
+    return cur.mogrify(query, params).decode("utf-8")
+
+
+def export_csv(form_name: str, out, filters: Optional[Dict] = None,
+               exclude_columns: Optional[List[str]] = None,
+               progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Write the matching submissions of `form_name` to the binary file `out` as
+    CSV with a header row. `filters` uses the same selections as
+    get_form_data_page(); `progress` is called with the number of bytes
+    written so far.
+
+    Returns stats: rows, bytes, seconds.
+    """
+    started = time.monotonic()
+    writer = _CountingWriter(out, progress)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            query = build_export_query(cur, form_name, filters, exclude_columns)
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+            rows = cur.rowcount
+        conn.rollback()
+    return {
+        "rows": rows,
+        "bytes": writer.bytes_written,
+        "seconds": time.monotonic() - started,
+    }
+
+
+def export_to_tempfile(form_name: str, filters: Optional[Dict] = None,
+                       exclude_columns: Optional[List[str]] = None,
+                       progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Export into a new temporary .csv file. The caller owns the file and
+    should remove stats["path"] when done with it.
+    """
+    handle = tempfile.NamedTemporaryFile(prefix="export_", suffix=".csv", delete=False)
+    try:
+        with handle:
+            stats = export_csv(form_name, handle, filters, exclude_columns, progress)
+    except Exception:
+        os.remove(handle.name)
+        raise
+    stats["path"] = handle.name
+    return stats
+
+
+def export_file(form_name: str, path: str, filters: Optional[Dict] = None,
+                exclude_columns: Optional[List[str]] = None,
+                progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """Export to a CSV file on disk."""
+    with open(path, "wb") as out:
+        stats = export_csv(form_name, out, filters, exclude_columns, progress)
+    stats["path"] = path
+    return stats
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+ARROW_ELEMENT_TYPES = {
+    "_bool": "boolean",
+    "_int2": "smallint",
+    "_int4": "integer",
+    "_int8": "bigint",
+    "_float4": "real",
+    "_float8": "double precision",
+    "_numeric": "numeric",
+    "_date": "date",
+    "_timestamp": "timestamp without time zone",
+    "_timestamptz": "timestamp with time zone",
+}
+
+
+def _arrow_type(data_type: str, udt_name: str = ""):
+    """Arrow type for a Postgres column type (arrays use their element type)."""
+    if data_type == "ARRAY":
+        return pa.list_(_arrow_type(ARROW_ELEMENT_TYPES.get(udt_name, "text")))
+    return {
+        "smallint": pa.int16(),
+        "integer": pa.int32(),
+        "bigint": pa.int64(),
+        "real": pa.float32(),
+        "double precision": pa.float64(),
+        "numeric": pa.float64(),
+        "boolean": pa.bool_(),
+        "date": pa.date32(),
+        "timestamp without time zone": pa.timestamp("us"),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+        "time without time zone": pa.time64("us"),
+        "bytea": pa.binary(),
+    }.get(data_type, pa.string())
+
+
+def build_arrow_schema(form_name: str, columns: List[str]):
+    """
+    Derive the Arrow schema for `columns` of a form's table.
+
+    Types and nullability come from the table's columns (array element types
+    from their udt_name); each column that belongs to a form field also
+    carries the field's name and type from forms.fields as Arrow metadata,
+    so readers can tell a MULTISELECT from a CHECKBOX or a PHONE from TEXT.
+    """
+    table_name = form_name.replace(" ", "_").lower()
+    catalog = {name: (data_type, nullable) for name, data_type, nullable in get_table_columns(table_name)}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT column_name, udt_name FROM information_schema.columns
+                WHERE table_name = %s AND data_type = 'ARRAY'
+            """, (table_name,))
+            udt_names = dict(cur.fetchall())
+    fields = {
+        field["name"].replace(" ", "_").lower(): field
+        for field in get_form_fields(form_name) or []
+    }
+    arrow_fields = []
+    for column in columns:
+        data_type, nullable = catalog[column]
+        field = fields.get(column)
+        metadata = None
+        if field:
+            metadata = {"form_field": str(field["name"]), "form_type": str(field.get("type", ""))}
+        arrow_fields.append(pa.field(
+            column, _arrow_type(data_type, udt_names.get(column, "")), nullable=nullable, metadata=metadata
+        ))
+    return pa.schema(arrow_fields, metadata={"form_name": form_name})
+
+
+def _arrow_value_converters(schema, columns: List[str], form_name: str) -> Dict[int, Callable]:
+    """Per-column fixes for values psycopg2 returns in a shape Arrow will not take."""
+    table_name = form_name.replace(" ", "_").lower()
+    json_columns = {name for name, data_type, _ in get_table_columns(table_name) if data_type in ("json", "jsonb")}
+    converters = {}
+    for i, column in enumerate(columns):
+        arrow_type = schema.field(column).type
+        if column in json_columns:
+            converters[i] = lambda v: None if v is None else json.dumps(v, default=str)
+        elif pa.types.is_string(arrow_type):
+            converters[i] = lambda v: None if v is None else str(v)
+        elif pa.types.is_floating(arrow_type):
+            converters[i] = lambda v: None if v is None else float(v)
+        elif pa.types.is_binary(arrow_type):
+            converters[i] = lambda v: None if v is None else bytes(v)
+    return converters
+
+
+def export_arrow(form_name: str, path: str, fmt: str = "parquet", filters: Optional[Dict] = None,
+                 exclude_columns: Optional[List[str]] = None, batch_size: int = ARROW_BATCH_SIZE,
+                 compression: str = PARQUET_COMPRESSION,
+                 progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Write the matching submissions to `path` as Parquet (fmt="parquet") or an
+    Arrow IPC file (fmt="arrow"), one record batch per `batch_size` rows read
+    from a server-side cursor. `progress` is called with the rows written so far.
+
+    Returns stats: rows, bytes, batches, seconds, path.
+    """
+    if pa is None:
+        raise RuntimeError("Parquet/Arrow export needs pyarrow: pip install pyarrow")
+    if fmt not in ("parquet", "arrow"):
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    started = time.monotonic()
+    columns, query, params = _select_export_rows(form_name, filters, exclude_columns)
+    schema = build_arrow_schema(form_name, columns)
+    converters = _arrow_value_converters(schema, columns, form_name)
+
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression=compression)
+    else:
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    rows_written = 0
+    batches = 0
+    try:
+        with get_connection() as conn:
+            with conn.cursor(name=f"export_{os.getpid()}_{id(writer)}") as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    arrays = []
+                    for i, column in enumerate(columns):
+                        values = [row[i] for row in rows]
+                        convert = converters.get(i)
+                        if convert:
+                            values = [convert(v) for v in values]
+                        arrays.append(pa.array(values, type=schema.field(column).type))
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                    rows_written += len(rows)
+                    batches += 1
+                    if progress:
+                        progress(rows_written)
+            conn.rollback()
+    finally:
+        writer.close()
+
+    return {
+        "rows": rows_written,
+        "bytes": os.path.getsize(path),
+        "batches": batches,
+        "seconds": time.monotonic() - started,
+        "path": path,
+    }
+
+
+def export_arrow_to_tempfile(form_name: str, fmt: str = "parquet", filters: Optional[Dict] = None,
+                             exclude_columns: Optional[List[str]] = None,
+                             progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """Like export_arrow, into a new temporary file the caller must remove."""
+    handle = tempfile.NamedTemporaryFile(prefix="export_", suffix=f".{fmt}", delete=False)
+    handle.close()
+    try:
+        return export_arrow(form_name, handle.name, fmt, filters, exclude_columns, progress=progress)
+    except Exception:
+        os.remove(handle.name)
+        raise
+
+
+def detect_export_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("parquet", "pq"):
+        return "parquet"
+    if extension in ("arrow", "feather", "ipc"):
+        return "arrow"
+    return "csv"
+
+
+def parse_where(form_name: str, conditions: List[str]) -> Dict:
+    """
+    Turn --where COLUMN=VALUE arguments into compile_filters() selections,
+    reading VALUE by the column's filter kind: LOW..HIGH or a single value
+    for ranges, a comma-separated list for multi-choice fields, a plain value
+    otherwise. Raises ValueError for a malformed condition.
+    """
+    kinds = {spec["column"]: spec["kind"] for spec in get_filter_specs(form_name)}
+    filters = {}
+    for condition in conditions:
+        column, sep, value = condition.partition("=")
+        if not sep:
+            raise ValueError(f"--where expects COLUMN=VALUE, got {condition!r}")
+        column = column.strip()
+        kind = kinds.get(column)
+        low, dots, high = value.partition("..")
+        if kind == "overlap":
+            filters[column] = [item.strip() for item in value.split(",") if item.strip()]
+        elif kind == "range":
+            filters[column] = (low or None, high or None) if dots else (value, value)
+        elif kind is None and dots:
+            filters[column] = (low or None, high or None)  # e.g. id or created_at
+        else:
+            filters[column] = value
+    return filters
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export a form's submissions as CSV, Parquet or Arrow.")
+    parser.add_argument("form_name", help="Name of the form, as shown in the app")
+    parser.add_argument("path", help="File to write (.csv, .parquet or .arrow)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="Output format (default: from extension)")
+    parser.add_argument("--batch-size", type=int, default=ARROW_BATCH_SIZE,
+                        help="Rows per record batch for Parquet/Arrow")
+    parser.add_argument("--compression", default=PARQUET_COMPRESSION,
+                        help="Parquet/Arrow compression codec")
+    parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="Filter like the Admin View: a value, a prefix for text fields, "
+                             "a value or LOW..HIGH for numbers and dates, or a comma-separated "
+                             "list for multi-choice fields (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="COLUMN",
+                        help="Leave COLUMN out of the export (repeatable)")
+    parser.add_argument("--skip-heavy", action="store_true",
+                        help="Also leave out binary/JSON columns and the submission key")
+    args = parser.parse_args(argv)
+
+    try:
+        filters = parse_where(args.form_name, args.where)
+    except ValueError as e:
+        parser.error(str(e))
+    exclude = list(args.exclude)
+    if args.skip_heavy:
+        exclude += get_heavy_columns(args.form_name)
+
+    fmt = args.format or detect_export_format(args.path)
+    if fmt == "csv":
+        def report(bytes_written):
+            print(f"{bytes_written / 1024 / 1024:.1f} MB written", file=sys.stderr)
+
+        stats = export_file(args.form_name, args.path, filters=filters,
+                            exclude_columns=exclude, progress=report)
+    else:
+        def report(rows_written):
+            print(f"{rows_written} rows written", file=sys.stderr)
+
+        stats = export_arrow(args.form_name, args.path, fmt, filters=filters, exclude_columns=exclude,
+                             batch_size=args.batch_size, compression=args.compression, progress=report)
+    print(json.dumps(stats, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
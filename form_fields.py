@@ -0,0 +1,234 @@
+# form_fields.py
+# Field-type registry and compiled render plans for the form pages.
+#
+# Each field type registers a widget factory that draws the Streamlit input
+# and returns its value. compile_render_plan() checks a form's field list
+# once, resolves every field to its FieldType, compiles the form's validation
+# schema (see form_validation) and caches the result keyed by a hash of the
+# definition, so a rerun only executes the plan: one widget call per field,
+# no type dispatch and no structure checks.
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+import streamlit as st
+
+import blob_store
+from form_validation import Schema, compile_schema, fields_fingerprint, format_error, validate_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RENDER_PLAN_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class FieldType:
+    name: str
+    widget: Callable[[Dict, str, str], Any]  # (field, label, key) -> value
+    needs_options: bool = False
+
+
+FIELD_TYPES: Dict[str, FieldType] = {}
+
+
+def register_field_type(name: str, widget: Callable, needs_options: bool = False) -> FieldType:
+    """Register (or replace) how a field type is drawn."""
+    field_type = FieldType(name, widget, needs_options)
+    FIELD_TYPES[name] = field_type
+    return field_type
+
+
+# --- Widgets ---
+
+def _checkbox_group_widget(field, label, key):
+    return [
+        option for option in field["options"]
+        if st.checkbox(f"{label} - {option}", key=f"{key}_{option}")
+    ]
+
+
+def _datetime_widget(field, label, key):
+    col1, col2 = st.columns(2)
+    with col1:
+        date_value = st.date_input(f"{label} (date)", key=f"{key}_date")
+    with col2:
+        time_value = st.time_input(f"{label} (time)", key=f"{key}_time")
+    if date_value and time_value:
+        return datetime.datetime.combine(date_value, time_value)
+    return None
+
+
+def _range_widget(field, label, key):
+    min_val, max_val = 0, 100  # Default range
+    options = field.get("options") or []
+    if len(options) >= 2:
+        try:
+            min_val, max_val = float(options[0]), float(options[1])
+        except ValueError:
+            pass
+    return st.slider(label, min_val, max_val, key=key)
+
+
+def _date_widget(field, label, key):
+    return st.date_input(label, min_value=datetime.date(1800, 1, 1),
+                         max_value=datetime.date.today(), key=key)
+
+
+def _gender_widget(field, label, key):
+    return st.selectbox(label, ["Male", "Female", "Other", "Prefer not to say"], key=key)
+
+
+register_field_type("TEXT", lambda f, label, key: st.text_input(label, key=key))
+register_field_type("TEXTAREA", lambda f, label, key: st.text_area(label, key=key))
+register_field_type("PASSWORD", lambda f, label, key: st.text_input(label, type="password", key=key))
+register_field_type("EMAIL", lambda f, label, key: st.text_input(label, key=key))
+register_field_type("URL", lambda f, label, key: st.text_input(label, key=key))
+register_field_type("PHONE", lambda f, label, key: st.text_input(label, key=key))
+register_field_type("COLOR", lambda f, label, key: st.color_picker(label, key=key))
+register_field_type("FILE", lambda f, label, key: st.file_uploader(label, key=key))
+register_field_type("INTEGER", lambda f, label, key: st.number_input(label, step=1, key=key))
+register_field_type("FLOAT", lambda f, label, key: st.number_input(label, step=0.1, key=key))
+register_field_type("RANGE", _range_widget)
+register_field_type("DATE", _date_widget)
+register_field_type("DATETIME", _datetime_widget)
+register_field_type("TIME", lambda f, label, key: st.time_input(label, key=key))
+register_field_type("BOOLEAN", lambda f, label, key: st.checkbox(label, key=key))
+register_field_type("RADIO", lambda f, label, key: st.radio(label, f["options"], key=key), needs_options=True)
+register_field_type("SELECT", lambda f, label, key: st.selectbox(label, f["options"], key=key), needs_options=True)
+register_field_type("MULTISELECT", lambda f, label, key: st.multiselect(label, f["options"], key=key),
+                    needs_options=True)
+register_field_type("CHECKBOX", _checkbox_group_widget, needs_options=True)
+register_field_type("GENDER", _gender_widget)
+
+# Types whose own widget wins over the "gender" name convention
+_NAME_OVERRIDE_EXEMPT = {
+    "TEXTAREA", "PASSWORD", "CHECKBOX", "RADIO", "SELECT", "DATETIME", "TIME",
+    "MULTISELECT", "EMAIL", "URL", "COLOR", "FILE", "RANGE",
+}
+
+
+def resolve_field_type(type_name: str, field_name: str = "") -> FieldType:
+    """Find the registered FieldType for a field, falling back to a text input."""
+    if field_name.lower() == "gender" and type_name not in _NAME_OVERRIDE_EXEMPT:
+        return FIELD_TYPES["GENDER"]
+    if type_name in FIELD_TYPES:
+        return FIELD_TYPES[type_name]
+    # SQL-style names such as VARCHAR(255) or BIGINT
+    for marker, name in (("VARCHAR", "TEXT"), ("TEXT", "TEXT"), ("INT", "INTEGER"),
+                         ("FLOAT", "FLOAT"), ("DATE", "DATE"), ("BOOLEAN", "BOOLEAN")):
+        if marker in type_name:
+            return FIELD_TYPES[name]
+    return FIELD_TYPES["TEXT"]
+
+
+@dataclass(frozen=True)
+class RenderStep:
+    position: int
+    label: str
+    column: str
+    field: Dict
+    field_type: FieldType
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    steps: Tuple[RenderStep, ...]
+    errors: Tuple[str, ...]  # problems in the field definitions, found at compile time
+    schema: Schema  # validation and coercion of the submitted values
+
+
+def compile_render_plan(fields: List[Dict]) -> RenderPlan:
+    """Check a form's field list and resolve each field to its FieldType."""
+    steps = []
+    errors = []
+    for i, field in enumerate(fields or []):
+        if not isinstance(field, dict):
+            errors.append(f"Invalid field at position {i}: Expected dict, got {type(field)}")
+            continue
+        if "name" not in field:
+            errors.append(f"Field at position {i} is missing 'name' property")
+            continue
+        field_name = field["name"]
+        if not isinstance(field_name, str):
+            errors.append(f"Field name at position {i} must be string, got {type(field_name)}")
+            continue
+        field_name = field_name.strip()
+        if not field_name:
+            errors.append(f"Field name at position {i} is empty")
+            continue
+        type_name = field.get("type", "TEXT")
+        if not isinstance(type_name, str):
+            errors.append(f"Field type at position {i} must be string, got {type(type_name)}")
+            continue
+
+        field_type = resolve_field_type(type_name, field_name)
+        if field_type.needs_options and not field.get("options"):
+            logger.warning(f"Field '{field_name}' ({type_name}) has no options; it will not be shown")
+            continue
+        steps.append(RenderStep(
+            position=i,
+            label=field_name,
+            column=field_name.replace(" ", "_").lower(),
+            field=field,
+            field_type=field_type,
+        ))
+    return RenderPlan(tuple(steps), tuple(errors), compile_schema(fields))
+
+
+_plan_cache: "OrderedDict[str, RenderPlan]" = OrderedDict()
+_plan_lock = threading.Lock()
+
+
+def get_render_plan(fields: List[Dict]) -> RenderPlan:
+    """Return the compiled plan for `fields`, compiling it on first use."""
+    fingerprint = fields_fingerprint(fields)
+    with _plan_lock:
+        plan = _plan_cache.get(fingerprint)
+        if plan is not None:
+            _plan_cache.move_to_end(fingerprint)
+            return plan
+    plan = compile_render_plan(fields)
+    with _plan_lock:
+        _plan_cache[fingerprint] = plan
+        while len(_plan_cache) > RENDER_PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def render_form(plan: RenderPlan, key_prefix: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Draw the plan's widgets (call inside st.form). Returns the widget values
+    keyed by field name and the validation errors for the current values;
+    missing required fields are only reported by process_submission().
+    """
+    form_data = {}
+    for step in plan.steps:
+        key = f"{key_prefix}_{step.column}_{step.position}"
+        try:
+            form_data[step.label] = step.field_type.widget(step.field, step.label, key)
+        except Exception as e:
+            st.error(f"Error rendering field {step.position}: {str(e)}")
+            logger.exception(f"Error rendering field {step.position}")
+    _, errors = validate_rows(plan.schema, [form_data], check_required=False)
+    return form_data, [format_error(error) for error in errors]
+
+
+def process_submission(plan: RenderPlan, form_data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Convert submitted widget values into column -> value pairs for
+    save_form_data, skipping empty values. Uploaded files are written to the
+    blob store and replaced by their references. Returns (processed_data, errors).
+    """
+    typed, errors = validate_rows(plan.schema, [{k: v for k, v in form_data.items() if k != "id"}])
+    processed = typed[0] or {}
+    if processed and not errors and plan.schema.file_columns:
+        try:
+            blob_store.store_uploads(processed, plan.schema.file_columns)
+        except OSError as e:
+            logger.error(f"Error storing uploaded file: {str(e)}")
+            return processed, ["Uploaded file could not be stored. Please try again."]
+    return processed, [format_error(error) for error in errors]
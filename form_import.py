@@ -0,0 +1,250 @@
+# form_import.py
+# Streams CSV or JSONL files into an existing form's table.
+#
+# Usage from the command line:
+#     python form_import.py "Students" students.csv --batch-size 5000
+#
+# Rows are read one at a time and collected into bounded batches; each batch is
+# mapped onto the form's fields and coerced column by column by
+# form_validation.validate_rows, then written with COPY. Rows that cannot be
+# converted (or that Postgres refuses) are written to a JSONL reject file
+# together with the error.
+import argparse
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import psycopg2
+
+from db import (
+    SUBMISSION_KEY_COLUMN,
+    get_connection,
+    get_form_fields,
+    get_table_column_names,
+    insert_rows,
+)
+from form_validation import compile_schema, format_error, validate_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 5000
+
+
+def _copy_text(value) -> str:
+    """Render a value in COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        text = "t" if value else "f"
+    elif isinstance(value, (datetime.date, datetime.time, datetime.datetime)):
+        text = value.isoformat()
+    elif isinstance(value, list):
+        text = "{" + ",".join(
+            '"' + item.replace("\\", "\\\\").replace('"', '\\"') + '"' for item in value
+        ) + "}"
+    elif isinstance(value, dict):
+        text = json.dumps(value)  # JSONB, e.g. a blob_store file reference
+    else:
+        text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line_number, record) from a text stream without loading it all."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, {"__error__": f"invalid JSON: {e}", "__raw__": line}
+                continue
+            if not isinstance(record, dict):
+                yield line_number, {"__error__": "expected a JSON object", "__raw__": line}
+                continue
+            yield line_number, record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def detect_format(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return "jsonl" if extension in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def import_stream(form_name: str, stream, fmt: str, batch_size: int = IMPORT_BATCH_SIZE,
+                  reject_stream=None, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Import records from an open text stream into the form's table.
+
+    Each batch is validated in one pass, written with COPY and committed on
+    its own. If COPY rejects a
+    batch, it is replayed row by row so only the failing rows are rejected.
+    `progress` is called after every batch with the running statistics.
+    """
+    fields = get_form_fields(form_name)
+    if not fields:
+        raise ValueError(f"Form '{form_name}' does not exist")
+    table_name = form_name.replace(" ", "_").lower()
+    table_columns = get_table_column_names(table_name)
+    if not table_columns:
+        raise ValueError(f"Table {table_name} does not exist")
+
+    schema = compile_schema(fields)
+    seen_headers = set()
+    stats = {
+        "rows_read": 0,
+        "inserted": 0,
+        "rejected": 0,
+        "batches": 0,
+        "seconds": 0.0,
+        "rows_per_second": 0.0,
+        "unmapped_headers": [],
+    }
+    started = time.perf_counter()
+
+    def reject(line_number, error, record):
+        stats["rejected"] += 1
+        if reject_stream is not None:
+            reject_stream.write(json.dumps(
+                {"line": line_number, "error": error, "record": record}, default=str
+            ) + "\n")
+
+    def flush(cur, conn, records):
+        typed_rows, errors = validate_rows(schema, [record for _, record in records])
+        messages = {}
+        for error in errors:
+            messages.setdefault(error["row"], []).append(format_error(error))
+        batch = []
+        for index, ((line_number, record), row) in enumerate(zip(records, typed_rows)):
+            if row is None:
+                reject(line_number, "; ".join(messages[index]), record)
+            elif not row:
+                reject(line_number, "no mapped values", record)
+            else:
+                batch.append((line_number, record, row))
+        if batch:
+            copy_batch(cur, batch)
+        conn.commit()
+        stats["batches"] += 1
+        stats["seconds"] = time.perf_counter() - started
+        stats["rows_per_second"] = stats["rows_read"] / stats["seconds"] if stats["seconds"] else 0.0
+        if progress:
+            progress(dict(stats))
+
+    def copy_batch(cur, batch):
+        columns = sorted({column for _, _, row in batch for column in row})
+        buffer = io.StringIO()
+        for _, _, row in batch:
+            buffer.write("\t".join(_copy_text(row.get(column)) for column in columns))
+            buffer.write("\n")
+        buffer.seek(0)
+        column_sql = ", ".join(f'"{column}"' for column in columns)
+        cur.execute("SAVEPOINT import_batch")
+        try:
+            cur.copy_expert(f'COPY "{table_name}" ({column_sql}) FROM STDIN', buffer)
+            cur.execute("RELEASE SAVEPOINT import_batch")
+            stats["inserted"] += len(batch)
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT import_batch")
+            for line_number, record, row in batch:
+                cur.execute("SAVEPOINT import_row")
+                try:
+                    stats["inserted"] += insert_rows(cur, table_name, [row], SUBMISSION_KEY_COLUMN in table_columns)
+                    cur.execute("RELEASE SAVEPOINT import_row")
+                except psycopg2.Error as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT import_row")
+                    reject(line_number, str(e).strip(), record)
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            batch = []
+            for line_number, record in read_records(stream, fmt):
+                stats["rows_read"] += 1
+                if "__error__" in record:
+                    reject(line_number, record["__error__"], record.get("__raw__"))
+                    continue
+                for header in record:
+                    if header not in seen_headers:
+                        seen_headers.add(header)
+                        if schema.resolve(header) is None:
+                            stats["unmapped_headers"].append(header)
+                batch.append((line_number, record))
+                if len(batch) >= batch_size:
+                    flush(cur, conn, batch)
+                    batch = []
+            if batch:
+                flush(cur, conn, batch)
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_second"] = stats["rows_read"] / stats["seconds"] if stats["seconds"] else 0.0
+    if stats["unmapped_headers"]:
+        logger.warning(f"Ignored columns not in form '{form_name}': {stats['unmapped_headers']}")
+    logger.info(
+        f"Imported {stats['inserted']} rows into {table_name} "
+        f"({stats['rejected']} rejected, {stats['rows_per_second']:.0f} rows/s)"
+    )
+    return stats
+
+
+def import_file(form_name: str, path: str, fmt: Optional[str] = None, batch_size: int = IMPORT_BATCH_SIZE,
+                reject_path: Optional[str] = None, progress: Optional[Callable[[Dict], None]] = None,
+                encoding: str = "utf-8-sig") -> Dict:
+    """Import a CSV or JSONL file from disk. Rejected rows go to `reject_path`."""
+    fmt = fmt or detect_format(path)
+    reject_path = reject_path or f"{path}.rejects.jsonl"
+    with open(path, "r", encoding=encoding, newline="") as stream, \
+            open(reject_path, "w", encoding="utf-8") as reject_stream:
+        stats = import_stream(form_name, stream, fmt, batch_size, reject_stream, progress)
+    if stats["rejected"]:
+        stats["reject_path"] = reject_path
+    else:
+        os.remove(reject_path)
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import a CSV or JSONL file into a form's table.")
+    parser.add_argument("form_name", help="Name of the form, as shown in the app")
+    parser.add_argument("path", help="CSV or JSONL file to import")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from extension)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per COPY batch")
+    parser.add_argument("--rejects", help="Where to write rejected rows (default: <path>.rejects.jsonl)")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        print(
+            f"{stats['rows_read']} read, {stats['inserted']} inserted, "
+            f"{stats['rejected']} rejected, {stats['rows_per_second']:.0f} rows/s",
+            file=sys.stderr
+        )
+
+    stats = import_file(
+        args.form_name, args.path, fmt=args.format, batch_size=args.batch_size,
+        reject_path=args.rejects, progress=report, encoding=args.encoding
+    )
+    print(json.dumps(stats, indent=2, default=str))
+    return 1 if stats["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
 # form_utils.py
 import ollama
+import hashlib
 import json
 import os
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from html import escape as html_escape
 from dotenv import load_dotenv
 # in app.py
 load_dotenv(override=True)
@@ -24,16 +30,175 @@ def get_navigation_css():
     }
     </style>
     """
-# In form_utils.py
+# --- Generated HTML forms ---
+#
+# Rendered pages are cached by a hash of (form name, fields, TEMPLATE_VERSION):
+# an in-memory LRU bounded by HTML_CACHE_MAX_BYTES, backed by copies under
+# generated_forms/.cache so a restart does not re-render every form. The
+# copies are pruned oldest-used first (by mtime, refreshed on each disk hit)
+# once they exceed HTML_CACHE_DISK_MAX_BYTES.
+# Bump TEMPLATE_VERSION whenever the markup produced by _render_html_form changes.
+TEMPLATE_VERSION = "2"
+GENERATED_FORMS_DIR = "generated_forms"
+HTML_CACHE_DIR = os.path.join(GENERATED_FORMS_DIR, ".cache")
+HTML_CACHE_MAX_BYTES = int(os.getenv("HTML_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+HTML_CACHE_DISK_MAX_BYTES = int(os.getenv("HTML_CACHE_DISK_MAX_BYTES", 64 * 1024 * 1024))
 
-# This function will become our primary, instant form generator.
-def generate_html_form(form_name: str, fields: list) -> str:
-    """
-    Instantly generates a functional Bootstrap 5 HTML form from a list of fields
-    without calling an LLM. This should be the default method.
-    """
+_html_cache = OrderedDict()  # key -> html
+_html_cache_bytes = 0
+_html_cache_lock = threading.Lock()
+_html_cache_stats = {
+    "hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "disk_evictions": 0,
+    "writes": 0,
+    "unchanged_writes": 0,
+}
+
+
+def html_cache_key(form_name: str, fields: list) -> str:
+    """Content address of a rendered form: hash of its name, fields and the template version."""
+    payload = json.dumps([TEMPLATE_VERSION, form_name, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _remember_html(key: str, html: str):
+    global _html_cache_bytes
+    size = len(html.encode("utf-8"))
+    if size > HTML_CACHE_MAX_BYTES:
+        return
+    with _html_cache_lock:
+        previous = _html_cache.pop(key, None)
+        if previous is not None:
+            _html_cache_bytes -= len(previous.encode("utf-8"))
+        _html_cache[key] = html
+        _html_cache_bytes += size
+        while _html_cache_bytes > HTML_CACHE_MAX_BYTES:
+            _, evicted = _html_cache.popitem(last=False)
+            _html_cache_bytes -= len(evicted.encode("utf-8"))
+            _html_cache_stats["evictions"] += 1
+
+
+def _write_if_changed(filepath: str, content: str) -> bool:
+    """Write `content` to `filepath` unless it already holds exactly that. Returns True if written."""
+    data = content.encode("utf-8")
+    try:
+        if os.path.getsize(filepath) == len(data):
+            with open(filepath, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    tmp_path = f"{filepath}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    return True
+
+
+def get_html_cache_stats() -> dict:
+    """Hit/miss counters and current size of the rendered-form cache."""
+    with _html_cache_lock:
+        stats = dict(_html_cache_stats)
+        stats["entries"] = len(_html_cache)
+        stats["bytes"] = _html_cache_bytes
+    stats["max_bytes"] = HTML_CACHE_MAX_BYTES
+    return stats
+
+
+def _prune_disk_cache():
+    """Delete the least recently used on-disk copies beyond HTML_CACHE_DISK_MAX_BYTES."""
+    entries = []
+    with os.scandir(HTML_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".html"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= HTML_CACHE_DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        with _html_cache_lock:
+            _html_cache_stats["disk_evictions"] += 1
+
+
+def clear_html_cache(remove_files: bool = False):
+    """Empty the in-memory cache (and optionally the on-disk copies)."""
+    global _html_cache_bytes
+    with _html_cache_lock:
+        _html_cache.clear()
+        _html_cache_bytes = 0
+    if remove_files and os.path.isdir(HTML_CACHE_DIR):
+        for name in os.listdir(HTML_CACHE_DIR):
+            try:
+                os.remove(os.path.join(HTML_CACHE_DIR, name))
+            except OSError as e:
+                logger.warning(f"Could not remove cached form {name}: {e}")
+
+
+def _render_field_html(field: dict) -> str:
+    field_name = field.get("name", "unnamed_field")
+    # Sanitize name for HTML attributes
+    sanitized_name = field_name.replace(" ", "_").lower()
+    field_type = field.get("type", "TEXT")
+    options = field.get("options", [])
+
+    parts = [
+        f'        <div class="mb-3">\n',
+        f'            <label for="{sanitized_name}" class="form-label">{field_name}</label>\n',
+    ]
+    if field_type == "TEXTAREA":
+        parts.append(f'            <textarea class="form-control" id="{sanitized_name}" name="{sanitized_name}" rows="3" required></textarea>\n')
+    elif field_type in ("SELECT", "MULTISELECT"):
+        multiple = " multiple" if field_type == "MULTISELECT" else ""
+        parts.append(f'            <select class="form-select" id="{sanitized_name}" name="{sanitized_name}"{multiple} required>\n')
+        parts.extend(f'                <option value="{option}">{option}</option>\n' for option in options)
+        parts.append('            </select>\n')
+    elif field_type == "RADIO":
+        parts.extend(f'''
+            <div class="form-check">
+                <input class="form-check-input" type="radio" name="{sanitized_name}" id="{sanitized_name}_{i}" value="{option}" required>
+                <label class="form-check-label" for="{sanitized_name}_{i}">
+                    {option}
+                </label>
+            </div>''' for i, option in enumerate(options))
+    elif field_type == "CHECKBOX":
+        # For a single boolean checkbox
+        parts.append(f'''
+            <div class="form-check">
+                <input class="form-check-input" type="checkbox" id="{sanitized_name}" name="{sanitized_name}" value="true">
+                <label class="form-check-label" for="{sanitized_name}">Yes/No</label>
+            </div>''')
+    elif field_type == "PHONE":
+        parts.append(f'            <input type="tel" class="form-control" id="{sanitized_name}" name="{sanitized_name}" pattern="[0-9]{{10,15}}" title="10-15 digit phone number" required>\n')
+    else:
+        input_type = {
+            "EMAIL": "email",
+            "DATE": "date",
+            "DATETIME": "datetime-local",
+            "TIME": "time",
+            "INTEGER": "number",
+            "FLOAT": "number",
+            "RANGE": "number",
+            "PASSWORD": "password",
+            "FILE": "file",  # share_server posts the page as multipart/form-data
+        }.get(field_type, "text")  # Default to text input
+        parts.append(f'            <input type="{input_type}" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n')
+    parts.append('        </div>\n')
+    return "".join(parts)
+
+
+def _render_html_form(form_name: str, fields: list) -> str:
     # Start with Bootstrap CDN and a container
-    html = f"""
+    parts = [f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -46,87 +211,74 @@ def generate_html_form(form_name: str, fields: list) -> str:
     <div class="container mt-4">
         <h2>{form_name}</h2>
         <form action="#" method="POST">
-    """
-
-    # Loop through fields and generate the correct HTML input
-    for field in fields:
-        field_name = field.get("name", "unnamed_field")
-        # Sanitize name for HTML attributes
-        sanitized_name = field_name.replace(" ", "_").lower()
-        field_type = field.get("type", "TEXT")
-        options = field.get("options", [])
-        
-        html += f'        <div class="mb-3">\n'
-        html += f'            <label for="{sanitized_name}" class="form-label">{field_name}</label>\n'
-
-        if field_type == "TEXTAREA":
-            html += f'            <textarea class="form-control" id="{sanitized_name}" name="{sanitized_name}" rows="3" required></textarea>\n'
-        elif field_type == "SELECT":
-            html += f'            <select class="form-select" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-            for option in options:
-                html += f'                <option value="{option}">{option}</option>\n'
-            html += f'            </select>\n'
-        elif field_type == "RADIO":
-            for i, option in enumerate(options):
-                html += f'''
-            <div class="form-check">
-                <input class="form-check-input" type="radio" name="{sanitized_name}" id="{sanitized_name}_{i}" value="{option}" required>
-                <label class="form-check-label" for="{sanitized_name}_{i}">
-                    {option}
-                </label>
-            </div>'''
-        elif field_type == "MULTISELECT":
-            html += f'            <select class="form-select" id="{sanitized_name}" name="{sanitized_name}" multiple required>\n'
-            for option in options:
-                html += f'                <option value="{option}">{option}</option>\n'
-            html += f'            </select>\n'
-        elif field_type == "CHECKBOX":
-            # For a single boolean checkbox
-            html += f'''
-            <div class="form-check">
-                <input class="form-check-input" type="checkbox" id="{sanitized_name}" name="{sanitized_name}" value="true">
-                <label class="form-check-label" for="{sanitized_name}">Yes/No</label>
-            </div>'''
-        elif field_type == "PHONE":
-            html += f'            <input type="tel" class="form-control" id="{sanitized_name}" name="{sanitized_name}" pattern="[0-9]{{10,15}}" title="10-15 digit phone number" required>\n'
-        elif field_type == "EMAIL":
-            html += f'            <input type="email" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        elif field_type == "DATE":
-            html += f'            <input type="date" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        elif field_type == "DATETIME":
-            html += f'            <input type="datetime-local" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        elif field_type == "TIME":
-            html += f'            <input type="time" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        elif field_type == "INTEGER" or field_type == "FLOAT" or field_type == "RANGE":
-            html += f'            <input type="number" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        elif field_type == "PASSWORD":
-            html += f'            <input type="password" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        else: # Default to text input
-            html += f'            <input type="text" class="form-control" id="{sanitized_name}" name="{sanitized_name}" required>\n'
-        
-        html += f'        </div>\n'
-
+    """]
+    parts.extend(_render_field_html(field) for field in fields)
     # Add submit button and close tags
-    html += """
+    parts.append("""
             <button type="submit" class="btn btn-primary">Submit</button>
         </form>
     </div>
 </body>
 </html>
+    """)
+    return "".join(parts)
+
+
+# This function will become our primary, instant form generator.
+def generate_html_form(form_name: str, fields: list) -> str:
     """
-    return html
-def generate_form_with_llama(form_name, fields):
-    confirmation_message = f"Request received: Enhancing form '{form_name}' with AI (LLM)..."
-    print(confirmation_message) # For immediate console feedback
-    logger.info(confirmation_message) # For structured logging
+    Instantly generates a functional Bootstrap 5 HTML form from a list of fields
+    without calling an LLM. This should be the default method. Results are
+    cached, so previews and re-saves of an unchanged form do not re-render it.
+    """
+    key = html_cache_key(form_name, fields)
+    with _html_cache_lock:
+        html = _html_cache.get(key)
+        if html is not None:
+            _html_cache.move_to_end(key)
+            _html_cache_stats["hits"] += 1
+            return html
+
+    cache_path = os.path.join(HTML_CACHE_DIR, f"{key}.html")
     try:
-        nav_css = get_navigation_css()
-        # Create field specifications string
-        field_specs = "\n".join(
-            [f"- {field['name']} ({field['type']})" for field in fields]
-        )
-        
-        prompt = f"""
+        with open(cache_path, "r", encoding="utf-8") as f:
+            html = f.read()
+        with _html_cache_lock:
+            _html_cache_stats["disk_hits"] += 1
+        try:
+            os.utime(cache_path)  # mark as recently used for _prune_disk_cache
+        except OSError:
+            pass
+    except OSError:
+        html = _render_html_form(form_name, fields)
+        with _html_cache_lock:
+            _html_cache_stats["misses"] += 1
+        try:
+            if _write_if_changed(cache_path, html):
+                _prune_disk_cache()
+        except OSError as e:
+            logger.warning(f"Could not store rendered form {form_name}: {e}")
+    _remember_html(key, html)
+    return html
+
+
+# Model used for AI enhancement. "stub" answers locally without Ollama (for tests
+# and development); LLM_STUB_DELAY seconds of sleep make it behave like a slow model.
+LLM_MODEL = os.getenv("LLM_MODEL", "llama2")
+LLM_STUB_MODEL = "stub"
+# Seconds to wait for the first streamed token before giving up on the model
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "10"))
+
+
+def build_enhancement_prompt(form_name, fields):
+    """Prompt asking the LLM to produce a styled version of the form."""
+    nav_css = get_navigation_css()
+    # Create field specifications string
+    field_specs = "\n".join(
+        [f"- {field['name']} ({field['type']})" for field in fields]
+    )
+    
+    return f"""
         Create an HTML form for '{form_name}' with the following fields:
         {field_specs}
         
@@ -150,18 +302,139 @@ def generate_form_with_llama(form_name, fields):
         10. Include this CSS:
         {nav_css}
         """
-        
-        response = ollama.generate(
-            model='llama2',
-            prompt=prompt,
-            options={'temperature': 0.2}
-        )
-        
-        return response['response']
+
+
+def _stub_generate(prompt):
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return (
+        get_navigation_css()
+        + f'<div class="container mt-4" data-model="{LLM_STUB_MODEL}" data-prompt="{digest}">\n'
+        + f"<pre>{html_escape(prompt.strip())}</pre>\n</div>\n"
+    )
+
+
+def _stub_tokens(prompt):
+    time.sleep(float(os.getenv("LLM_STUB_DELAY", "0")))
+    text = _stub_generate(prompt)
+    for start in range(0, len(text), 40):
+        yield text[start:start + 40]
+
+
+def _model_tokens(prompt, model):
+    if model == LLM_STUB_MODEL:
+        yield from _stub_tokens(prompt)
+        return
+    for chunk in ollama.generate(
+        model=model,
+        prompt=prompt,
+        options={'temperature': 0.2},
+        stream=True
+    ):
+        yield chunk['response']
+
+
+def call_llm(prompt, model=None):
+    """Send a prompt to the model and return its text. Raises on failure."""
+    model = model or LLM_MODEL
+    if model == LLM_STUB_MODEL:
+        return "".join(_stub_tokens(prompt))
+    response = ollama.generate(
+        model=model,
+        prompt=prompt,
+        options={'temperature': 0.2}
+    )
+    return response['response']
+
+
+def stream_llm(prompt, model=None, first_token_timeout=None):
+    """
+    Yield the model's output as it is generated. Raises TimeoutError when no
+    token arrives within `first_token_timeout` seconds (LLM_FIRST_TOKEN_TIMEOUT
+    by default); once the model has started there is no overall time limit.
+    """
+    model = model or LLM_MODEL
+    timeout = LLM_FIRST_TOKEN_TIMEOUT if first_token_timeout is None else first_token_timeout
+    chunks = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for token in _model_tokens(prompt, model):
+                if stop.is_set():
+                    return
+                chunks.put((token, None))
+            chunks.put((None, None))
+        except Exception as e:
+            chunks.put((None, e))
+
+    threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+    started = False
+    try:
+        while True:
+            try:
+                token, error = chunks.get(timeout=None if started else timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No response from {model} within {timeout:g}s") from None
+            if error is not None:
+                raise error
+            if token is None:
+                return
+            started = True
+            yield token
+    finally:
+        # Stops the reader after its next token if the caller gave up early
+        stop.set()
+
+
+def renderable_prefix(partial_html):
+    """
+    The part of a partially generated page that can be previewed: markdown
+    fences removed and cut after the last complete tag, leaving out a
+    <style> or <script> block that is still open.
+    """
+    text = partial_html.lstrip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    text = text.split("```", 1)[0]
+    text = text[:text.rfind(">") + 1]
+    lowered = text.lower()
+    for tag in ("style", "script"):
+        opened = lowered.rfind(f"<{tag}")
+        if opened > lowered.rfind(f"</{tag}>"):
+            text, lowered = text[:opened], lowered[:opened]
+    return text
+
+
+def generate_form_with_llama(form_name, fields, stream=False):
+    """
+    Enhance the form with the LLM. With stream=True, returns an iterator of
+    output tokens instead of the finished page; in both modes the plain
+    generate_html_form page is the fallback, used when streaming if the model
+    does not start answering within LLM_FIRST_TOKEN_TIMEOUT.
+    """
+    confirmation_message = f"Request received: Enhancing form '{form_name}' with AI (LLM)..."
+    print(confirmation_message) # For immediate console feedback
+    logger.info(confirmation_message) # For structured logging
+    if stream:
+        return _stream_form_with_llama(form_name, fields)
+    try:
+        return call_llm(build_enhancement_prompt(form_name, fields))
     except Exception as e:
         logger.error(f"Error generating form: {str(e)}")
         return generate_html_form(form_name, fields)
 
+
+def _stream_form_with_llama(form_name, fields):
+    started = False
+    try:
+        for token in stream_llm(build_enhancement_prompt(form_name, fields)):
+            started = True
+            yield token
+    except Exception as e:
+        logger.error(f"Error generating form: {str(e)}")
+        if not started:
+            yield generate_html_form(form_name, fields)
+
 def generate_fallback_form(fields):
     """Generate a simple form as fallback when LLAMA fails"""
     form_html = get_navigation_css() +'<form>\n'
@@ -197,6 +470,21 @@ def generate_fallback_form(fields):
     return form_html
 # Corrected function in form_utils.py
 
+def sandboxed_html(content: str, height: int = 500) -> str:
+    """
+    Wrap generated HTML (LLM output, form pages) in an iframe without
+    allow-same-origin, for st.components.v1.html: scripts in it still run but
+    cannot reach the app page, its cookies or the login session.
+    """
+    return (
+        f'<iframe sandbox="allow-scripts allow-forms" srcdoc="{html_escape(content, quote=True)}" '
+        f'style="width: 100%; height: {int(height) - 10}px; border: 0;"></iframe>'
+    )
+
+def get_share_base_url() -> str:
+    """Where share links point: the standalone share server if configured, else the app."""
+    return os.getenv("SHARE_SERVER_URL") or os.getenv("BASE_URL", "http://localhost:8501")
+
 def generate_embed_code(form_name: str, token: str, base_url: str) -> str:
     """Generate HTML embed code for a form"""
     # Use the corrected URL structure (base_url + ?token=...)
@@ -216,9 +504,8 @@ def save_form_html(form_name, html_content):
         # Ensure navigation CSS exists in the content
         if 'nav-arrow' not in html_content:
             html_content = get_navigation_css() + html_content
-        os.makedirs("generated_forms", exist_ok=True)
         filename = f"{form_name.replace(' ', '_').lower()}.html"
-        filepath = os.path.join("generated_forms", filename)
+        filepath = os.path.join(GENERATED_FORMS_DIR, filename)
         
         # Add Bootstrap CDN if missing
         if '<link href="https://cdn.jsdelivr.net/npm/bootstrap' not in html_content:
@@ -227,8 +514,10 @@ def save_form_html(form_name, html_content):
             """
             html_content = bootstrap_cdn + html_content
         
-        with open(filepath, "w") as f:
-            f.write(html_content)
+        # Re-saving an unchanged form leaves the file (and its mtime) alone
+        written = _write_if_changed(filepath, html_content)
+        with _html_cache_lock:
+            _html_cache_stats["writes" if written else "unchanged_writes"] += 1
         
         return filepath
     except Exception as e:
@@ -0,0 +1,395 @@
+# form_validation.py
+# Validation and type coercion of submissions, driven by a form's fields.
+#
+# compile_schema() turns a field list into one rule per column (cached by a
+# hash of the definition). validate_rows() then works column by column over a
+# whole batch: numbers and dates go through pandas' vectorised parsers, text
+# checks use precompiled regexes, and the result is a list of typed rows plus
+# a structured error list. The same engine serves the form pages (a batch of
+# one), the Shared Form and bulk imports. It does not depend on Streamlit.
+import datetime
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field as dataclass_field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from db import SUBMISSION_KEY_COLUMN, get_sql_type
+
+TRUE_VALUES = {"true", "t", "yes", "y", "1", "on"}
+FALSE_VALUES = {"false", "f", "no", "n", "0", "off"}
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+URL_PATTERN = re.compile(r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+")
+PHONE_PATTERN = re.compile(r"[0-9]{10}\Z")
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+SCHEMA_CACHE_SIZE = 256
+
+# A parser takes the non-empty values of one column and returns the parsed
+# values and an error message (or None) for each of them.
+Parser = Callable[[List[Any]], Tuple[List[Any], List[Optional[str]]]]
+
+
+def is_empty(value) -> bool:
+    """None, "", and lists/dicts holding nothing but those count as not filled in."""
+    if value is None or (isinstance(value, str) and value == ""):
+        return True
+    if isinstance(value, dict):
+        return all(is_empty(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(is_empty(v) for v in value)
+    return False
+
+
+# --- Column parsers ---
+
+def _series(values: List[Any]) -> "pd.Series":
+    return pd.Series(values, dtype=object)
+
+
+def _parse_integer(values):
+    series = _series([None if isinstance(v, bool) else v for v in values])
+    numbers = pd.to_numeric(series.map(lambda v: v.strip() if isinstance(v, str) else v), errors="coerce")
+    parsed, errors = [], []
+    for raw, number in zip(values, numbers.tolist()):
+        if pd.isna(number):
+            parsed.append(None)
+            errors.append(f"not an integer: {raw!r}")
+        elif not INT32_MIN <= number <= INT32_MAX:
+            parsed.append(None)
+            errors.append(f"out of range: {raw!r}")
+        elif number != int(number):
+            parsed.append(None)
+            errors.append(f"not a whole number: {raw!r}")
+        else:
+            parsed.append(int(number))
+            errors.append(None)
+    return parsed, errors
+
+
+def _parse_float(values):
+    series = _series([None if isinstance(v, bool) else v for v in values])
+    numbers = pd.to_numeric(series.map(lambda v: v.strip() if isinstance(v, str) else v), errors="coerce")
+    parsed, errors = [], []
+    for raw, number in zip(values, numbers.tolist()):
+        if pd.isna(number):
+            parsed.append(None)
+            errors.append(f"not a number: {raw!r}")
+        else:
+            parsed.append(float(number))
+            errors.append(None)
+    return parsed, errors
+
+
+def _iso_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).date()
+
+
+def _iso_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return datetime.datetime.fromisoformat(value)
+
+
+def _parse_temporal(values, parse_iso, convert, label):
+    """
+    Parse with the standard library first, so every date Postgres accepts
+    (0001-01-01 to 9999-12-31) gets through; only values it cannot read go
+    to pandas, which knows more formats but only years 1677-2262.
+    """
+    parsed, errors, fallback = [], [], []
+    for index, raw in enumerate(values):
+        try:
+            parsed.append(parse_iso(raw.strip() if isinstance(raw, str) else raw))
+            errors.append(None)
+        except (TypeError, ValueError):
+            parsed.append(None)
+            errors.append(f"{label}: {raw!r}")
+            fallback.append(index)
+    if fallback:
+        series = _series([values[i].strip() if isinstance(values[i], str) else values[i] for i in fallback])
+        try:
+            stamps = pd.to_datetime(series, errors="coerce").tolist()
+        except (TypeError, ValueError):
+            stamps = [None] * len(fallback)
+        for index, stamp in zip(fallback, stamps):
+            if not pd.isna(stamp):
+                parsed[index], errors[index] = convert(stamp), None
+    return parsed, errors
+
+
+def _parse_date(values):
+    return _parse_temporal(values, _iso_date, lambda stamp: stamp.date(), "not a date")
+
+
+def _parse_datetime(values):
+    return _parse_temporal(values, _iso_datetime, lambda stamp: stamp.to_pydatetime(), "not a date and time")
+
+
+def _parse_range(values):
+    # Slider values; fractions are truncated as they always have been
+    parsed, errors = _parse_float(values)
+    for index, number in enumerate(parsed):
+        if number is None:
+            continue
+        if not INT32_MIN <= number <= INT32_MAX:
+            parsed[index], errors[index] = None, f"out of range: {values[index]!r}"
+        else:
+            parsed[index] = int(number)
+    return parsed, errors
+
+
+def _parse_time(values):
+    parsed, errors = [], []
+    for raw in values:
+        if isinstance(raw, datetime.time):
+            parsed.append(raw)
+            errors.append(None)
+            continue
+        try:
+            parsed.append(datetime.time.fromisoformat(str(raw).strip()))
+            errors.append(None)
+        except ValueError:
+            parsed.append(None)
+            errors.append(f"not a time: {raw!r}")
+    return parsed, errors
+
+
+def _parse_boolean(values):
+    parsed, errors = [], []
+    for raw in values:
+        if isinstance(raw, bool):
+            parsed.append(raw)
+            errors.append(None)
+            continue
+        text = str(raw).strip().lower()
+        if text in TRUE_VALUES or text in FALSE_VALUES:
+            parsed.append(text in TRUE_VALUES)
+            errors.append(None)
+        else:
+            parsed.append(None)
+            errors.append(f"not a boolean: {raw!r}")
+    return parsed, errors
+
+
+def _split_list(raw) -> List[str]:
+    if isinstance(raw, (list, tuple)):
+        return [str(item) for item in raw]
+    text = str(raw).strip()
+    if text.startswith("[") and text.endswith("]"):
+        return [str(item) for item in json.loads(text)]
+    if text.startswith("{") and text.endswith("}"):
+        text = text[1:-1]
+    return [item.strip().strip('"') for item in text.split(",") if item.strip()]
+
+
+def _parse_list(values):
+    parsed, errors = [], []
+    for raw in values:
+        try:
+            parsed.append(_split_list(raw))
+            errors.append(None)
+        except (ValueError, TypeError):
+            parsed.append(None)
+            errors.append(f"not a list: {raw!r}")
+    return parsed, errors
+
+
+def _text_parser(max_length: Optional[int] = None, pattern: Optional[re.Pattern] = None,
+                 pattern_error: str = "") -> Parser:
+    def parse(values):
+        parsed, errors = [], []
+        for raw in values:
+            text = str(raw)
+            if max_length is not None and len(text) > max_length:
+                parsed.append(None)
+                errors.append(f"longer than {max_length} characters")
+            elif pattern is not None and not pattern.match(text):
+                parsed.append(None)
+                errors.append(pattern_error)
+            else:
+                parsed.append(text)
+                errors.append(None)
+        return parsed, errors
+    return parse
+
+
+def _parse_file(values):
+    # Uploaded files are passed through; text cannot stand in for file contents
+    return (
+        [None if isinstance(v, str) else v for v in values],
+        ["file contents cannot be imported" if isinstance(v, str) else None for v in values],
+    )
+
+
+def get_parser(field_type: str) -> Parser:
+    """Pick the column parser for a form field type."""
+    field_type = field_type.upper()
+    if field_type == "EMAIL":
+        return _text_parser(255, EMAIL_PATTERN, "must be a valid email address")
+    if field_type == "URL":
+        return _text_parser(255, URL_PATTERN, "must be a valid URL")
+    if field_type == "PHONE":
+        return _text_parser(None, PHONE_PATTERN, "must be a 10-digit number")
+    if field_type == "FILE":
+        return _parse_file
+    if field_type == "RANGE":
+        return _parse_range
+    sql_type = get_sql_type(field_type)
+    if sql_type.startswith("VARCHAR("):
+        return _text_parser(int(sql_type[len("VARCHAR("):-1]))
+    return {
+        "INTEGER": _parse_integer,
+        "FLOAT": _parse_float,
+        "BOOLEAN": _parse_boolean,
+        "DATE": _parse_date,
+        "TIMESTAMP": _parse_datetime,
+        "TIME": _parse_time,
+        "TEXT[]": _parse_list,
+    }.get(sql_type, _text_parser())
+
+
+# --- Schemas ---
+
+@dataclass(frozen=True)
+class FieldRule:
+    label: str
+    column: str
+    field_type: str
+    required: bool
+    parse: Parser
+
+
+@dataclass(frozen=True)
+class Schema:
+    rules: Tuple[FieldRule, ...]
+    lookup: Dict[str, FieldRule] = dataclass_field(default_factory=dict)
+    file_columns: Tuple[str, ...] = ()  # FILE fields, stored through blob_store
+
+    def resolve(self, key: str) -> Optional[FieldRule]:
+        """Find the rule for an input key: the field name as shown or its column name, any case."""
+        return self.lookup.get(str(key).strip().replace(" ", "_").lower())
+
+
+# Columns every form table may take besides its fields
+SYSTEM_RULES = (
+    FieldRule("parent_id", "parent_id", "INTEGER", False, _parse_integer),
+    FieldRule(SUBMISSION_KEY_COLUMN, SUBMISSION_KEY_COLUMN, "VARCHAR(64)", False, _text_parser(64)),
+)
+
+_schema_cache: "OrderedDict[str, Schema]" = OrderedDict()
+_schema_lock = threading.Lock()
+
+
+def fields_fingerprint(fields: List[Dict]) -> str:
+    """Stable hash of a form definition."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _build_schema(fields: List[Dict]) -> Schema:
+    rules = []
+    for field in fields or []:
+        if not isinstance(field, dict) or not isinstance(field.get("name"), str) or not field["name"].strip():
+            continue
+        label = field["name"].strip()
+        field_type = str(field.get("type", "TEXT"))
+        rules.append(FieldRule(
+            label=label,
+            column=label.replace(" ", "_").lower(),
+            field_type=field_type,
+            required=bool(field.get("required")),
+            parse=get_parser(field_type),
+        ))
+    lookup = {rule.column: rule for rule in SYSTEM_RULES}
+    lookup.update({rule.column: rule for rule in rules})
+    file_columns = tuple(rule.column for rule in rules if rule.field_type.upper() == "FILE")
+    return Schema(tuple(rules), lookup, file_columns)
+
+
+def compile_schema(fields: List[Dict]) -> Schema:
+    """Return the compiled validation schema for a field list (cached)."""
+    fingerprint = fields_fingerprint(fields)
+    with _schema_lock:
+        schema = _schema_cache.get(fingerprint)
+        if schema is not None:
+            _schema_cache.move_to_end(fingerprint)
+            return schema
+    schema = _build_schema(fields)
+    with _schema_lock:
+        _schema_cache[fingerprint] = schema
+        while len(_schema_cache) > SCHEMA_CACHE_SIZE:
+            _schema_cache.popitem(last=False)
+    return schema
+
+
+def validate_rows(schema: Union[Schema, List[Dict]], rows: Sequence[Dict[str, Any]],
+                  check_required: bool = True) -> Tuple[List[Optional[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Validate and coerce a batch of input rows.
+
+    Rows are dicts keyed by field name (as shown in the form) or column name;
+    keys that match no field are ignored and empty values are left out.
+    Returns (typed_rows, errors): typed_rows is aligned with `rows`, holding
+    {column: typed value} for a valid row and None for a row with errors;
+    errors holds one {"row", "field", "column", "value", "error"} dict per
+    problem, with "row" the index into `rows`.
+    """
+    if not isinstance(schema, Schema):
+        schema = compile_schema(schema)
+
+    # Gather each rule's non-empty values together so parsing runs per column
+    columns: Dict[FieldRule, Tuple[List[int], List[Any]]] = {}
+    resolved: Dict[str, Optional[FieldRule]] = {}
+    for index, row in enumerate(rows):
+        for key, value in row.items():
+            if key not in resolved:
+                resolved[key] = schema.resolve(key)
+            rule = resolved[key]
+            if rule is None or is_empty(value):
+                continue
+            indexes, values = columns.setdefault(rule, ([], []))
+            indexes.append(index)
+            values.append(value)
+
+    typed: List[Optional[Dict[str, Any]]] = [{} for _ in rows]
+    errors = []
+    for rule, (indexes, values) in columns.items():
+        parsed, messages = rule.parse(values)
+        for index, raw, value, message in zip(indexes, values, parsed, messages):
+            if message:
+                errors.append({"row": index, "field": rule.label, "column": rule.column,
+                               "value": raw, "error": message})
+            elif value != []:
+                typed[index][rule.column] = value
+
+    if check_required:
+        failed = {(error["row"], error["column"]) for error in errors}
+        for rule in schema.rules:
+            if not rule.required:
+                continue
+            for index, row in enumerate(typed):
+                if rule.column not in row and (index, rule.column) not in failed:
+                    errors.append({"row": index, "field": rule.label, "column": rule.column,
+                                   "value": None, "error": "is required"})
+
+    for index in {error["row"] for error in errors}:
+        typed[index] = None
+    errors.sort(key=lambda e: e["row"])
+    return typed, errors
+
+
+def format_error(error: Dict[str, Any]) -> str:
+    """One-line message for an error from validate_rows()."""
+    return f"{error['field']}: {error['error']}"
@@ -0,0 +1,225 @@
+# llm_jobs.py
+# Background queue and result cache for AI form enhancement.
+#
+# submit_enhancement() returns a job id straight away; the LLM call runs on a
+# small worker pool, streaming its output into Job.partial, and the page polls
+# get_job() to preview the page as it grows until the job is done.
+# Identical prompts share one job while it is in flight, and finished results
+# are kept in a SQLite cache keyed by a hash of (model, prompt), with a TTL
+# and a cap on the number of entries. Set LLM_MODEL=stub to run without Ollama.
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from form_utils import LLM_MODEL, build_enhancement_prompt, generate_html_form, stream_llm
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "2"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("generated_forms", ".llm_cache.sqlite3"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+JOB_RETENTION = 3600  # seconds a finished job stays visible to get_job()
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    form_name: str
+    model: str
+    status: str = QUEUED
+    partial: str = ""  # output received so far while running
+    result: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    fallback: bool = False  # the model never answered; result is the plain generated form
+    submitted_at: float = 0.0
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+_executor = None
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _jobs_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-job")
+    return _executor
+
+
+def prompt_key(prompt: str, model: str) -> str:
+    """Cache key (and job id) for a prompt sent to a model."""
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+# --- Result cache ---
+
+def _cache_connection() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_results (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def cache_get(key: str) -> Optional[str]:
+    """Return a cached result that has not expired, or None."""
+    now = time.time()
+    try:
+        with _cache_lock:
+            conn = _cache_connection()
+            try:
+                with conn:
+                    row = conn.execute(
+                        "SELECT result FROM llm_results WHERE key = ? AND created_at > ?",
+                        (key, now - LLM_CACHE_TTL)
+                    ).fetchone()
+                    if row:
+                        conn.execute("UPDATE llm_results SET last_used = ? WHERE key = ?", (now, key))
+                return row[0] if row else None
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Error reading LLM cache: {str(e)}")
+        return None
+
+
+def cache_put(key: str, model: str, result: str):
+    """Store a result, then drop expired entries and the least recently used beyond the cap."""
+    now = time.time()
+    try:
+        with _cache_lock:
+            conn = _cache_connection()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_results (key, model, result, created_at, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, model, result, now, now)
+                    )
+                    conn.execute("DELETE FROM llm_results WHERE created_at <= ?", (now - LLM_CACHE_TTL,))
+                    conn.execute("""
+                        DELETE FROM llm_results WHERE key NOT IN (
+                            SELECT key FROM llm_results ORDER BY last_used DESC LIMIT ?
+                        )
+                    """, (LLM_CACHE_MAX_ENTRIES,))
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Error writing LLM cache: {str(e)}")
+
+
+def clear_cache():
+    """Remove every cached LLM result."""
+    try:
+        with _cache_lock:
+            conn = _cache_connection()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM llm_results")
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Error clearing LLM cache: {str(e)}")
+
+
+# --- Jobs ---
+
+def _run_job(job: Job, prompt: str, fields: List[Dict]):
+    job.status = RUNNING
+    try:
+        parts = []
+        for token in stream_llm(prompt, job.model):
+            if job.first_token_at is None:
+                job.first_token_at = time.time()
+            parts.append(token)
+            job.partial += token
+        result = "".join(parts)
+        cache_put(job.id, job.model, result)
+        job.result = result
+        job.status = DONE
+    except TimeoutError as e:
+        # Not cached: the model may answer next time
+        logger.warning(f"LLM enhancement of '{job.form_name}' fell back to the plain form: {str(e)}")
+        job.result = generate_html_form(job.form_name, fields)
+        job.fallback = True
+        job.status = DONE
+    except Exception as e:
+        logger.error(f"LLM enhancement of '{job.form_name}' failed: {str(e)}")
+        job.error = str(e)
+        job.status = FAILED
+    finally:
+        job.finished_at = time.time()
+
+
+def _prune_jobs(now: float):
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job.finished and now - job.finished_at > JOB_RETENTION
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def submit_enhancement(form_name: str, fields: List[Dict], model: Optional[str] = None) -> str:
+    """
+    Queue an AI enhancement of the form and return its job id. A cached
+    result completes the job immediately; a request identical to one still
+    running (or recently finished) returns that job's id instead of starting
+    another call. Failed and fallback jobs are retried.
+    """
+    model = model or LLM_MODEL
+    prompt = build_enhancement_prompt(form_name, fields)
+    key = prompt_key(prompt, model)
+    now = time.time()
+    with _jobs_lock:
+        _prune_jobs(now)
+        job = _jobs.get(key)
+        if job is not None and job.status != FAILED and not job.fallback:
+            return key
+
+    cached = cache_get(key)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and job.status != FAILED and not job.fallback:
+            return key
+        job = Job(id=key, form_name=form_name, model=model, submitted_at=now)
+        if cached is not None:
+            job.result, job.status, job.cached, job.finished_at = cached, DONE, True, now
+        _jobs[key] = job
+    if cached is None:
+        _get_executor().submit(_run_job, job, prompt, fields)
+        logger.info(f"Queued LLM enhancement of '{form_name}' ({model})")
+    return key
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Current state of a job, or None if unknown (or pruned)."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,216 @@
+# share_server.py
+# Lightweight HTTP server for public share links.
+#
+# Serves a shared form and takes its submissions without starting a
+# Streamlit session per respondent:
+#
+#     GET  /?token=<share token>   the form page (from generate_html_form)
+#     POST /?token=<share token>   validate with form_validation, then save_form_data
+#     GET  /files/<sha256>?...     a stored FILE upload, via a signed link
+#                                  from db.file_download_url()
+#     GET  /healthz                liveness check
+#
+# Run it with `python share_server.py --port 8502`, or under any WSGI server
+# (e.g. `gunicorn -w 4 share_server:app`), and set SHARE_SERVER_URL so the app
+# hands out links and embed codes pointing here. With SUBMISSION_WRITE_BEHIND
+# set, submissions are journaled and inserted in the background.
+import argparse
+import html
+import json
+import logging
+import os
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from werkzeug.serving import run_simple
+from werkzeug.wrappers import Request, Response
+from werkzeug.wsgi import wrap_file
+
+import blob_store
+import submission_buffer
+from db import (SUBMISSION_KEY_COLUMN, SUBMISSION_WRITE_BEHIND, get_form_by_token, save_form_data,
+                verify_file_download)
+from form_utils import generate_html_form
+from form_validation import SYSTEM_RULES, compile_schema, format_error, validate_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORM_TAG = '<form action="#" method="POST">'
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+LIST_TYPES = {"CHECKBOX", "MULTISELECT"}
+
+
+class ShareRequest(Request):
+    max_content_length = MAX_CONTENT_LENGTH
+
+
+def _message_page(title: str, body_html: str, status: int) -> Response:
+    page = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(title)}</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body>
+    <div class="container mt-4">
+        <h2>{html.escape(title)}</h2>
+        {body_html}
+    </div>
+</body>
+</html>
+"""
+    return Response(page, status=status, mimetype="text/html")
+
+
+def _wants_json(request: Request) -> bool:
+    return request.accept_mimetypes.best == "application/json"
+
+
+def render_shared_form(form: Dict, token: str) -> str:
+    """The form page with its action pointed back here and a fresh submission key."""
+    page = generate_html_form(form["form_name"], form["fields"])
+    action = html.escape(f"?token={token}", quote=True)
+    return page.replace(
+        FORM_TAG,
+        f'<form action="{action}" method="POST" enctype="multipart/form-data">\n'
+        f'            <input type="hidden" name="{SUBMISSION_KEY_COLUMN}" value="{uuid.uuid4()}">',
+        1
+    )
+
+
+def _is_private_column(rule) -> bool:
+    """System columns respondents may not set: all of them except the submission key."""
+    return any(rule is system_rule for system_rule in SYSTEM_RULES) and rule.column != SUBMISSION_KEY_COLUMN
+
+
+def read_submission(request: Request, fields: List[Dict]) -> Dict:
+    """
+    Collect posted values by field, keeping every value of multi-choice fields.
+    System columns other than the submission key (e.g. parent_id) are not
+    taken from the public: a respondent cannot attach a row to a record.
+    """
+    schema = compile_schema(fields)
+    data = {}
+    for key in request.form.keys():
+        values = request.form.getlist(key)
+        rule = schema.resolve(key)
+        if _is_private_column(rule):
+            continue
+        if rule is not None and rule.field_type.upper() in LIST_TYPES:
+            data[key] = values
+        else:
+            data[key] = values[-1] if values else None
+    for key, storage in request.files.items():
+        rule = schema.resolve(key)
+        if _is_private_column(rule):
+            continue
+        if storage and storage.filename:
+            data[key] = storage  # streamed into the blob store once the row validates
+    return data
+
+
+def handle_submit(request: Request, form: Dict) -> Response:
+    schema = compile_schema(form["fields"])
+    data = read_submission(request, form["fields"])
+    typed, errors = validate_rows(schema, [data])
+    if errors:
+        if _wants_json(request):
+            return Response(json.dumps({"errors": errors}, default=str), status=422, mimetype="application/json")
+        items = "".join(f"<li>{html.escape(format_error(error))}</li>" for error in errors)
+        return _message_page(
+            "Please correct the following",
+            f'<ul class="text-danger">{items}</ul>'
+            '<a class="btn btn-secondary" href="javascript:history.back()">Back to the form</a>',
+            422
+        )
+
+    row = typed[0]
+    submission_key = row.pop(SUBMISSION_KEY_COLUMN, None)
+    try:
+        blob_store.store_uploads(row, schema.file_columns)
+    except OSError as e:
+        logger.error(f"Error storing uploaded file: {str(e)}")
+        return _message_page("Submission failed", "<p>Your file could not be saved. Please try again.</p>", 500)
+    if not row or not save_form_data(form["form_name"], row, submission_key=submission_key,
+                                     write_behind=SUBMISSION_WRITE_BEHIND):
+        if _wants_json(request):
+            return Response(json.dumps({"saved": False}), status=500, mimetype="application/json")
+        return _message_page("Submission failed", "<p>Your response could not be saved. Please try again.</p>", 500)
+
+    if _wants_json(request):
+        return Response(json.dumps({"saved": True}), status=201, mimetype="application/json")
+    return _message_page("Thank you!", "<p>Your response has been recorded.</p>", 200)
+
+
+def serve_file(request: Request, sha256: str) -> Response:
+    """Stream a stored file in chunks if the link's signature checks out."""
+    args = request.args
+    filename, mime_type = args.get("name", ""), args.get("type", "")
+    if not verify_file_download(sha256, args.get("expires"), filename, mime_type, args.get("sig")):
+        return _message_page("Link expired", "<p>This download link is invalid or has expired.</p>", 403)
+    try:
+        f = blob_store.open_blob(sha256)
+    except (OSError, ValueError):
+        return _message_page("Not found", "<p>This file is no longer available.</p>", 404)
+    size = os.fstat(f.fileno()).st_size
+    return Response(
+        wrap_file(request.environ, f, blob_store.CHUNK_SIZE),
+        mimetype=mime_type or blob_store.DEFAULT_MIME_TYPE,
+        direct_passthrough=True,
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename or sha256)}",
+            "Cache-Control": "private, max-age=3600",
+            "X-Content-Type-Options": "nosniff",
+        },
+    )
+
+
+@ShareRequest.application
+def app(request: ShareRequest) -> Response:
+    """WSGI entry point."""
+    if request.path == "/healthz":
+        return Response("ok", mimetype="text/plain")
+    if request.path.startswith("/files/"):
+        if request.method not in ("GET", "HEAD"):
+            return Response("Method not allowed", status=405, headers={"Allow": "GET, HEAD"})
+        return serve_file(request, request.path[len("/files/"):])
+    if request.path not in ("/", ""):
+        return _message_page("Not found", "<p>There is nothing here.</p>", 404)
+    if request.method not in ("GET", "HEAD", "POST"):
+        return Response("Method not allowed", status=405, headers={"Allow": "GET, HEAD, POST"})
+
+    token = request.args.get("token", "").strip()
+    if not token:
+        return _message_page("Form not found", "<p>This link is missing its form token.</p>", 404)
+    try:
+        form = get_form_by_token(token)
+    except Exception as e:
+        logger.error(f"Error looking up shared form: {str(e)}")
+        return _message_page("Service unavailable", "<p>Please try again in a moment.</p>", 503)
+    if not form or not form.get("fields"):
+        return _message_page("Form not found", "<p>This link is invalid or has been revoked.</p>", 404)
+
+    if request.method == "POST":
+        return handle_submit(request, form)
+    return Response(render_shared_form(form, token), mimetype="text/html",
+                    headers={"Cache-Control": "no-store"})
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve shared forms without the Streamlit app.")
+    parser.add_argument("--host", default=os.getenv("SHARE_SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SHARE_SERVER_PORT", "8502")))
+    args = parser.parse_args(argv)
+    if SUBMISSION_WRITE_BEHIND:
+        submission_buffer.start()
+    logger.info(f"Serving shared forms on http://{args.host}:{args.port}")
+    run_simple(args.host, args.port, app, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
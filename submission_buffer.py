@@ -0,0 +1,280 @@
+# submission_buffer.py
+# Write-behind buffer for form submissions.
+#
+# enqueue() appends the submission to a local journal (one JSON line, fsync'd)
+# and returns at once; a background flusher reads the journal in order, groups
+# entries per form and writes them with save_form_data_bulk. Every entry
+# carries a submission key, so replaying entries that were already inserted
+# (after a crash, or a retry) is a no-op. The flushed position is kept in an
+# offset file next to the journal; entries Postgres rejects for good go to a
+# dead-letter file. The journal is replayed when the process starts again.
+#
+# One process owns a journal directory at a time (an exclusive lock on
+# journal.lock); a second process falls back to synchronous inserts.
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.getenv("SUBMISSION_JOURNAL_DIR", "submission_journal")
+FLUSH_INTERVAL = float(os.getenv("SUBMISSION_FLUSH_INTERVAL", "1"))  # seconds between flushes
+FLUSH_BATCH_SIZE = 5000  # journal entries per flush
+RETRY_MAX_DELAY = 60  # seconds
+COMPACT_BYTES = 16 * 1024 * 1024  # truncate the journal once it is flushed and this large
+
+_lock = threading.Lock()  # guards the journal file and the state below
+_journal = None
+_lock_file = None
+_owner = None  # True once this process holds the journal lock, False if another does
+_flusher = None
+_wake = threading.Event()
+_stats = {
+    "enqueued": 0,
+    "flushed": 0,
+    "duplicates": 0,
+    "dead_lettered": 0,
+    "failed_flushes": 0,
+    "last_error": None,
+    "last_flush_at": None,
+}
+
+
+def _path(name: str) -> str:
+    return os.path.join(JOURNAL_DIR, name)
+
+
+def _encode(row: Dict) -> Dict:
+    encoded = {}
+    for column, value in row.items():
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            encoded[column] = {"$bytes": base64.b64encode(bytes(value)).decode("ascii")}
+        elif value is None or isinstance(value, (str, int, float)):
+            encoded[column] = value
+        else:
+            raise TypeError(f"cannot journal {type(value).__name__} value for {column}")
+    return encoded
+
+
+def _decode(row: Dict) -> Dict:
+    return {
+        column: base64.b64decode(value["$bytes"]) if isinstance(value, dict) and "$bytes" in value else value
+        for column, value in row.items()
+    }
+
+
+def _read_offset() -> int:
+    try:
+        with open(_path("journal.offset"), "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_offset(offset: int):
+    tmp_path = _path("journal.offset.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _path("journal.offset"))
+
+
+def _open_journal() -> bool:
+    """Take ownership of the journal directory (once per process). Call with _lock held."""
+    global _journal, _lock_file, _owner
+    if _owner is not None:
+        return _owner
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    _lock_file = open(_path("journal.lock"), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(_lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            logger.warning(f"Submission journal {JOURNAL_DIR} is owned by another process; "
+                           "submissions will be saved synchronously")
+            _lock_file.close()
+            _owner = False
+            return False
+    _journal = open(_path("journal.jsonl"), "ab")
+    _owner = True
+    return True
+
+
+def start() -> bool:
+    """Open the journal and start the flusher, replaying anything left from a previous run."""
+    global _flusher
+    with _lock:
+        if not _open_journal():
+            return False
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="submission-flusher", daemon=True)
+            _flusher.start()
+    return True
+
+
+def enqueue(form_name: str, form_data: Dict, submission_key: Optional[str] = None) -> bool:
+    """
+    Journal a submission for a later insert and return True once it is on
+    disk. Falls back to a synchronous save_form_data when the journal cannot
+    be used (owned by another process, unwritable, or unencodable values).
+    """
+    row = db._clean_form_row(form_data)
+    row.pop("id", None)
+    if not row:
+        logger.warning("No valid data to save - skipping")
+        return False
+    submission_key = submission_key or uuid.uuid4().hex
+    try:
+        line = json.dumps({
+            "form": form_name,
+            "key": submission_key,
+            "row": _encode(row),
+            "at": time.time(),
+        }).encode("utf-8") + b"\n"
+    except TypeError as e:
+        logger.warning(f"Saving submission synchronously: {e}")
+        return db.save_form_data(form_name, form_data, submission_key=submission_key)
+
+    if not start():
+        return db.save_form_data(form_name, form_data, submission_key=submission_key)
+    try:
+        with _lock:
+            _journal.write(line)
+            _journal.flush()
+            os.fsync(_journal.fileno())
+            _stats["enqueued"] += 1
+    except OSError as e:
+        logger.error(f"Could not journal submission, saving synchronously: {str(e)}")
+        return db.save_form_data(form_name, form_data, submission_key=submission_key)
+    _wake.set()
+    return True
+
+
+def _read_pending(offset: int) -> tuple[List[tuple], int]:
+    """Read up to FLUSH_BATCH_SIZE complete entries after `offset`. Returns (entries, end offset)."""
+    entries = []
+    with open(_path("journal.jsonl"), "rb") as f:
+        if offset > os.fstat(f.fileno()).st_size:
+            offset = 0  # the journal was truncated after this offset was stored
+        f.seek(offset)
+        while len(entries) < FLUSH_BATCH_SIZE:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break  # end of file, or a write still in progress
+            offset += len(line)
+            try:
+                entries.append((json.loads(line), line))
+            except json.JSONDecodeError:
+                entries.append((None, line))
+    return entries, offset
+
+
+def _dead_letter(entries: List[Dict]):
+    with open(_path("dead_letter.jsonl"), "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _stats["dead_lettered"] += len(entries)
+
+
+def flush_once() -> int:
+    """
+    Insert the next batch of journaled submissions. Returns the number of
+    entries processed; raises if the database could not take them, leaving
+    them in the journal to be retried.
+    """
+    offset = _read_offset()
+    entries, end = _read_pending(offset)
+    if not entries:
+        return 0
+
+    by_form: Dict[str, List[Dict]] = {}
+    dead = []
+    for entry, line in entries:
+        if entry is None:
+            dead.append({"error": "corrupt journal entry", "line": line.decode("utf-8", "replace")})
+            continue
+        row = _decode(entry["row"])
+        row[db.SUBMISSION_KEY_COLUMN] = entry["key"]
+        by_form.setdefault(entry["form"], []).append(row)
+
+    for form_name, rows in by_form.items():
+        table_name = form_name.replace(" ", "_").lower()
+        if not db.get_table_column_names(table_name):
+            dead.extend({"form": form_name, "error": f"Table {table_name} does not exist", "row": row}
+                        for row in rows)
+            continue
+        report = db.save_form_data_bulk(form_name, rows)
+        if report.get("error"):
+            raise RuntimeError(report["error"])
+        _stats["flushed"] += report["inserted"]
+        _stats["duplicates"] += report["duplicates"]
+        dead.extend({"form": form_name, "error": rejected["error"], "row": rejected["row"]}
+                    for rejected in report["rejected"])
+
+    if dead:
+        _dead_letter(dead)
+    # Entries up to `end` are in the database (or dead-lettered); a crash before
+    # this point only means they are replayed, which their keys make harmless.
+    _write_offset(end)
+    _stats["last_flush_at"] = time.time()
+    _compact(end)
+    return len(entries)
+
+
+def _compact(offset: int):
+    """Truncate the journal once everything in it has been flushed."""
+    if offset < COMPACT_BYTES:
+        return
+    with _lock:
+        if os.path.getsize(_path("journal.jsonl")) != offset:
+            return
+        # Reset the offset first: a crash before the truncate only replays
+        # flushed entries, which their submission keys make harmless.
+        _write_offset(0)
+        _journal.truncate(0)
+        _journal.flush()
+        os.fsync(_journal.fileno())
+
+
+def _flush_loop():
+    delay = FLUSH_INTERVAL
+    while True:
+        _wake.wait(delay)
+        _wake.clear()
+        try:
+            while flush_once():
+                pass
+            delay = FLUSH_INTERVAL
+            _stats["last_error"] = None
+        except Exception as e:
+            _stats["failed_flushes"] += 1
+            _stats["last_error"] = str(e)
+            delay = min(max(delay * 2, FLUSH_INTERVAL), RETRY_MAX_DELAY)
+            logger.error(f"Submission flush failed, retrying in {delay:.1f}s: {str(e)}")
+
+
+def get_buffer_stats() -> Dict:
+    """Counters and the number of bytes still waiting in the journal."""
+    stats = dict(_stats)
+    stats["owner"] = bool(_owner)
+    try:
+        stats["pending_bytes"] = os.path.getsize(_path("journal.jsonl")) - _read_offset()
+    except OSError:
+        stats["pending_bytes"] = 0
+    return stats
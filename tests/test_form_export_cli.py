@@ -0,0 +1,49 @@
+# tests/test_form_export_cli.py
+# --where arguments of the form_export command line are read by filter kind.
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("streamlit")
+
+import form_export  # noqa: E402
+
+SPECS = [
+    {"column": "age", "label": "Age", "type": "INTEGER", "kind": "range"},
+    {"column": "hobbies", "label": "Hobbies", "type": "MULTISELECT", "kind": "overlap"},
+    {"column": "gender", "label": "Gender", "type": "SELECT", "kind": "in"},
+]
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(form_export, "get_filter_specs", lambda form_name: SPECS)
+
+    def fake_export_file(form_name, path, filters=None, exclude_columns=None, progress=None):
+        calls["filters"] = filters
+        return {"rows": 0}
+
+    monkeypatch.setattr(form_export, "export_file", fake_export_file)
+    return calls
+
+
+def test_scalar_range_value_means_equality(exported):
+    assert form_export.main(["Students", "out.csv", "--where", "age=10"]) == 0
+    assert exported["filters"] == {"age": ("10", "10")}
+
+
+def test_range_bounds(exported):
+    form_export.main(["Students", "out.csv", "--where", "age=10..", "--where", "gender=Female"])
+    assert exported["filters"] == {"age": ("10", None), "gender": "Female"}
+
+
+def test_overlap_value_is_a_list(exported):
+    form_export.main(["Students", "out.csv", "--where", "hobbies=chess"])
+    assert exported["filters"] == {"hobbies": ["chess"]}
+    form_export.main(["Students", "out.csv", "--where", "hobbies=chess, music"])
+    assert exported["filters"] == {"hobbies": ["chess", "music"]}
+
+
+def test_malformed_condition_is_a_usage_error(exported):
+    with pytest.raises(SystemExit):
+        form_export.main(["Students", "out.csv", "--where", "age"])